@@ -0,0 +1,214 @@
+"""
+Агрегаты участника челленджа, хранящиеся в ChallengeParticipant:
+сумма значений, число выполненных дней, текущая и лучшая серии.
+
+Обновляются при каждой записи прогресса, поэтому лидерборды и списки читают
+готовые значения за O(участников). Запись дня меняет агрегаты на разницу между
+прежней и новой строкой (lock_day / apply_day) без чтения истории; историю целиком
+(refresh_participant) перечитывает только правка, после которой серию не вывести
+из прежних значений, — например, снятие отметки с выполненного дня.
+Полный пересчёт из сырых daily_progress:
+
+    python -m app.aggregates [--challenge-id ID]
+"""
+import argparse
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+_ONE_DAY = timedelta(days=1)
+
+
+def compute_streaks(completed_dates: list[date]) -> tuple[int, int, date | None]:
+    """
+    По отсортированным датам выполненных дней возвращает
+    (серия, заканчивающаяся на последнем выполненном дне; лучшая серия; последний выполненный день).
+    """
+    current = best = 0
+    prev: date | None = None
+    for d in completed_dates:
+        current = current + 1 if prev is not None and d - prev == timedelta(days=1) else 1
+        best = max(best, current)
+        prev = d
+    return current, best, prev
+
+
+def current_streak(streak_current: int | None, streak_last_date: date | None, today: date) -> int:
+    """
+    Серия «на сегодня» по ChallengeParticipant.streak_current / streak_last_date:
+    обнуляется, если и вчера, и сегодня цель не выполнена.
+    """
+    if streak_last_date is None or streak_last_date < today - _ONE_DAY:
+        return 0
+    return int(streak_current or 0)
+
+
+def refresh_participant(db: Session, challenge_id: int, user_id: int) -> None:
+    """
+    Пересчитывает агрегаты одного участника по его строкам daily_progress.
+    Работает и для правок прошлых дней (история шлёт set_value на любую дату).
+    Вызывать после flush изменённого DailyProgress, в той же транзакции.
+    """
+    dp = models.DailyProgress
+    completed_dates = list(
+        db.scalars(
+            select(dp.date)
+            .where(
+                dp.challenge_id == challenge_id,
+                dp.user_id == user_id,
+                dp.completed.is_(True),
+            )
+            .order_by(dp.date)
+        )
+    )
+    total_value = (
+        select(func.coalesce(func.sum(dp.value), 0))
+        .where(dp.challenge_id == challenge_id, dp.user_id == user_id)
+        .scalar_subquery()
+    )
+    streak_current, streak_best, streak_last_date = compute_streaks(completed_dates)
+    db.query(models.ChallengeParticipant).filter_by(
+        challenge_id=challenge_id, user_id=user_id
+    ).update(
+        {
+            models.ChallengeParticipant.total_value: total_value,
+            models.ChallengeParticipant.completed_days: len(completed_dates),
+            models.ChallengeParticipant.streak_current: streak_current,
+            models.ChallengeParticipant.streak_best: streak_best,
+            models.ChallengeParticipant.streak_last_date: streak_last_date,
+        },
+        synchronize_session=False,
+    )
+
+
+@dataclass
+class DayBefore:
+    """Состояние до записи дня: прежняя строка daily_progress и серии участника."""
+
+    value: int
+    completed: bool
+    streak_current: int
+    streak_best: int
+    streak_last_date: date | None
+
+
+def lock_day(db: Session, challenge_id: int, user_id: int, day: date) -> DayBefore:
+    """
+    Вызывать до записи дня, в той же транзакции. Пустой UPDATE строки участника
+    блокирует её до коммита (SQLite — блокировка записи, PostgreSQL — блокировка
+    строки), поэтому параллельная запись того же участника ждёт, и прочитанная
+    здесь прежняя строка дня не устареет до apply_day.
+    """
+    cp = models.ChallengeParticipant
+    dp = models.DailyProgress
+    streak_current, streak_best, streak_last_date = db.execute(
+        update(cp)
+        .where(cp.challenge_id == challenge_id, cp.user_id == user_id)
+        .values(total_value=cp.total_value)
+        .returning(cp.streak_current, cp.streak_best, cp.streak_last_date)
+        .execution_options(synchronize_session=False)
+    ).one()
+    # Отдельным запросом уже под блокировкой: в PostgreSQL он берёт свежий снимок
+    row = db.execute(
+        select(dp.value, dp.completed).where(
+            dp.challenge_id == challenge_id, dp.user_id == user_id, dp.date == day
+        )
+    ).first()
+    value, completed = row if row else (0, False)
+    return DayBefore(
+        value=value or 0,
+        completed=bool(completed),
+        streak_current=streak_current or 0,
+        streak_best=streak_best or 0,
+        streak_last_date=streak_last_date,
+    )
+
+
+def apply_day(
+    db: Session,
+    challenge_id: int,
+    user_id: int,
+    day: date,
+    before: DayBefore,
+    value: int,
+    completed: bool,
+) -> None:
+    """
+    Переносит в агрегаты участника запись дня: before — из lock_day, (value, completed) —
+    строка после записи. Сумма и число выполненных дней меняются на разницу; серия —
+    только когда выполнен день после последнего выполненного (обычная отметка
+    сегодняшнего дня). Иначе, если выполненность дня изменилась, серии пересчитываются
+    по истории участника (refresh_participant).
+    """
+    cp = models.ChallengeParticipant
+    values: dict = {}
+    if completed != before.completed:
+        last = before.streak_last_date
+        if not completed or (last is not None and day <= last):
+            # Снята отметка или выполнен день внутри истории: границы серий не вывести
+            refresh_participant(db, challenge_id, user_id)
+            return
+        if last == day - _ONE_DAY:
+            if not before.streak_current:
+                # Серию обнулил rollover, а день перед ней дописан задним числом
+                refresh_participant(db, challenge_id, user_id)
+                return
+            streak = before.streak_current + 1
+        else:
+            streak = 1
+        values = {
+            cp.completed_days: cp.completed_days + 1,
+            cp.streak_current: streak,
+            cp.streak_best: max(before.streak_best, streak),
+            cp.streak_last_date: day,
+        }
+    if value != before.value:
+        values[cp.total_value] = cp.total_value + (value - before.value)
+    if values:
+        db.execute(
+            update(cp)
+            .where(cp.challenge_id == challenge_id, cp.user_id == user_id)
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def recompute_all(db: Session, challenge_id: int | None = None) -> int:
+    """Пересобирает агрегаты всех участников (или одного челленджа). Возвращает число участников."""
+    q = db.query(
+        models.ChallengeParticipant.challenge_id,
+        models.ChallengeParticipant.user_id,
+    )
+    if challenge_id is not None:
+        q = q.filter(models.ChallengeParticipant.challenge_id == challenge_id)
+    pairs = q.all()
+    for ch_id, user_id in pairs:
+        refresh_participant(db, ch_id, user_id)
+    return len(pairs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Пересчёт агрегатов участников из daily_progress"
+    )
+    parser.add_argument("--challenge-id", type=int, default=None)
+    args = parser.parse_args()
+
+    from .db import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    try:
+        count = recompute_all(db, args.challenge_id)
+        db.commit()
+    finally:
+        db.close()
+    print(f"Recomputed aggregates for {count} participants")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Приём обновлений бота: webhook отвечает Telegram сразу, применяет их фоновый воркер.
+
+telegram_webhook кладёт обновление в очередь процесса (UpdateQueue) и возвращает 200,
+не дожидаясь БД. Воркер забирает всё, что накопилось (до WEBHOOK_BATCH_SIZE), и
+применяет пачку одной транзакцией:
+
+  - дедупликация по update_id: повтор от Telegram (таймаут ответа, всплеск после
+    простоя) уже записан в processed_updates и отбрасывается — в том числе если
+    первый раз его принял другой воркер;
+  - обновления одного пользователя схлопываются в одно (последнее по update_id);
+  - пользователи читаются одним запросом, новые вставляются, изменившиеся
+    обновляются пачкой, а те, у кого ничего не поменялось, не пишутся вовсе.
+
+Очередь ограничена WEBHOOK_QUEUE_SIZE: когда она полна, webhook ждёт места (Telegram
+ждёт ответа), и память не растёт. При остановке приложения очередь дописывается.
+Пока воркер не запущен (скрипты и бенчмарки без lifespan), обновление применяется сразу.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .db import SessionLocal
+from .progress import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "500"))
+# Сколько помнить update_id: недоставленное Telegram хранит и повторяет не дольше суток
+WEBHOOK_DEDUP_HOURS = float(os.getenv("WEBHOOK_DEDUP_HOURS", "24"))
+# Сколько при остановке ждать, пока воркер допишет очередь
+WEBHOOK_DRAIN_SECONDS = float(os.getenv("WEBHOOK_DRAIN_SECONDS", "10"))
+
+_PRUNE_INTERVAL_SECONDS = 3600.0
+
+
+def _sender(update: dict[str, Any]) -> dict[str, Any] | None:
+    """Автор сообщения в обновлении: поля для строки users (None — обновление не о сообщении)."""
+    message = update.get("message") or update.get("edited_message")
+    if not message:
+        return None
+
+    from_user = message.get("from") or {}
+    tg_id = from_user.get("id")
+    if not tg_id:
+        return None
+
+    username = from_user.get("username")
+    first_name = from_user.get("first_name") or ""
+    last_name = from_user.get("last_name") or ""
+    display_name = (first_name + " " + last_name).strip() or username or f"User {tg_id}"
+    return {
+        "telegram_id": tg_id,
+        "username": username[:64] if username else None,
+        "display_name": display_name[:128],
+    }
+
+
+def _fresh_updates(db: Session, updates: list[dict[str, Any]]) -> tuple[list[dict[str, Any]], int]:
+    """Отбрасывает уже применённые update_id (и повторы внутри пачки); возвращает (новые по порядку, число повторов)."""
+    by_id: dict[int, dict[str, Any]] = {}
+    without_id = []
+    for item in updates:
+        update_id = item.get("update_id")
+        if isinstance(update_id, int):
+            by_id.setdefault(update_id, item)
+        else:
+            without_id.append(item)
+    if not by_id:
+        return without_id, len(updates) - len(without_id)
+
+    pu = models.ProcessedUpdate.__table__
+    now = datetime.utcnow()
+    # Вставились только новые: повторы отсекает первичный ключ, и в соседних воркерах тоже.
+    # executemany (а не один VALUES на пачку) — скомпилированный запрос берётся из кэша
+    fresh = db.execute(
+        dialect_insert(db)(pu)
+        .on_conflict_do_nothing(index_elements=[pu.c.update_id])
+        .returning(pu.c.update_id),
+        [{"update_id": update_id, "received_at": now} for update_id in by_id],
+    ).scalars().all()
+    ordered = [by_id[update_id] for update_id in sorted(fresh)] + without_id
+    return ordered, len(updates) - len(ordered)
+
+
+def apply_updates(db: Session, updates: list[dict[str, Any]]) -> dict[str, int]:
+    """
+    Применяет пачку обновлений одной транзакцией: активный чат с ботом (bot_chat_active)
+    и username автора. Возвращает счётчики для статистики очереди.
+    """
+    from .deps import invalidate_user
+
+    fresh, duplicates = _fresh_updates(db, updates)
+
+    senders: dict[int, dict[str, Any]] = {}
+    for item in fresh:
+        sender = _sender(item)
+        if sender is None:
+            continue
+        previous = senders.get(sender["telegram_id"])
+        # Более позднее сообщение без username не стирает известный
+        if previous and not sender["username"]:
+            sender["username"] = previous["username"]
+        senders[sender["telegram_id"]] = sender
+
+    user = models.User
+    existing: dict[int, tuple[int, str | None, bool]] = {}
+    if senders:
+        for telegram_id, user_id, username, active in db.execute(
+            select(user.telegram_id, user.id, user.username, user.bot_chat_active)
+            .where(user.telegram_id.in_(list(senders)))
+        ):
+            existing[telegram_id] = (user_id, username, active)
+
+    created = [
+        {**sender, "bot_chat_active": True}
+        for telegram_id, sender in senders.items()
+        if telegram_id not in existing
+    ]
+    if created:
+        # Пользователь мог появиться параллельно (вход в Mini App) — тогда только активируем чат
+        db.execute(
+            dialect_insert(db)(user).on_conflict_do_update(
+                index_elements=[user.telegram_id], set_={"bot_chat_active": True}
+            ),
+            created,
+        )
+
+    changed = []
+    for telegram_id, (user_id, username, active) in existing.items():
+        new_username = senders[telegram_id]["username"] or username
+        if not active or new_username != username:
+            changed.append({"id": user_id, "bot_chat_active": True, "username": new_username})
+    if changed:
+        db.execute(update(user), changed)
+
+    db.commit()
+    for row in changed:
+        invalidate_user(row["id"])
+
+    return {
+        "applied": len(fresh),
+        "duplicates": duplicates,
+        "users_created": len(created),
+        "users_updated": len(changed),
+    }
+
+
+def apply_once(updates: list[dict[str, Any]]) -> dict[str, int]:
+    db = SessionLocal()
+    try:
+        return apply_updates(db, updates)
+    finally:
+        db.close()
+
+
+def _apply_batch(updates: list[dict[str, Any]]) -> Counter:
+    try:
+        return Counter(apply_once(updates), batches=1)
+    except Exception:
+        if len(updates) > 1:
+            logger.exception("Bot updates batch of %s failed, applying one by one", len(updates))
+        else:
+            logger.exception("Bot update %s not applied", updates[0].get("update_id"))
+            return Counter(batches=1, failed=1)
+
+    # Одно плохое обновление не должно терять всю пачку
+    totals = Counter(batches=1)
+    for item in updates:
+        try:
+            totals.update(apply_once([item]))
+        except Exception:
+            logger.exception("Bot update %s not applied", item.get("update_id"))
+            totals["failed"] += 1
+    return totals
+
+
+def prune_processed(now: datetime | None = None) -> int:
+    """Забыть update_id старше WEBHOOK_DEDUP_HOURS: Telegram их уже не повторит."""
+    pu = models.ProcessedUpdate
+    cutoff = (now or datetime.utcnow()) - timedelta(hours=WEBHOOK_DEDUP_HOURS)
+    db = SessionLocal()
+    try:
+        deleted = db.execute(delete(pu).where(pu.received_at < cutoff)).rowcount
+        db.commit()
+    finally:
+        db.close()
+    return deleted
+
+
+class UpdateQueue:
+    """Очередь обновлений бота и её воркер. Один экземпляр на процесс, см. main.lifespan."""
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        # received, applied, duplicates, users_created, users_updated, batches, failed (для /metrics)
+        self.counters: Counter = Counter()
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+        self._task = asyncio.create_task(self._run(), name="bot-updates")
+
+    async def stop(self) -> None:
+        if self._task:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=WEBHOOK_DRAIN_SECONDS)
+            except asyncio.TimeoutError:
+                logger.warning("Bot updates: %s left unapplied on shutdown", self._queue.qsize())
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, update: dict[str, Any]) -> None:
+        self.counters["received"] += 1
+        if self._task is None:
+            self.counters.update(await asyncio.to_thread(_apply_batch, [update]))
+            return
+        await self._queue.put(update)
+
+    def stats(self) -> dict[str, int]:
+        names = ("received", "applied", "duplicates", "users_created", "users_updated", "batches", "failed")
+        return {
+            **{name: self.counters[name] for name in names},
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+    async def _run(self) -> None:
+        last_prune = 0.0
+        while True:
+            # Всё, что накопилось, пока применялась предыдущая пачка, — следующая пачка
+            batch = [await self._queue.get()]
+            while len(batch) < WEBHOOK_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                self.counters.update(await asyncio.to_thread(_apply_batch, batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if time.monotonic() - last_prune >= _PRUNE_INTERVAL_SECONDS:
+                last_prune = time.monotonic()
+                try:
+                    await asyncio.to_thread(prune_processed)
+                except Exception:
+                    logger.exception("Bot updates prune failed")
+
+
+queue = UpdateQueue()
@@ -0,0 +1,170 @@
+"""Простые in-process кэши. Потокобезопасны: sync-хэндлеры FastAPI работают в threadpool."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """LRU-кэш с ограничением по числу записей и временем жизни каждой записи."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        """ttl — своё время жизни записи (не больше общего ttl кэша)."""
+        lifetime = self.ttl if ttl is None else min(ttl, self.ttl)
+        if lifetime <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + lifetime, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ResponseCache(Generic[K, V]):
+    """
+    LRU-кэш готовых ответов с лимитом по суммарному размеру и инвалидацией по тегам.
+
+    Запись помечается тегами (например, ("challenge", 5)); invalidate(tag) удаляет все
+    записи с этим тегом. Чтобы ответ, посчитанный до коммита записи, не попал в кэш
+    после её инвалидации, вычисление начинается с token(), а set() отбрасывает значение,
+    если какой-то из его тегов инвалидирован после взятия токена.
+    """
+
+    # Сколько последних инвалидаций тегов помнить для проверки токенов
+    TAG_HISTORY = 10000
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[K, tuple[V, int, tuple[Hashable, ...]]] = OrderedDict()
+        self._by_tag: dict[Hashable, set[K]] = {}
+        self._bytes = 0
+        self._generation = 0
+        self._tag_generation: dict[Hashable, int] = {}
+        # Токены старше этого поколения отклоняются целиком (после clear и обрезки истории)
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejected = 0
+
+    def token(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: K, value: V, size: int, tags: tuple[Hashable, ...], token: int) -> bool:
+        """Сохраняет значение размером size байт. False — не сохранено (устарело или не влезает)."""
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if token < self._floor or any(
+                self._tag_generation.get(tag, -1) > token for tag in tags
+            ):
+                self.rejected += 1
+                return False
+            self._remove(key)
+            self._data[key] = (value, size, tags)
+            self._bytes += size
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, tag: Hashable) -> int:
+        """Удаляет записи с тегом. Возвращает число удалённых."""
+        with self._lock:
+            self._generation += 1
+            self._tag_generation[tag] = self._generation
+            if len(self._tag_generation) > self.TAG_HISTORY:
+                self._tag_generation.clear()
+                self._floor = self._generation
+            keys = self._by_tag.pop(tag, set())
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._floor = self._generation
+            self._tag_generation.clear()
+            self._data.clear()
+            self._by_tag.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "rejected": self.rejected,
+            }
+
+    def _remove(self, key: K) -> None:
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        _, size, tags = item
+        self._bytes -= size
+        for tag in tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def __len__(self) -> int:
+        return len(self._data)
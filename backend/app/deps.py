@@ -1,17 +1,38 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator
+import logging
+import time
 
 from fastapi import Depends, HTTPException, Header, status
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 
 import os
 
-from .db import SessionLocal
+from . import shared
+from .cache import TTLCache
+from .db import DbRunner, new_db_runner
 from .models import User
 
 SECRET_KEY = os.getenv("SECRET_KEY", "change-me-in-env")
 ALGORITHM = "HS256"
 
+logger = logging.getLogger(__name__)
+
+# Кэши аутентификации: токен -> user_id (проверенная подпись) и user_id -> снимок колонок User.
+# Снимок пользователя инвалидируется через invalidate_user() при любом его изменении.
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAXSIZE = int(os.getenv("AUTH_CACHE_MAXSIZE", "10000"))
+
+_token_cache: TTLCache[tuple[str, bool], int | str] = TTLCache(
+    AUTH_CACHE_MAXSIZE, AUTH_CACHE_TTL_SECONDS
+)
+_user_cache: TTLCache[int | str, dict] = TTLCache(
+    AUTH_CACHE_MAXSIZE, AUTH_CACHE_TTL_SECONDS
+)
+
+# Срок жизни билета на поток событий (SSE): его хватает только на подключение и переподключение
+EVENTS_TICKET_TTL_SECONDS = float(os.getenv("EVENTS_TICKET_TTL_SECONDS", "60"))
+
 
 def is_superadmin(user: User) -> bool:
     """Суперадмин по SUPERADMIN_TELEGRAM_ID в .env (строка — Telegram ID пользователя)."""
@@ -24,85 +45,83 @@ def is_superadmin(user: User) -> bool:
         return False
 
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
+async def get_db() -> AsyncGenerator[DbRunner, None]:
+    """Раннер запросов к БД на время запроса; threadpool или AsyncSession — по DB_MODE."""
+    db = new_db_runner()
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
 
 
-def get_current_user(
-    authorization: str | None = Header(None, alias="Authorization"),
-    db: Session = Depends(get_db),
-) -> User:
-    """
-    Получение текущего пользователя из JWT токена.
-    В dev-режиме (SKIP_INIT_DATA_VALIDATION=true или нет TELEGRAM_BOT_TOKEN)
-    пропускаем проверку подписи и используем fallback при ошибках.
-    """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-    )
+def invalidate_user(user_id: int) -> None:
+    """Сбросить закэшированный снимок пользователя (после PATCH /me, webhook бота и т.п.)."""
+    _user_cache.pop(user_id)
+    # И в остальных воркерах
+    shared.state.broadcast("user", str(user_id))
 
-    # Определяем dev-режим
-    is_dev_mode = (
-        not os.getenv("TELEGRAM_BOT_TOKEN") or 
-        os.getenv("SKIP_INIT_DATA_VALIDATION", "").lower() == "true"
-    )
 
-    # Если нет токена
-    if authorization is None or not authorization.startswith("Bearer "):
-        if is_dev_mode:
-            # В dev-режиме используем первого пользователя или создаем нового
-            user = db.query(User).first()
-            if not user:
-                user = User(
-                    telegram_id=0,
-                    username="dev",
-                    display_name="Dev User",
-                )
-                db.add(user)
-                db.commit()
-                db.refresh(user)
-            return user
-        raise credentials_exception
+def _on_user_invalidated(payload: str) -> None:
+    _user_cache.pop(int(payload))
 
-    token = authorization.removeprefix("Bearer ").strip()
-    
-    if not token:
-        print("ERROR: Token is empty")
-        if is_dev_mode:
-            user = db.query(User).first()
-            if not user:
-                user = User(telegram_id=0, username="dev", display_name="Dev User")
-                db.add(user)
-                db.commit()
-                db.refresh(user)
-            return user
-        raise credentials_exception
 
-    # Пробуем декодировать JWT
-    user_id: int | None = None
-    
+shared.state.subscribe("user", _on_user_invalidated)
+shared.state.on_resync(_user_cache.clear)
+
+
+def _snapshot(user: User) -> dict:
+    return {attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs}
+
+
+def _user_from_cache(db: Session, user_id: int | str) -> User | None:
+    """Пользователь из снимка, привязанный к сессии без SELECT (merge с load=False)."""
+    snapshot = _user_cache.get(user_id)
+    if snapshot is None:
+        return None
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def _dev_fallback_user(db: Session) -> User:
+    # В dev-режиме используем первого пользователя или создаем нового
+    user = db.query(User).first()
+    if not user:
+        user = User(telegram_id=0, username="dev", display_name="Dev User")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    return user
+
+
+def _decode_user_id(token: str, is_dev_mode: bool) -> int | str | None:
+    """
+    user_id из JWT. Результат успешной проверки кэшируется по строке токена
+    (не дольше exp), чтобы повторные запросы не проверяли HMAC заново.
+    """
+    cached = _token_cache.get((token, is_dev_mode))
+    if cached is not None:
+        return cached
+
+    user_id = None
+    ttl: float | None = None
+
     if is_dev_mode:
         # В dev-режиме всегда декодируем без проверки подписи и exp
         try:
             payload = jwt.decode(
-                token, 
-                SECRET_KEY, 
-                algorithms=[ALGORITHM], 
+                token,
+                SECRET_KEY,
+                algorithms=[ALGORITHM],
                 options={
                     "verify_signature": False,
                     "verify_exp": False  # Не проверяем expiration в dev-режиме
                 }
             )
             user_id = payload.get("sub")
-            print(f"Dev mode: JWT decoded successfully, user_id={user_id}")
+            logger.debug("Dev mode: JWT decoded successfully, user_id=%s", user_id)
         except Exception as e:
-            print(f"ERROR: Dev mode: Failed to decode JWT: {type(e).__name__}: {e}")
-            print(f"Token length: {len(token)}, token preview: {token[:50]}...")
+            logger.warning("Dev mode: Failed to decode JWT: %s: %s", type(e).__name__, e)
             # В dev-режиме пробуем извлечь user_id из токена напрямую (base64)
             try:
                 import base64
@@ -117,51 +136,95 @@ def get_current_user(
                     payload_bytes = base64.urlsafe_b64decode(payload_b64)
                     payload_dict = json.loads(payload_bytes)
                     user_id = payload_dict.get("sub")
-                    print(f"Dev mode: Extracted user_id from base64: {user_id}")
+                    logger.debug("Dev mode: Extracted user_id from base64: %s", user_id)
             except Exception as e2:
-                print(f"ERROR: Dev mode: Failed to extract from base64: {e2}")
-            
-            # Если все равно не получилось - используем первого пользователя в dev-режиме
-            if user_id is None:
-                print("WARNING: Dev mode: Using fallback - first user")
-                user = db.query(User).first()
-                if not user:
-                    user = User(telegram_id=0, username="dev", display_name="Dev User")
-                    db.add(user)
-                    db.commit()
-                    db.refresh(user)
-                return user
+                logger.warning("Dev mode: Failed to extract from base64: %s", e2)
     else:
         # В проде - строгая валидация
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            user_id = payload.get("sub")
         except JWTError as e:
-            print(f"ERROR: Production mode: JWT decode failed: {e}")
-            raise credentials_exception
+            logger.warning("Production mode: JWT decode failed: %s", e)
+            return None
+        if payload.get("scope"):
+            # Билет потока событий (или другой узкий токен) — не сессионный JWT
+            logger.warning("Production mode: scoped token used as bearer: %s", payload.get("scope"))
+            return None
+        user_id = payload.get("sub")
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            ttl = exp - time.time()
+
+    if user_id is None:
+        return None
+    # sub может прийти строкой — ключи кэша и identity map держим целыми
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        pass
+    _token_cache.set((token, is_dev_mode), user_id, ttl=ttl)
+    return user_id
+
+
+async def get_current_user(
+    authorization: str | None = Header(None, alias="Authorization"),
+    db: DbRunner = Depends(get_db),
+) -> User:
+    """
+    Получение текущего пользователя из JWT токена.
+    В dev-режиме (SKIP_INIT_DATA_VALIDATION=true или нет TELEGRAM_BOT_TOKEN)
+    пропускаем проверку подписи и используем fallback при ошибках.
+    """
+    return await db.run(_resolve_current_user, authorization)
+
+
+def _resolve_current_user(authorization: str | None, db: Session) -> User:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+    )
+
+    # Определяем dev-режим
+    is_dev_mode = (
+        not os.getenv("TELEGRAM_BOT_TOKEN") or 
+        os.getenv("SKIP_INIT_DATA_VALIDATION", "").lower() == "true"
+    )
+
+    # Если нет токена
+    if authorization is None or not authorization.startswith("Bearer "):
+        if is_dev_mode:
+            return _dev_fallback_user(db)
+        raise credentials_exception
+
+    token = authorization.removeprefix("Bearer ").strip()
+    
+    if not token:
+        logger.warning("Token is empty")
+        if is_dev_mode:
+            return _dev_fallback_user(db)
+        raise credentials_exception
+
+    user_id = _decode_user_id(token, is_dev_mode)
 
     if user_id is None:
-        print(f"ERROR: user_id is None after decoding token")
+        logger.warning("user_id is None after decoding token")
         if is_dev_mode:
             # Fallback в dev-режиме
-            user = db.query(User).first()
-            if not user:
-                user = User(telegram_id=0, username="dev", display_name="Dev User")
-                db.add(user)
-                db.commit()
-                db.refresh(user)
-            return user
+            logger.warning("Dev mode: Using fallback - first user")
+            return _dev_fallback_user(db)
         raise credentials_exception
 
+    user = _user_from_cache(db, user_id)
+    if user is not None:
+        return user
+
     # Используем пользователя из токена
     user = db.get(User, user_id)
     if user is None:
-        print(f"ERROR: User with id={user_id} from token not found in database")
-        all_users = db.query(User).all()
-        print(f"Available users: {[u.id for u in all_users]}")
+        logger.warning("User with id=%s from token not found in database", user_id)
         if is_dev_mode:
             # В dev-режиме создаем пользователя с таким ID
-            print(f"Dev mode: Creating user with id={user_id}")
+            logger.info("Dev mode: Creating user with id=%s", user_id)
             user = User(
                 telegram_id=user_id,  # Используем user_id как telegram_id
                 username=f"user_{user_id}",
@@ -173,6 +236,42 @@ def get_current_user(
             return user
         raise credentials_exception
 
-    print(f"✓ Using user: id={user.id}, telegram_id={user.telegram_id}, display_name={user.display_name}")
+    _user_cache.set(user_id, _snapshot(user))
+    logger.debug(
+        "Using user: id=%s, telegram_id=%s, display_name=%s",
+        user.id, user.telegram_id, user.display_name,
+    )
     return user
 
+
+def create_events_ticket(user_id: int, challenge_id: int) -> str:
+    """
+    Билет на поток GET /challenges/{id}/events. EventSource не умеет слать заголовки,
+    поэтому учётные данные идут в URL (и в логи прокси) — туда кладём не сессионный JWT,
+    а короткоживущий билет на один челлендж.
+    """
+    payload = {
+        "sub": str(user_id),
+        "cid": challenge_id,
+        "scope": "events",
+        "exp": int(time.time() + EVENTS_TICKET_TTL_SECONDS),
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def events_ticket_user_id(ticket: str, challenge_id: int) -> int:
+    """user_id из билета потока событий; 401, если билет подделан, истёк или выдан на другой челлендж."""
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired events ticket",
+    )
+    try:
+        payload = jwt.decode(ticket, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise invalid
+    if payload.get("scope") != "events" or payload.get("cid") != challenge_id:
+        raise invalid
+    try:
+        return int(payload["sub"])
+    except (KeyError, TypeError, ValueError):
+        raise invalid
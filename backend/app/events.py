@@ -0,0 +1,239 @@
+"""
+In-process pub/sub событий челленджа для потока GET /challenges/{id}/events (SSE).
+
+Пишущие хэндлеры (sync, работают в threadpool) вызывают publish() после коммита;
+доставка в очереди подписчиков идёт в event loop через call_soon_threadsafe.
+Подписчик — это asyncio.Queue на одно SSE-соединение: простаивающее соединение
+не держит ни поток, ни соединение с БД, поэтому тысячи клиентов на одном воркере — норма.
+При нескольких воркерах события пересылаются остальным через shared.state, так что
+клиент получает события независимо от того, какой воркер обработал запись.
+
+Пересылается только то, что кому-то нужно: каждый воркер объявляет в журнале
+(канал event_watch), на какие челленджи у него есть подписчики, — при появлении
+первого и уходе последнего, а целиком раз в EVENTS_WATCH_REFRESH_SECONDS. Пока
+объявления соседей не собраны (после старта и после пропуска части журнала), воркер
+пересылает все события. Новая подписка становится видна соседям через один-два
+интервала опроса журнала; событие из этого окна клиент не получит, но любое
+следующее всё равно заставит его перечитать челлендж.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any
+
+from . import shared
+
+logger = logging.getLogger(__name__)
+
+# Сколько событий может накопиться у медленного клиента; дальше старые выбрасываются
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+# Интервал комментария-пинга, чтобы прокси не закрывали простаивающее соединение
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "25"))
+# Как часто воркер повторяет полный список челленджей со своими подписчиками.
+# Список воркера, не повторявшего его три интервала, считается устаревшим (воркер остановлен)
+EVENTS_WATCH_REFRESH_SECONDS = float(os.getenv("EVENTS_WATCH_REFRESH_SECONDS", "30"))
+
+
+def _json_default(value: Any) -> str:
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class EventBus:
+    def __init__(self, state: shared.SharedState) -> None:
+        self._state = state
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # challenge_id -> {очередь SSE-соединения: user_id подписчика}
+        self._subscribers: dict[int, dict[asyncio.Queue, int]] = defaultdict(dict)
+        # Подписки других воркеров: origin -> (когда объявлены, челленджи)
+        self._remote: dict[str, tuple[float, set[int]]] = {}
+        # Объединение _remote; publish() читает его из threadpool, поэтому заменяется целиком
+        self._remote_watched: frozenset[int] = frozenset()
+        # До этого момента (time.monotonic) события пересылаются всем
+        self._warm_until = 0.0
+        self._task: asyncio.Task | None = None
+        state.subscribe("event", self._on_shared_event)
+        state.subscribe("event_watch", self._on_watch)
+        state.on_resync(self._on_resync)
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def start(self) -> None:
+        """Запустить обмен списками подписок; вызывать после shared.state.start()."""
+        if not self._state.enabled:
+            return
+        self._on_resync()
+        self._task = asyncio.create_task(self._run(), name="events-watch")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def subscribe(self, challenge_id: int, user_id: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        if challenge_id not in self._subscribers:
+            self._announce({"add": challenge_id})
+        self._subscribers[challenge_id][queue] = user_id
+        return queue
+
+    def unsubscribe(self, challenge_id: int, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(challenge_id)
+        if subscribers is None:
+            return
+        subscribers.pop(queue, None)
+        if not subscribers:
+            del self._subscribers[challenge_id]
+            self._announce({"remove": challenge_id})
+
+    def subscriber_count(self, challenge_id: int | None = None) -> int:
+        if challenge_id is not None:
+            return len(self._subscribers.get(challenge_id, ()))
+        return sum(len(s) for s in self._subscribers.values())
+
+    def publish(
+        self,
+        challenge_id: int,
+        event_type: str,
+        data: dict[str, Any],
+        close_user_id: int | None = None,
+        close_all: bool = False,
+    ) -> None:
+        """
+        Опубликовать событие. Безопасно из любого потока; без подписчиков — почти бесплатно.
+        close_user_id / close_all — подписчик потерял доступ к челленджу (удалён из участников,
+        челлендж удалён): событие ему доставляется, после чего поток закрывается.
+        """
+        if self._loop is None:
+            return
+        local = challenge_id in self._subscribers
+        remote = self._state.enabled and (
+            challenge_id in self._remote_watched or time.monotonic() < self._warm_until
+        )
+        if not local and not remote:
+            return
+        message = (
+            f"event: {event_type}\n"
+            f"data: {json.dumps(data, ensure_ascii=False, default=_json_default)}\n\n"
+        )
+        if remote:
+            self._state.broadcast(
+                "event",
+                json.dumps(
+                    {
+                        "challenge_id": challenge_id,
+                        "message": message,
+                        "close_user_id": close_user_id,
+                        "close_all": close_all,
+                    }
+                ),
+            )
+        if not local:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, challenge_id, message, close_user_id, close_all)
+        except RuntimeError:
+            # loop уже закрыт (остановка приложения)
+            pass
+
+    def _on_shared_event(self, payload: str) -> None:
+        # Событие, опубликованное другим воркером; вызывается в нашем event loop
+        event = json.loads(payload)
+        self._dispatch(
+            event["challenge_id"],
+            event["message"],
+            event.get("close_user_id"),
+            event.get("close_all", False),
+        )
+
+    def _dispatch(
+        self,
+        challenge_id: int,
+        message: str,
+        close_user_id: int | None = None,
+        close_all: bool = False,
+    ) -> None:
+        for queue, user_id in list(self._subscribers.get(challenge_id, {}).items()):
+            _put(queue, message)
+            if close_all or user_id == close_user_id:
+                # None — сигнал stream() завершить ответ; новых событий очередь уже не получит
+                _put(queue, None)
+                self.unsubscribe(challenge_id, queue)
+
+    def _announce(self, change: dict[str, Any]) -> None:
+        if self._state.enabled:
+            self._state.broadcast("event_watch", json.dumps({"origin": self._state.origin, **change}))
+
+    def _on_watch(self, payload: str) -> None:
+        # Подписки другого воркера: полный список (challenges) или изменение (add / remove)
+        watch = json.loads(payload)
+        _, challenges = self._remote.get(watch["origin"], (0.0, set()))
+        if "challenges" in watch:
+            challenges = set(watch["challenges"])
+        elif "add" in watch:
+            challenges.add(watch["add"])
+        else:
+            challenges.discard(watch["remove"])
+        self._remote[watch["origin"]] = (time.monotonic(), challenges)
+        self._expire_remote()
+
+    def _expire_remote(self) -> None:
+        stale = time.monotonic() - 3 * EVENTS_WATCH_REFRESH_SECONDS
+        self._remote = {
+            origin: (seen, challenges)
+            for origin, (seen, challenges) in self._remote.items()
+            if seen >= stale and challenges
+        }
+        self._remote_watched = frozenset().union(*(challenges for _, challenges in self._remote.values()))
+
+    def _on_resync(self) -> None:
+        # Списки соседей неполны (старт или пропуск журнала): пересылаем всё до их следующего повтора
+        self._warm_until = time.monotonic() + EVENTS_WATCH_REFRESH_SECONDS + 2 * shared.SHARED_POLL_SECONDS
+
+    async def _run(self) -> None:
+        while True:
+            if self._subscribers:
+                self._announce({"challenges": list(self._subscribers)})
+            self._expire_remote()
+            await asyncio.sleep(EVENTS_WATCH_REFRESH_SECONDS)
+
+    async def stream(self, challenge_id: int, user_id: int):
+        """
+        Генератор тела SSE-ответа для одного подписчика. Подписка создаётся при первом
+        чтении тела и снимается в finally — клиент, отключившийся до начала ответа,
+        очередь не оставляет.
+        """
+        queue = self.subscribe(challenge_id, user_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(challenge_id, queue)
+
+
+def _put(queue: asyncio.Queue, message: str | None) -> None:
+    if queue.full():
+        # Медленный клиент: выбрасываем самое старое событие, он всё равно перезапросит данные
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+bus = EventBus(shared.state)
@@ -0,0 +1,203 @@
+"""
+Потоковая выгрузка данных в CSV или NDJSON.
+
+Строки читаются курсором порциями по EXPORT_BATCH_ROWS (yield_per: у PostgreSQL —
+серверный курсор, у SQLite — fetchmany) и сразу кодируются в куски по
+EXPORT_CHUNK_BYTES, так что память не растёт с размером выгрузки.
+
+Запись — пара (тип, словарь полей) из FIELDS. В NDJSON каждая запись — строка
+{"record": тип, ...поля}; в CSV колонки — record и объединение полей всех типов,
+неподходящие типу колонки пустые.
+
+Выгрузка всей базы (database_records) инкрементальная: строки с отметкой времени
+(updated_at, у неизменяемых строк — created_at/joined_at) в (since, until]. until
+берётся на EXPORT_WATERMARK_LAG раньше текущего момента — строкам из ещё не
+закоммиченных транзакций хватает времени попасть в базу — и возвращается клиенту
+как since для следующего запуска. Удаления в инкремент не попадают. Строки без
+отметки времени попадают только в полную выгрузку (без since).
+"""
+import csv
+import io
+import os
+from collections.abc import Iterator
+from datetime import date, datetime, timedelta
+from typing import Any
+
+import orjson
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_WATERMARK_LAG = timedelta(seconds=int(os.getenv("EXPORT_WATERMARK_LAG_SECONDS", "5")))
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+# Поля каждого типа записи в порядке вывода
+FIELDS: dict[str, tuple[str, ...]] = {
+    "user": ("id", "username", "display_name", "updated_at"),
+    "challenge": (
+        "id", "title", "goal_type", "daily_goal", "unit",
+        "start_date", "end_date", "is_public", "creator_id", "updated_at",
+    ),
+    "participant": ("challenge_id", "user_id", "display_name", "role", "joined_at"),
+    "progress": ("challenge_id", "user_id", "date", "value", "completed", "updated_at"),
+    "nudge": ("challenge_id", "from_user_id", "to_user_id", "created_at"),
+    "message": ("id", "challenge_id", "user_id", "text", "created_at"),
+}
+
+Record = tuple[str, dict[str, Any]]
+
+
+def _rows(db: Session, record: str, stmt) -> Iterator[Record]:
+    keys = FIELDS[record]
+    result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_ROWS))
+    for row in result:
+        yield record, dict(zip(keys, row))
+
+
+def challenge_records(db: Session, challenge_id: int) -> Iterator[Record]:
+    """Участники, прогресс по дням, тычки и сообщения одного челленджа."""
+    cp = models.ChallengeParticipant
+    dp = models.DailyProgress
+    nudge = models.Nudge
+    msg = models.ChallengeMessage
+    yield from _rows(
+        db,
+        "participant",
+        select(cp.challenge_id, cp.user_id, models.User.display_name, cp.role, cp.joined_at)
+        .join(models.User, models.User.id == cp.user_id)
+        .where(cp.challenge_id == challenge_id)
+        .order_by(cp.user_id),
+    )
+    yield from _rows(
+        db,
+        "progress",
+        select(dp.challenge_id, dp.user_id, dp.date, dp.value, dp.completed, dp.updated_at)
+        .where(dp.challenge_id == challenge_id)
+        .order_by(dp.user_id, dp.date),
+    )
+    yield from _rows(
+        db,
+        "nudge",
+        select(nudge.challenge_id, nudge.from_user_id, nudge.to_user_id, nudge.created_at)
+        .where(nudge.challenge_id == challenge_id)
+        .order_by(nudge.id),
+    )
+    yield from _rows(
+        db,
+        "message",
+        select(msg.id, msg.challenge_id, msg.user_id, msg.text, msg.created_at)
+        .where(msg.challenge_id == challenge_id)
+        .order_by(msg.id),
+    )
+
+
+def watermark(now: datetime | None = None) -> datetime:
+    """Верхняя граница инкремента (until) для выгрузки, начатой сейчас."""
+    return (now or datetime.utcnow()) - EXPORT_WATERMARK_LAG
+
+
+def database_records(db: Session, since: datetime | None, until: datetime) -> Iterator[Record]:
+    """Вся база: строки, созданные или изменённые в (since, until]."""
+    user = models.User
+    ch = models.Challenge
+    cp = models.ChallengeParticipant
+    dp = models.DailyProgress
+    nudge = models.Nudge
+    msg = models.ChallengeMessage
+
+    def window(column):
+        if since is None:
+            # Строки без отметки (например, прогресс до миграции, добавившей updated_at)
+            # в полную выгрузку входят; в инкременты — нет, пока их не изменят
+            return or_(column.is_(None), column <= until)
+        return and_(column > since, column <= until)
+
+    yield from _rows(
+        db,
+        "user",
+        select(user.id, user.username, user.display_name, user.updated_at).where(window(user.updated_at)),
+    )
+    yield from _rows(
+        db,
+        "challenge",
+        select(
+            ch.id, ch.title, ch.goal_type, ch.daily_goal, ch.unit,
+            ch.start_date, ch.end_date, ch.is_public, ch.creator_id, ch.updated_at,
+        ).where(window(ch.updated_at)),
+    )
+    yield from _rows(
+        db,
+        "participant",
+        select(cp.challenge_id, cp.user_id, user.display_name, cp.role, cp.joined_at)
+        .join(user, user.id == cp.user_id)
+        .where(window(cp.joined_at)),
+    )
+    yield from _rows(
+        db,
+        "progress",
+        select(dp.challenge_id, dp.user_id, dp.date, dp.value, dp.completed, dp.updated_at)
+        .where(window(dp.updated_at)),
+    )
+    yield from _rows(
+        db,
+        "nudge",
+        select(nudge.challenge_id, nudge.from_user_id, nudge.to_user_id, nudge.created_at)
+        .where(window(nudge.created_at)),
+    )
+    yield from _rows(
+        db,
+        "message",
+        select(msg.id, msg.challenge_id, msg.user_id, msg.text, msg.created_at)
+        .where(window(msg.created_at)),
+    )
+
+
+def _chunked(parts: Iterator[bytes]) -> Iterator[bytes]:
+    buffer = bytearray()
+    for part in parts:
+        buffer += part
+        if len(buffer) >= EXPORT_CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def _ndjson(records: Iterator[Record]) -> Iterator[bytes]:
+    for record, fields in records:
+        yield orjson.dumps({"record": record, **fields}) + b"\n"
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _csv(records: Iterator[Record]) -> Iterator[bytes]:
+    columns = ["record"]
+    for fields in FIELDS.values():
+        columns += [name for name in fields if name not in columns]
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=columns, restval="")
+    writer.writeheader()
+    for record, fields in records:
+        writer.writerow({"record": record, **{k: _csv_value(v) for k, v in fields.items()}})
+        yield out.getvalue().encode()
+        out.seek(0)
+        out.truncate()
+    yield out.getvalue().encode()
+
+
+def encode(records: Iterator[Record], fmt: str) -> Iterator[bytes]:
+    """Записи -> куски тела ответа в формате fmt ('csv' или 'ndjson')."""
+    return _chunked(_csv(records) if fmt == "csv" else _ndjson(records))
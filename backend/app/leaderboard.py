@@ -0,0 +1,162 @@
+"""
+Лидерборд челленджа по агрегатам участников (total_value, completed_days, streak_best).
+
+Агрегаты обновляются при каждой записи прогресса (aggregates.apply_day),
+а индексы ix_challenge_participants_leader_* (challenge_id, метрика DESC, user_id)
+держат участников уже отсортированными. Поэтому страница лидерборда, место
+пользователя и его соседи — это короткие range-сканы по индексу и COUNT,
+без чтения и сортировки всех участников.
+
+Порядок: метрика по убыванию, при равенстве — user_id по возрастанию.
+Место (rank) — «спортивное»: у равных значений одно место, следующее пропускается (1, 2, 2, 4).
+"""
+from dataclasses import dataclass
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+_cp = models.ChallengeParticipant
+
+METRICS = {
+    "total_value": _cp.total_value,
+    "completed_days": _cp.completed_days,
+    "streak_best": _cp.streak_best,
+}
+
+
+@dataclass
+class Entry:
+    rank: int
+    user_id: int
+    display_name: str
+    value: int
+
+
+def encode_cursor(value: int, user_id: int) -> str:
+    return f"{value}:{user_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    """Курсор «значение:user_id» последней строки предыдущей страницы. ValueError, если битый."""
+    value, user_id = cursor.split(":")
+    return int(value), int(user_id)
+
+
+def _base(challenge_id: int, column):
+    return (
+        select(_cp.user_id, models.User.display_name, column)
+        .join(models.User, models.User.id == _cp.user_id)
+        .where(_cp.challenge_id == challenge_id)
+    )
+
+
+def _count(db: Session, challenge_id: int, *conditions) -> int:
+    # Тот же join, что в _base: total и места считаются по тем же строкам, что попадают в выдачу
+    return db.scalar(
+        select(func.count())
+        .select_from(_cp)
+        .join(models.User, models.User.id == _cp.user_id)
+        .where(_cp.challenge_id == challenge_id, *conditions)
+    )
+
+
+def _after(column, value: int, user_id: int):
+    # «Ниже в таблице, чем (value, user_id)». Условие column <= value даёт range-скан по индексу
+    return and_(column <= value, or_(column < value, _cp.user_id > user_id))
+
+
+def _before(column, value: int, user_id: int):
+    return and_(column >= value, or_(column > value, _cp.user_id < user_id))
+
+
+def _ranked(db: Session, challenge_id: int, column, rows, first_position: int) -> list[Entry]:
+    """
+    Проставляет места строкам, идущим подряд в порядке лидерборда с позиции first_position.
+    Для первой строки место — 1 + число участников со значением строго больше;
+    дальше место меняется на позицию строки, когда меняется значение.
+    """
+    entries: list[Entry] = []
+    for i, (user_id, display_name, value) in enumerate(rows):
+        value = int(value or 0)
+        if not entries:
+            rank = 1 + _count(db, challenge_id, column > value)
+        elif value == entries[-1].value:
+            rank = entries[-1].rank
+        else:
+            rank = first_position + i
+        entries.append(Entry(rank=rank, user_id=user_id, display_name=display_name, value=value))
+    return entries
+
+
+def total(db: Session, challenge_id: int) -> int:
+    return _count(db, challenge_id)
+
+
+def page(
+    db: Session,
+    challenge_id: int,
+    metric: str,
+    limit: int,
+    offset: int = 0,
+    cursor: tuple[int, int] | None = None,
+) -> tuple[list[Entry], str | None]:
+    """
+    Страница лидерборда: по offset или после курсора (keyset, стоимость не зависит от глубины).
+    Возвращает (строки, курсор следующей страницы или None, если дальше пусто).
+    """
+    column = METRICS[metric]
+    q = _base(challenge_id, column).order_by(column.desc(), _cp.user_id)
+    if cursor is not None:
+        value, user_id = cursor
+        q = q.where(_after(column, value, user_id))
+        # Позиция первой строки — после всех, кто выше курсора, и самой строки курсора
+        first_position = 2 + _count(db, challenge_id, _before(column, value, user_id))
+    else:
+        q = q.offset(offset)
+        first_position = 1 + offset
+    # Одна лишняя строка — признак того, что есть следующая страница
+    rows = db.execute(q.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    entries = _ranked(db, challenge_id, column, rows[:limit], first_position)
+    next_cursor = encode_cursor(entries[-1].value, entries[-1].user_id) if has_more else None
+    return entries, next_cursor
+
+
+def around(
+    db: Session,
+    challenge_id: int,
+    metric: str,
+    user_id: int,
+    neighbors: int,
+) -> tuple[Entry | None, list[Entry]]:
+    """
+    Место пользователя и до neighbors соседей сверху и снизу.
+    Возвращает (строка пользователя, окно подряд идущих строк с ним в середине);
+    (None, []), если пользователь не участник.
+    """
+    column = METRICS[metric]
+    me = db.execute(_base(challenge_id, column).where(_cp.user_id == user_id)).first()
+    if me is None:
+        return None, []
+    value = int(me[2] or 0)
+
+    above = []
+    below = []
+    if neighbors > 0:
+        above = db.execute(
+            _base(challenge_id, column)
+            .where(_before(column, value, user_id))
+            .order_by(column, _cp.user_id.desc())
+            .limit(neighbors)
+        ).all()[::-1]
+        below = db.execute(
+            _base(challenge_id, column)
+            .where(_after(column, value, user_id))
+            .order_by(column.desc(), _cp.user_id)
+            .limit(neighbors)
+        ).all()
+    position = 1 + _count(db, challenge_id, _before(column, value, user_id))
+    window = _ranked(db, challenge_id, column, [*above, me, *below], position - len(above))
+    return window[len(above)], window
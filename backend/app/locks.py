@@ -0,0 +1,48 @@
+"""
+Межпроцессные блокировки для запуска нескольких воркеров uvicorn на одном хосте.
+
+Основаны на flock по файлу в LOCK_DIR: блокировка снимается ядром при смерти
+процесса, поэтому «зависших» локов после падения воркера не бывает.
+"""
+import fcntl
+import os
+
+LOCK_DIR = os.getenv("LOCK_DIR", ".")
+
+
+class FileLock:
+    def __init__(self, name: str) -> None:
+        self.path = os.path.join(LOCK_DIR, f"repday.{name}.lock")
+        self._fd: int | None = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
@@ -1,15 +1,54 @@
+import asyncio
 import traceback
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 
 from .routers import auth, challenges, users
-from . import telegram_bot
-from .db import init_db
+from . import bot_updates, events, metrics, outbox, reminders, response_cache, rollover, shared, telegram_bot
+from .middleware import CompressionMiddleware, DefaultCacheControlMiddleware, MetricsMiddleware
+from .db import dispose_async_engine, init_db
+from .deps import get_current_user, is_superadmin
+from .models import User
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Шина событий SSE доставляет публикации из threadpool в этот event loop
+    events.bus.bind(asyncio.get_running_loop())
+    # Обмен инвалидациями и событиями с другими воркерами (если их несколько)
+    await shared.state.start()
+    # Соседям пересылаются только события челленджей, на которые у них есть подписчики
+    events.bus.start()
+    # Обновления бота из webhook применяются пачками в фоне
+    bot_updates.queue.start()
+    # Фоновая отправка сообщений Telegram из outbox
+    outbox.sender.start()
+    # Смена дня: итоги закрытых дней, серии, архивация (догоняет пропущенные дни при старте)
+    rollover.roller.start()
+    # Вечерние напоминания тем, кто не отметился сегодня (через outbox)
+    reminders.reminders.start()
+    try:
+        yield
+    finally:
+        await reminders.reminders.stop()
+        await rollover.roller.stop()
+        await outbox.sender.stop()
+        await bot_updates.queue.stop()
+        await events.bus.stop()
+        await shared.state.stop()
+        await dispose_async_engine()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="RepDay API", version="0.1.0")
+    # Остальные ответы кодируются orjson; горячие эндпоинты отдают готовый JSON (serialization.py)
+    app = FastAPI(
+        title="RepDay API",
+        version="0.1.0",
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse,
+    )
 
     @app.exception_handler(Exception)
     def unhandled_exception_handler(request, exc):
@@ -25,11 +64,43 @@ def create_app() -> FastAPI:
 
     init_db()
 
+    # Порядок: сжатие видит уже окончательные заголовки ответа, метрики — самый внешний
+    # слой: время запроса целиком и байты, ушедшие клиенту
+    app.add_middleware(DefaultCacheControlMiddleware)
+    app.add_middleware(CompressionMiddleware)
+    app.add_middleware(MetricsMiddleware)
+
     app.include_router(auth.router, prefix="/auth", tags=["auth"])
     app.include_router(users.router, prefix="/me", tags=["me"])
     app.include_router(challenges.router, prefix="/challenges", tags=["challenges"])
     app.include_router(telegram_bot.router, tags=["telegram"])
 
+    # Метрики доступны через тот же прокси /api/, что и остальное API, — только суперадмину
+    def require_superadmin(current_user: User = Depends(get_current_user)) -> User:
+        if not is_superadmin(current_user):
+            raise HTTPException(status_code=403, detail="Superadmin only")
+        return current_user
+
+    @app.get("/metrics/cache", tags=["metrics"], dependencies=[Depends(require_superadmin)])
+    def cache_metrics() -> dict:
+        """Попадания, вытеснения и объём кэша ответов этого воркера — для подбора RESPONSE_CACHE_MAX_BYTES."""
+        return response_cache.stats()
+
+    @app.get(
+        "/metrics",
+        tags=["metrics"],
+        response_class=PlainTextResponse,
+        dependencies=[Depends(require_superadmin)],
+    )
+    def prometheus_metrics() -> PlainTextResponse:
+        """Метрики запросов по маршрутам, кэша ответов, outbox и очереди обновлений бота этого воркера (Prometheus)."""
+        gauges = {f"repday_response_cache_{name}": value for name, value in response_cache.stats().items()}
+        gauges.update({f"repday_outbox_{name}": value for name, value in outbox.sender.stats().items()})
+        gauges.update({f"repday_bot_updates_{name}": value for name, value in bot_updates.queue.stats().items()})
+        return PlainTextResponse(
+            metrics.registry.render(gauges), media_type="text/plain; version=0.0.4"
+        )
+
     return app
 
 
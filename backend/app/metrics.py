@@ -0,0 +1,250 @@
+"""
+Метрики запросов: время, число и время SQL-запросов, размер ответа — по каждому маршруту.
+
+MetricsMiddleware открывает на запрос RequestStats (в contextvar), хуки SQLAlchemy
+на движке приложения дописывают в него каждый выполненный запрос: contextvar виден
+и в потоке threadpool (run_in_threadpool копирует контекст), и в run_sync async-сессии.
+По завершении запроса итог попадает в registry, а запросы дольше SLOW_REQUEST_MS или
+с числом SQL от SLOW_REQUEST_QUERIES — в лог app.metrics.slow вместе с самым частым
+SQL-запросом (так видно N+1).
+
+GET /metrics отдаёт registry в текстовом формате Prometheus. Метрики у каждого
+воркера свои: при WEB_CONCURRENCY > 1 собирайте их с каждого процесса.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))
+SLOW_REQUEST_QUERIES = int(os.getenv("SLOW_REQUEST_QUERIES", "30"))
+
+# Границы гистограммы времени ответа, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Для запросов мимо маршрутов (404) — одна метка, а не путь: иначе метки не ограничены
+UNMATCHED_ROUTE = "<unmatched>"
+
+slow_logger = logging.getLogger(__name__ + ".slow")
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    sql_seconds: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+
+
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def start_request() -> RequestStats:
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _current.get() is not None:
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    stats = _current.get()
+    if stats is None:
+        return
+    started = conn.info["metrics_started"].pop()
+    stats.queries += 1
+    stats.sql_seconds += time.perf_counter() - started
+    stats.statements[statement] += 1
+
+
+def _handle_error(exception_context) -> None:
+    # Упавший запрос не доходит до after_cursor_execute — снимаем его отметку времени
+    connection = exception_context.connection
+    if connection is not None and _current.get() is not None:
+        started = connection.info.get("metrics_started")
+        if started:
+            started.pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Считать SQL-запросы движка в метрики текущего HTTP-запроса."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+@dataclass
+class _RouteMetrics:
+    buckets: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+    count: int = 0
+    seconds: float = 0.0
+    queries: int = 0
+    queries_max: int = 0
+    sql_seconds: float = 0.0
+    response_bytes: int = 0
+    slow: int = 0
+    statuses: Counter = field(default_factory=Counter)
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._routes: dict[tuple[str, str], _RouteMetrics] = {}
+
+    def observe(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        stats: RequestStats,
+        response_bytes: int,
+        streaming: bool = False,
+    ) -> None:
+        # Потоки (SSE, экспорт) идут минутами — по времени они не «медленные»
+        slow = stats.queries >= SLOW_REQUEST_QUERIES or (
+            not streaming and seconds * 1000 >= SLOW_REQUEST_MS
+        )
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = _RouteMetrics()
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    metrics.buckets[i] += 1
+                    break
+            metrics.count += 1
+            metrics.seconds += seconds
+            metrics.queries += stats.queries
+            metrics.queries_max = max(metrics.queries_max, stats.queries)
+            metrics.sql_seconds += stats.sql_seconds
+            metrics.response_bytes += response_bytes
+            metrics.statuses[status] += 1
+            if slow:
+                metrics.slow += 1
+        if slow:
+            top = stats.statements.most_common(1)
+            statement, repeats = top[0] if top else ("", 0)
+            slow_logger.warning(
+                "Slow request %s %s: status=%s time=%.1fms queries=%s sql=%.1fms bytes=%s; "
+                "most repeated (%sx): %s",
+                method,
+                route,
+                status,
+                seconds * 1000,
+                stats.queries,
+                stats.sql_seconds * 1000,
+                response_bytes,
+                repeats,
+                " ".join(statement.split())[:300],
+            )
+
+    def snapshot(self) -> dict[tuple[str, str], dict]:
+        """Итоги по (method, route): число запросов, SQL-запросов, время SQL, байты ответа."""
+        with self._lock:
+            return {
+                key: {
+                    "count": m.count,
+                    "queries": m.queries,
+                    "queries_max": m.queries_max,
+                    "sql_seconds": m.sql_seconds,
+                    "response_bytes": m.response_bytes,
+                    "slow": m.slow,
+                }
+                for key, m in self._routes.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+    def render(self, gauges: dict[str, float] | None = None) -> str:
+        """Текстовый формат Prometheus (version 0.0.4); gauges — дополнительные значения без меток."""
+        lines: list[str] = []
+
+        def family(name: str, kind: str, help_text: str, samples) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{{{labels}}} {value}")
+
+        def labels(method: str, route: str, **more: str) -> str:
+            pairs = {"method": method, "route": route, **more}
+            return ",".join(f'{k}="{_escape(v)}"' for k, v in pairs.items())
+
+        with self._lock:
+            routes = [(method, route, m) for (method, route), m in sorted(self._routes.items())]
+            family(
+                "repday_http_requests_total",
+                "counter",
+                "HTTP requests by route and status.",
+                [
+                    ("", labels(method, route, status=str(code)), n)
+                    for method, route, m in routes
+                    for code, n in sorted(m.statuses.items())
+                ],
+            )
+            duration = []
+            for method, route, m in routes:
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS, m.buckets):
+                    cumulative += n
+                    duration.append(("_bucket", labels(method, route, le=repr(bound)), cumulative))
+                duration.append(("_bucket", labels(method, route, le="+Inf"), m.count))
+                duration.append(("_sum", labels(method, route), m.seconds))
+                duration.append(("_count", labels(method, route), m.count))
+            family(
+                "repday_http_request_duration_seconds",
+                "histogram",
+                "Request latency from first byte in to last byte out.",
+                duration,
+            )
+            family(
+                "repday_http_request_queries_total",
+                "counter",
+                "SQL statements executed while serving the route.",
+                [("", labels(method, route), m.queries) for method, route, m in routes],
+            )
+            family(
+                "repday_http_request_queries_max",
+                "gauge",
+                "Most SQL statements seen in a single request to the route.",
+                [("", labels(method, route), m.queries_max) for method, route, m in routes],
+            )
+            family(
+                "repday_http_request_sql_seconds_total",
+                "counter",
+                "Time spent in SQL statements while serving the route.",
+                [("", labels(method, route), m.sql_seconds) for method, route, m in routes],
+            )
+            family(
+                "repday_http_response_bytes_total",
+                "counter",
+                "Response body bytes sent (after compression).",
+                [("", labels(method, route), m.response_bytes) for method, route, m in routes],
+            )
+            family(
+                "repday_http_slow_requests_total",
+                "counter",
+                "Requests over SLOW_REQUEST_MS or SLOW_REQUEST_QUERIES.",
+                [("", labels(method, route), m.slow) for method, route, m in routes],
+            )
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = MetricsRegistry()
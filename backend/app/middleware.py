@@ -0,0 +1,234 @@
+"""
+HTTP-middleware приложения: метрики запросов, сжатие ответов и заголовок Cache-Control по умолчанию.
+
+Сжатие — gzip или brotli (если установлен пакет brotli) по Accept-Encoding клиента,
+только для текстовых типов и только начиная с COMPRESSION_MIN_SIZE байт: короткие
+ответы сжатие лишь удлиняет. Потоковые ответы (экспорт) сжимаются по частям,
+поток событий SSE (text/event-stream) не сжимается вовсе — иначе события копились
+бы в буфере компрессора. Уровни подобраны по замеру:
+
+    python -m tools.bench_compression
+"""
+import os
+import time
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него — только gzip
+    brotli = None
+
+from . import metrics
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "5"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Cache-Control для ответов, где хэндлер его не задал: данные персональные, не храним
+DEFAULT_CACHE_CONTROL = "no-store"
+
+_COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+_NOT_COMPRESSIBLE_TYPES = ("text/event-stream",)
+
+
+def _is_compressible(content_type: str) -> bool:
+    content_type = content_type.lower()
+    return content_type.startswith(_COMPRESSIBLE_TYPES) and not content_type.startswith(
+        _NOT_COMPRESSIBLE_TYPES
+    )
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """'br', 'gzip' или None по заголовку Accept-Encoding (с учётом q=0)."""
+    accepted: dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    """Потоковый компрессор: compress(часть) и finish() возвращают готовые к отправке байты."""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int) -> None:
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits 16 + 15 — формат gzip с заголовком
+            self._gz = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        """Часть потока; сбрасывается сразу, чтобы клиент получил её без ожидания следующей."""
+        if self.encoding == "br":
+            return self._br.process(data) + self._br.flush()
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._br.process(data) + self._br.finish()
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        responder = _CompressingResponder(send, encoding, self)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(self, send: Send, encoding: str | None, options: CompressionMiddleware) -> None:
+        self._send = send
+        self._encoding = encoding
+        self._options = options
+        self._start: Message | None = None
+        self._compressor: _Compressor | None = None
+        self._passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = MutableHeaders(scope=message)
+            eligible = "content-encoding" not in headers and _is_compressible(
+                headers.get("content-type", "")
+            )
+            if eligible:
+                # Ответ зависит от Accept-Encoding — и для кэшей по пути, даже если не сжат
+                headers.add_vary_header("Accept-Encoding")
+            if not eligible or self._encoding is None:
+                self._passthrough = True
+                await self._send(message)
+            else:
+                # Решение о сжатии — по первой части тела
+                self._start = message
+            return
+
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._start is not None:
+            start, self._start = self._start, None
+            headers = MutableHeaders(scope=start)
+            if not more_body and len(body) < self._options.minimum_size:
+                self._passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+            self._compressor = _Compressor(
+                self._encoding, self._options.gzip_level, self._options.brotli_quality
+            )
+            headers["Content-Encoding"] = self._encoding
+            if not more_body:
+                body = self._compressor.finish(body)
+                headers["Content-Length"] = str(len(body))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            # Поток: длина заранее неизвестна
+            del headers["Content-Length"]
+            await self._send(start)
+
+        if more_body:
+            chunk = self._compressor.compress(body)
+            if chunk:
+                await self._send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            await self._send({"type": "http.response.body", "body": self._compressor.finish(body)})
+
+
+class DefaultCacheControlMiddleware:
+    """Ставит Cache-Control: no-store, если хэндлер не задал свою политику кэширования."""
+
+    def __init__(self, app: ASGIApp, value: str = DEFAULT_CACHE_CONTROL) -> None:
+        self.app = app
+        self.value = value
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cache_control(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if "cache-control" not in headers:
+                    headers["Cache-Control"] = self.value
+            await send(message)
+
+        await self.app(scope, receive, send_with_cache_control)
+
+
+class MetricsMiddleware:
+    """Время, SQL-запросы и размер ответа каждого запроса — в metrics.registry (по шаблону маршрута)."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = metrics.start_request()
+        started = time.perf_counter()
+        status = 500
+        response_bytes = 0
+        streaming = False
+
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status, response_bytes, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+                # Тело частями — поток (SSE, экспорт): его длительность не «медленный запрос»
+                streaming = streaming or message.get("more_body", False)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            # Маршрут FastAPI кладёт в scope при сопоставлении пути
+            route = scope.get("route")
+            metrics.registry.observe(
+                scope["method"],
+                getattr(route, "path", metrics.UNMATCHED_ROUTE),
+                status,
+                time.perf_counter() - started,
+                stats,
+                response_bytes,
+                streaming=streaming,
+            )
@@ -0,0 +1,230 @@
+"""
+Версионированные миграции схемы.
+
+Base.metadata.create_all создаёт недостающие таблицы, но не меняет уже существующие.
+Всё, что нужно доприменить к старым БД (колонки, индексы), описывается здесь
+отдельными шагами с номером версии. Применённая версия хранится в таблице schema_version.
+Каждый шаг идемпотентен: на свежей БД, созданной create_all, он просто ничего не меняет.
+Шаги не зависят от диалекта: структура читается через inspector, типы колонок
+компилируются диалектом подключения (SQLite, PostgreSQL).
+"""
+import logging
+import os
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    Connection,
+    Date,
+    DateTime,
+    Engine,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    inspect,
+    insert,
+    select,
+    text,
+)
+from sqlalchemy.types import TypeEngine
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_advisory_lock, под которым мигрирует один процесс из всех хостов
+MIGRATION_ADVISORY_LOCK_KEY = int(os.getenv("MIGRATION_ADVISORY_LOCK_KEY", "727300"))
+
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", String(128), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _column_names(conn: Connection, table: str) -> set[str]:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _add_column(
+    conn: Connection,
+    table: str,
+    name: str,
+    type_: TypeEngine,
+    not_null_default: int | None = None,
+) -> None:
+    if name in _column_names(conn, table):
+        return
+    ddl = type_.compile(dialect=conn.dialect)
+    if not_null_default is not None:
+        ddl += f" NOT NULL DEFAULT {int(not_null_default)}"
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+def _add_daily_progress_updated_at(conn: Connection) -> None:
+    # Колонка updated_at в daily_progress появилась позже самой таблицы
+    _add_column(conn, "daily_progress", "updated_at", DateTime())
+
+
+def _add_hot_path_indexes(conn: Connection) -> None:
+    # Индексы под горячие запросы routers/challenges.py (см. __table_args__ в models.py)
+    statements = [
+        # nudge: «менял ли получатель прогресс за последний час»
+        "CREATE INDEX IF NOT EXISTS ix_daily_progress_recent "
+        "ON daily_progress (challenge_id, user_id, updated_at)",
+        # список челленджей: число выполненных дней пользователя по каждому челленджу
+        "CREATE INDEX IF NOT EXISTS ix_daily_progress_user_completed "
+        "ON daily_progress (user_id, completed, challenge_id)",
+        # rate-limit nudge и «последний nudge от меня»
+        "CREATE INDEX IF NOT EXISTS ix_nudges_pair_created "
+        "ON nudges (challenge_id, from_user_id, to_user_id, created_at)",
+        # история чата
+        "CREATE INDEX IF NOT EXISTS ix_challenge_messages_challenge_created "
+        "ON challenge_messages (challenge_id, created_at)",
+        # список челленджей пользователя
+        "CREATE INDEX IF NOT EXISTS ix_challenge_participants_user "
+        "ON challenge_participants (user_id)",
+    ]
+    for stmt in statements:
+        conn.execute(text(stmt))
+
+
+def _add_participant_aggregates(conn: Connection) -> None:
+    _add_column(conn, "challenge_participants", "total_value", Integer(), not_null_default=0)
+    _add_column(conn, "challenge_participants", "completed_days", Integer(), not_null_default=0)
+    _add_column(conn, "challenge_participants", "streak_last_date", Date())
+
+    # Заполняем агрегаты по уже накопленной истории
+    from sqlalchemy.orm import Session
+
+    from .aggregates import recompute_all
+
+    with Session(bind=conn) as session:
+        recompute_all(session)
+        session.flush()
+
+    # Список челленджей берёт completed_days из агрегатов — индекс из шага 2 больше не читается
+    conn.execute(text("DROP INDEX IF EXISTS ix_daily_progress_user_completed"))
+
+
+def _add_challenge_versions(conn: Connection) -> None:
+    for table, name in [
+        ("challenges", "version"),
+        ("challenges", "members_version"),
+        ("challenge_participants", "version"),
+    ]:
+        _add_column(conn, table, name, Integer(), not_null_default=0)
+
+
+def _add_chat_cursor_index(conn: Connection) -> None:
+    # (challenge_id, created_at, id) покрывает и выборку «последние N», и курсоры
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_challenge_messages_cursor "
+            "ON challenge_messages (challenge_id, created_at, id)"
+        )
+    )
+    conn.execute(text("DROP INDEX IF EXISTS ix_challenge_messages_challenge_created"))
+
+
+def _add_leaderboard_indexes(conn: Connection) -> None:
+    # Порядок лидерборда: (challenge_id, метрика DESC, user_id), см. leaderboard.py
+    for metric in ("total_value", "completed_days", "streak_best"):
+        conn.execute(
+            text(
+                f"CREATE INDEX IF NOT EXISTS ix_challenge_participants_leader_{metric} "
+                f"ON challenge_participants (challenge_id, {metric} DESC, user_id)"
+            )
+        )
+
+
+def _add_rollover_columns(conn: Connection) -> None:
+    # Таблицу daily_summaries создаёт create_all; итоги прошлых дней допишет rollover при старте
+    _add_column(conn, "challenges", "summarized_through", Date())
+    _add_column(conn, "challenges", "archived_at", DateTime())
+
+
+def _add_reminder_columns(conn: Connection) -> None:
+    _add_column(conn, "users", "reminded_on", Date())
+    _add_column(conn, "outbound_messages", "batch", String(32))
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_outbound_messages_batch_status "
+            "ON outbound_messages (batch, status)"
+        )
+    )
+
+
+# (версия, описание, функция). Новые шаги добавляются только в конец.
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "daily_progress.updated_at", _add_daily_progress_updated_at),
+    (2, "hot path indexes", _add_hot_path_indexes),
+    (3, "participant aggregates", _add_participant_aggregates),
+    (4, "challenge versions", _add_challenge_versions),
+    (5, "chat cursor index", _add_chat_cursor_index),
+    (6, "leaderboard indexes", _add_leaderboard_indexes),
+    (7, "daily rollover", _add_rollover_columns),
+    (8, "evening reminders", _add_reminder_columns),
+]
+
+
+@contextmanager
+def migration_lock(engine: Engine) -> Iterator[None]:
+    """
+    Схему создаёт и мигрирует ровно один процесс: остальные воркеры ждут его
+    и затем видят уже актуальную версию. PostgreSQL — advisory lock (работает и
+    между хостами), иначе — файловая блокировка на хосте.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_ADVISORY_LOCK_KEY})
+            conn.commit()
+            try:
+                yield
+            finally:
+                conn.execute(
+                    text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_ADVISORY_LOCK_KEY}
+                )
+                conn.commit()
+        return
+
+    from .locks import FileLock
+
+    with FileLock("migrations"):
+        yield
+
+
+def current_version(conn: Connection) -> int:
+    return conn.execute(
+        select(func.coalesce(func.max(schema_version.c.version), 0))
+    ).scalar_one()
+
+
+def run_migrations(engine: Engine) -> int:
+    """Применяет недостающие миграции по порядку. Возвращает итоговую версию схемы."""
+    with engine.begin() as conn:
+        schema_version.create(conn, checkfirst=True)
+        version = current_version(conn)
+
+    for step_version, description, apply in MIGRATIONS:
+        if step_version <= version:
+            continue
+        # Каждый шаг — отдельная транзакция вместе с записью версии
+        with engine.begin() as conn:
+            apply(conn)
+            conn.execute(
+                insert(schema_version).values(
+                    version=step_version,
+                    description=description,
+                    applied_at=datetime.utcnow(),
+                )
+            )
+        logger.info("Applied migration %s: %s", step_version, description)
+        version = step_version
+
+    return version
@@ -1,6 +1,6 @@
 from datetime import date, datetime
 
-from sqlalchemy import Boolean, CheckConstraint, Date, DateTime, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy import BigInteger, Boolean, CheckConstraint, Date, DateTime, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint, desc
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -10,10 +10,13 @@ class User(Base):
     __tablename__ = "users"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
-    telegram_id: Mapped[int] = mapped_column(Integer, unique=True, index=True)
+    # Telegram ID не влезают в 32 бита (в PostgreSQL INTEGER — 32 бита)
+    telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True, index=True)
     username: Mapped[str | None] = mapped_column(String(64), nullable=True)
     display_name: Mapped[str] = mapped_column(String(128))
     bot_chat_active: Mapped[bool] = mapped_column(Boolean, default=False)
+    # День последнего вечернего напоминания (reminders.py): не больше одного в день
+    reminded_on: Mapped[date | None] = mapped_column(Date, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=datetime.utcnow
     )
@@ -39,6 +42,12 @@ class Challenge(Base):
     end_date: Mapped[date] = mapped_column(Date)
     is_public: Mapped[bool] = mapped_column(Boolean, default=True)
     invite_code: Mapped[str] = mapped_column(String(32), unique=True, index=True)
+    # Версия данных для ETag / ?since= (см. versions.py)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+    members_version: Mapped[int] = mapped_column(Integer, default=0)
+    # Последний закрытый день (итоги в daily_summaries, см. rollover.py) и момент архивации
+    summarized_through: Mapped[date | None] = mapped_column(Date, nullable=True)
+    archived_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
     creator_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     creator: Mapped[User] = relationship(back_populates="challenges_created")
@@ -55,6 +64,11 @@ class ChallengeParticipant(Base):
     __tablename__ = "challenge_participants"
     __table_args__ = (
         UniqueConstraint("challenge_id", "user_id", name="uix_challenge_user"),
+        Index("ix_challenge_participants_user", "user_id"),
+        # Лидерборд: участники челленджа уже в порядке «метрика по убыванию, user_id» (см. leaderboard.py)
+        Index("ix_challenge_participants_leader_total_value", "challenge_id", desc("total_value"), "user_id"),
+        Index("ix_challenge_participants_leader_completed_days", "challenge_id", desc("completed_days"), "user_id"),
+        Index("ix_challenge_participants_leader_streak_best", "challenge_id", desc("streak_best"), "user_id"),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
@@ -62,8 +76,15 @@ class ChallengeParticipant(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     role: Mapped[str] = mapped_column(String(16), default="member")
     joined_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Агрегаты по daily_progress, поддерживаются при записи (см. aggregates.py)
+    total_value: Mapped[int] = mapped_column(Integer, default=0)
+    completed_days: Mapped[int] = mapped_column(Integer, default=0)
     streak_current: Mapped[int] = mapped_column(Integer, default=0)
     streak_best: Mapped[int] = mapped_column(Integer, default=0)
+    # Последний выполненный день серии streak_current
+    streak_last_date: Mapped[date | None] = mapped_column(Date, nullable=True)
+    # Версия челленджа, при которой изменилась строка участника (см. versions.py)
+    version: Mapped[int] = mapped_column(Integer, default=0)
 
     challenge: Mapped[Challenge] = relationship(back_populates="participants")
     user: Mapped[User] = relationship(back_populates="participations")
@@ -76,6 +97,7 @@ class DailyProgress(Base):
             "challenge_id", "user_id", "date", name="uix_progress_day"
         ),
         CheckConstraint("value >= 0", name="check_value_nonnegative"),
+        Index("ix_daily_progress_recent", "challenge_id", "user_id", "updated_at"),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
@@ -92,8 +114,38 @@ class DailyProgress(Base):
     user: Mapped[User] = relationship()
 
 
+class DailySummary(Base):
+    """Итог закрытого дня участника; пишется при смене дня (rollover.py) и при правке прошлого дня."""
+
+    __tablename__ = "daily_summaries"
+    __table_args__ = (
+        UniqueConstraint("challenge_id", "user_id", "date", name="uix_summary_day"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    challenge_id: Mapped[int] = mapped_column(ForeignKey("challenges.id"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    date: Mapped[date] = mapped_column(Date)
+    value: Mapped[int] = mapped_column(Integer, default=0)
+    percent: Mapped[float] = mapped_column(Float, default=0.0)
+    completed: Mapped[bool] = mapped_column(Boolean, default=False)
+
+
+class ProcessedUpdate(Base):
+    """update_id уже применённого обновления бота: повторы от Telegram отбрасываются (bot_updates.py)."""
+
+    __tablename__ = "processed_updates"
+
+    update_id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    received_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+
 class ChallengeMessage(Base):
     __tablename__ = "challenge_messages"
+    __table_args__ = (
+        # Курсорная пагинация чата по (created_at, id)
+        Index("ix_challenge_messages_cursor", "challenge_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     challenge_id: Mapped[int] = mapped_column(ForeignKey("challenges.id"))
@@ -107,6 +159,12 @@ class ChallengeMessage(Base):
 
 class Nudge(Base):
     __tablename__ = "nudges"
+    __table_args__ = (
+        Index(
+            "ix_nudges_pair_created",
+            "challenge_id", "from_user_id", "to_user_id", "created_at",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     from_user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
@@ -114,3 +172,27 @@ class Nudge(Base):
     challenge_id: Mapped[int] = mapped_column(ForeignKey("challenges.id"))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+
+
+class OutboundMessage(Base):
+    """Исходящее сообщение Bot API (outbox). Отправляется фоновым воркером из outbox.py."""
+
+    __tablename__ = "outbound_messages"
+    __table_args__ = (
+        Index("ix_outbound_messages_status_next", "status", "next_attempt_at"),
+        Index("ix_outbound_messages_batch_status", "batch", "status"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    method: Mapped[str] = mapped_column(String(64), default="sendMessage")
+    payload: Mapped[str] = mapped_column(Text)  # JSON-тело запроса к Bot API
+    # Массовая рассылка, к которой относится сообщение (например, reminder:2026-01-31); NULL — одиночное
+    batch: Mapped[str | None] = mapped_column(String(32), nullable=True)
+    # pending -> sending -> sent | failed (sending с истёкшим next_attempt_at снова берётся в работу)
+    status: Mapped[str] = mapped_column(String(16), default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    last_error: Mapped[str | None] = mapped_column(String(500), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
@@ -0,0 +1,347 @@
+"""
+Outbox исходящих сообщений Telegram.
+
+Хэндлеры только кладут строку OutboundMessage в той же транзакции, что и своё
+изменение (например, nudge), и сразу отвечают клиенту. Фоновый воркер
+(OutboxSender, запускается в lifespan приложения) забирает готовые строки,
+отправляет их через общий httpx.AsyncClient с соблюдением лимитов Bot API
+и повторяет неудачные попытки с экспоненциальной задержкой.
+
+При нескольких воркерах отправляет только один (держит FileLock("outbox")), чтобы
+лимиты Bot API соблюдались на весь хост; остальные будят его через shared.state.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+
+import httpx
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import models, shared
+from .db import engine
+from .locks import FileLock
+
+logger = logging.getLogger(__name__)
+
+BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+# Базовый URL Bot API; для офлайн-проверки указывает на tools/fake_telegram_api.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+
+# Лимиты Telegram: ~30 сообщений в секунду всего и не чаще 1 в секунду в один чат
+GLOBAL_RATE_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+PER_CHAT_INTERVAL_SECONDS = float(os.getenv("TELEGRAM_PER_CHAT_INTERVAL", "1"))
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "8"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv("OUTBOX_BACKOFF_BASE_SECONDS", "2"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+# Сколько строка считается «занятой» воркером; после этого её может забрать другой процесс
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "60"))
+
+
+def enqueue(db: Session, chat_id: int, payload: dict[str, Any], method: str = "sendMessage") -> None:
+    """Добавить сообщение в outbox. Коммит — на стороне вызывающего, вместе с его изменениями."""
+    db.add(
+        models.OutboundMessage(
+            chat_id=chat_id,
+            method=method,
+            payload=json.dumps(payload, ensure_ascii=False),
+        )
+    )
+
+
+def enqueue_batch(
+    db: Session,
+    batch: str,
+    messages: list[tuple[int, dict[str, Any]]],
+    method: str = "sendMessage",
+) -> None:
+    """Пачка сообщений массовой рассылки batch одной вставкой: (chat_id, payload). Коммит — на стороне вызывающего."""
+    if not messages:
+        return
+    db.execute(
+        insert(models.OutboundMessage),
+        [
+            {
+                "chat_id": chat_id,
+                "method": method,
+                "payload": json.dumps(payload, ensure_ascii=False),
+                "batch": batch,
+            }
+            for chat_id, payload in messages
+        ],
+    )
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+
+
+class RateLimiter:
+    """
+    Резервирует слоты отправки: глобально не чаще rate_per_second,
+    в один чат — не чаще раза в per_key_interval секунд.
+    """
+
+    def __init__(self, rate_per_second: float, per_key_interval: float) -> None:
+        self._interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._per_key_interval = per_key_interval
+        self._next_global = 0.0
+        self._next_by_key: dict[Any, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, key: Any = None) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_global)
+            if key is not None:
+                slot = max(slot, self._next_by_key.get(key, 0.0))
+                self._next_by_key[key] = slot + self._per_key_interval
+                if len(self._next_by_key) > 10000:
+                    self._next_by_key = {k: t for k, t in self._next_by_key.items() if t > now}
+            self._next_global = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def penalize(self, seconds: float) -> None:
+        """Telegram ответил 429 с retry_after — придерживаем все отправки."""
+        loop = asyncio.get_running_loop()
+        self._next_global = max(self._next_global, loop.time() + seconds)
+
+
+@dataclass
+class SendResult:
+    ok: bool
+    # Повторять ли попытку (сеть, 5xx, 429); False — ошибка окончательная (4xx)
+    retryable: bool = False
+    retry_after: float | None = None
+    error: str | None = None
+    # 403: пользователь заблокировал бота — чат больше не активен
+    blocked: bool = False
+
+
+async def call_bot_api(
+    client: httpx.AsyncClient, method: str, payload: dict[str, Any]
+) -> SendResult:
+    try:
+        response = await client.post(f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}/{method}", json=payload)
+    except httpx.HTTPError as e:
+        return SendResult(ok=False, retryable=True, error=f"{type(e).__name__}: {e}")
+
+    if response.status_code == 200:
+        return SendResult(ok=True)
+
+    error = response.text[:500]
+    if response.status_code == 429:
+        retry_after = None
+        try:
+            retry_after = float(response.json().get("parameters", {}).get("retry_after"))
+        except (ValueError, TypeError, AttributeError):
+            pass
+        return SendResult(ok=False, retryable=True, retry_after=retry_after, error=error)
+    return SendResult(
+        ok=False,
+        retryable=response.status_code >= 500,
+        error=error,
+        blocked=response.status_code == 403,
+    )
+
+
+def new_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(10.0, connect=5.0),
+        limits=httpx.Limits(max_connections=OUTBOX_CONCURRENCY * 2, max_keepalive_connections=OUTBOX_CONCURRENCY),
+    )
+
+
+def _claim_batch(limit: int) -> list[tuple[int, int, str, str, int]]:
+    """Атомарно помечает готовые к отправке строки как sending и возвращает их."""
+    ob = models.OutboundMessage
+    now = datetime.utcnow()
+    ready_ids = (
+        select(ob.id)
+        .where(ob.status.in_(("pending", "sending")), ob.next_attempt_at <= now)
+        # Одиночные сообщения (nudge) — вперёд массовых рассылок, иначе ждали бы их целиком
+        .order_by(ob.batch.is_not(None), ob.id)
+        .limit(limit)
+        # PostgreSQL: несколько процессов не забирают одни и те же строки; SQLite это опускает
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(ob)
+        .where(ob.id.in_(ready_ids))
+        .values(status="sending", next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+        .returning(ob.id, ob.chat_id, ob.method, ob.payload, ob.attempts)
+    )
+    with engine.begin() as conn:
+        rows = conn.execute(stmt).fetchall()
+    return sorted((tuple(r) for r in rows), key=lambda r: r[0])
+
+
+def _seconds_until_next_due() -> float | None:
+    """Через сколько секунд наступит ближайшая повторная попытка (None — очередь пуста)."""
+    ob = models.OutboundMessage
+    with engine.connect() as conn:
+        next_at = conn.execute(
+            select(func.min(ob.next_attempt_at)).where(ob.status.in_(("pending", "sending")))
+        ).scalar()
+    if next_at is None:
+        return None
+    return max((next_at - datetime.utcnow()).total_seconds(), 0.0)
+
+
+def _record_result(message_id: int, chat_id: int, attempts: int, result: SendResult) -> str:
+    """Сохраняет итог попытки; возвращает новый статус сообщения."""
+    ob = models.OutboundMessage
+    now = datetime.utcnow()
+    if result.ok:
+        values: dict[str, Any] = {"status": "sent", "sent_at": now, "last_error": None}
+    elif result.retryable and attempts < OUTBOX_MAX_ATTEMPTS:
+        delay = max(backoff_seconds(attempts), result.retry_after or 0)
+        values = {
+            "status": "pending",
+            "next_attempt_at": now + timedelta(seconds=delay),
+            "last_error": result.error,
+        }
+    else:
+        values = {"status": "failed", "last_error": result.error}
+    with engine.begin() as conn:
+        conn.execute(update(ob).where(ob.id == message_id).values(attempts=attempts, **values))
+        blocked_ids = []
+        if result.blocked:
+            # Следующие рассылки (reminders.py) отбирают только активные чаты
+            blocked_ids = conn.execute(
+                update(models.User)
+                .where(models.User.telegram_id == chat_id, models.User.bot_chat_active.is_(True))
+                .values(bot_chat_active=False)
+                .returning(models.User.id)
+            ).scalars().all()
+    if blocked_ids:
+        from .deps import invalidate_user
+
+        for user_id in blocked_ids:
+            invalidate_user(user_id)
+    return values["status"]
+
+
+class OutboxSender:
+    """Фоновая отправка outbox. Один экземпляр на процесс, см. main.lifespan."""
+
+    def __init__(self) -> None:
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self.client: httpx.AsyncClient | None = None
+        self.limiter = RateLimiter(GLOBAL_RATE_PER_SECOND, PER_CHAT_INTERVAL_SECONDS)
+        self._leader_lock = FileLock("outbox")
+        # Итоги попыток этого процесса с запуска: sent, retried, failed (для /metrics)
+        self.counters: Counter = Counter()
+
+    def stats(self) -> dict[str, int]:
+        return {name: self.counters[name] for name in ("sent", "retried", "failed")}
+
+    def start(self) -> None:
+        if not BOT_TOKEN:
+            logger.warning("TELEGRAM_BOT_TOKEN not set, outbox sender disabled")
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.client = new_http_client()
+        self._task = asyncio.create_task(self._run(), name="outbox-sender")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._leader_lock.release()
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    def notify(self) -> None:
+        """Разбудить воркер. Можно вызывать из sync-хэндлеров (другой поток)."""
+        self._wake()
+        # Отправитель может жить в другом процессе
+        shared.state.broadcast("outbox", "")
+
+    def _wake(self, payload: str = "") -> None:
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self) -> None:
+        # Отправляет один процесс; остальные ждут, пока лидер не завершится
+        while not self._leader_lock.acquire(blocking=False):
+            await asyncio.sleep(OUTBOX_POLL_SECONDS)
+        logger.info("Outbox sender elected in this worker")
+
+        semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+        while True:
+            try:
+                batch = await asyncio.to_thread(_claim_batch, OUTBOX_BATCH_SIZE)
+            except Exception:
+                logger.exception("Outbox claim failed")
+                batch = []
+
+            if batch:
+                await asyncio.gather(*(self._deliver(semaphore, *row) for row in batch))
+                continue
+
+            self._wakeup.clear()
+            timeout = OUTBOX_POLL_SECONDS
+            try:
+                due_in = await asyncio.to_thread(_seconds_until_next_due)
+                if due_in is not None:
+                    timeout = min(timeout, due_in)
+            except Exception:
+                logger.exception("Outbox due check failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _deliver(
+        self,
+        semaphore: asyncio.Semaphore,
+        message_id: int,
+        chat_id: int,
+        method: str,
+        payload: str,
+        attempts: int,
+    ) -> None:
+        async with semaphore:
+            await self.limiter.acquire(chat_id)
+            result = await call_bot_api(self.client, method, json.loads(payload))
+        if result.retry_after:
+            self.limiter.penalize(result.retry_after)
+        if result.ok:
+            # На рассылках это сотни тысяч строк; итоги — в counters и отчёте reminders.py
+            logger.debug("Outbox message %s sent to chat_id=%s", message_id, chat_id)
+        else:
+            logger.warning(
+                "Outbox message %s to chat_id=%s failed (attempt %s): %s",
+                message_id, chat_id, attempts + 1, result.error,
+            )
+        try:
+            status = await asyncio.to_thread(_record_result, message_id, chat_id, attempts + 1, result)
+        except Exception:
+            logger.exception("Outbox result for message %s not recorded", message_id)
+            return
+        self.counters["retried" if status == "pending" else status] += 1
+
+
+sender = OutboxSender()
+shared.state.subscribe("outbox", sender._wake)
@@ -0,0 +1,103 @@
+"""
+Запись дневного прогресса одним оператором INSERT ... ON CONFLICT (uix_progress_day) DO UPDATE.
+
+Значение и completed считаются в SQL по текущей строке, поэтому параллельные дельты
+одного пользователя не теряются, а первая запись дня не падает на уникальном ключе.
+Итоговая строка возвращается через RETURNING — без отдельного SELECT.
+"""
+from datetime import date, datetime
+
+from sqlalchemy import Engine, case, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+_DIALECT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def check_dialect(engine: Engine) -> None:
+    """Вызывается из init_db: неподдерживаемая СУБД — ошибка при старте, а не на первой записи."""
+    _insert_for(engine.dialect.name)
+
+
+def dialect_insert(db: Session):
+    """insert() диалекта сессии — с on_conflict_do_update / on_conflict_do_nothing."""
+    return _insert_for(db.get_bind().dialect.name)
+
+
+def _insert_for(dialect: str):
+    try:
+        return _DIALECT_INSERTS[dialect]
+    except KeyError:
+        raise NotImplementedError(
+            f"Upsert is not supported for dialect {dialect!r}; supported: {', '.join(_DIALECT_INSERTS)}"
+        )
+
+
+def _non_negative(expr):
+    return case((expr < 0, 0), else_=expr)
+
+
+def upsert_daily_progress(
+    db: Session,
+    challenge_id: int,
+    user_id: int,
+    day: date,
+    delta: int | None = None,
+    set_value: int | None = None,
+    completed: bool | None = None,
+    daily_goal: int | None = None,
+) -> tuple[int, bool]:
+    """
+    Применяет изменение прогресса за день (семантика как у ProgressUpdate:
+    set_value важнее delta; completed без явного значения считается по daily_goal).
+    Возвращает (value, completed) после записи. Коммит — на стороне вызывающего.
+    """
+    dp = models.DailyProgress
+    insert = dialect_insert(db)
+
+    # Значение новой строки (если записи за день ещё нет)
+    if set_value is not None:
+        initial_value = max(0, set_value)
+    else:
+        initial_value = max(0, delta or 0)
+    if completed is not None:
+        initial_completed = completed
+    else:
+        initial_completed = bool(daily_goal and daily_goal > 0 and initial_value >= daily_goal)
+
+    now = datetime.utcnow()
+    stmt = insert(dp).values(
+        challenge_id=challenge_id,
+        user_id=user_id,
+        date=day,
+        value=initial_value,
+        completed=initial_completed,
+        updated_at=now,
+    )
+
+    # Значение существующей строки — из её текущего value, атомарно
+    if set_value is not None:
+        new_value = literal(max(0, set_value))
+    elif delta is not None:
+        new_value = _non_negative(dp.value + delta)
+    else:
+        new_value = dp.value
+    if completed is not None:
+        new_completed = literal(completed)
+    elif daily_goal and daily_goal > 0:
+        new_completed = new_value >= daily_goal
+    else:
+        new_completed = dp.completed
+
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[dp.challenge_id, dp.user_id, dp.date],
+        set_={"value": new_value, "completed": new_completed, "updated_at": now},
+    ).returning(dp.value, dp.completed)
+
+    value, is_completed = db.execute(stmt).one()
+    return value, bool(is_completed)
@@ -0,0 +1,308 @@
+"""
+Вечерние напоминания: тем, кто ещё не выполнил сегодняшний день.
+
+Каждый день в REMINDER_TIME (серверное время, как date.today() в хэндлерах) фоновый
+EveningReminders отбирает одним запросом участников идущих челленджей, у которых нет
+выполненного DailyProgress за сегодня и чат с ботом активен (bot_chat_active), — по
+одному сообщению на пользователя, сколько бы таких челленджей у него ни было.
+
+Получатели читаются страницами по REMINDER_BATCH_SIZE пользователей (keyset по
+user_id), и каждая страница одной вставкой уходит в outbox с batch «reminder:<дата>»:
+в памяти никогда не больше одной страницы, а отправку с лимитом Bot API (~30 в
+секунду), пулом соединений и повторами делает OutboxSender. Вместе со страницей
+пользователям пишется reminded_on, поэтому повторный запуск в тот же день (рестарт,
+второй воркер, ручной запуск) не шлёт напоминание дважды. Заблокировавшие бота
+(403) получают bot_chat_active = false и в следующие рассылки не попадают.
+
+Пока рассылка не разослана, раз в REMINDER_REPORT_SECONDS в лог пишется отчёт:
+отправлено/ошибки/в очереди и скорость доставки. Вручную (из каталога backend):
+
+    python -m app.reminders            # поставить в очередь сейчас
+    python -m app.reminders --report   # отчёт о сегодняшней рассылке
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time as timer
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import models, outbox, telegram_bot
+from .db import SessionLocal
+from .locks import FileLock
+
+logger = logging.getLogger(__name__)
+
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "true").lower() == "true"
+REMINDER_TIME = time.fromisoformat(os.getenv("REMINDER_TIME", "20:00"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "1000"))
+REMINDER_REPORT_SECONDS = float(os.getenv("REMINDER_REPORT_SECONDS", "60"))
+# Повтор после ошибки и опрос лидерства остальными воркерами
+REMINDER_RETRY_SECONDS = float(os.getenv("REMINDER_RETRY_SECONDS", "60"))
+
+
+def batch_name(day: date) -> str:
+    return f"reminder:{day.isoformat()}"
+
+
+def _pending_page(db: Session, today: date, after_user_id: int, limit: int) -> list:
+    """
+    Следующие limit получателей после after_user_id: (user_id, telegram_id,
+    число невыполненных челленджей, id первого из них).
+    """
+    cp = models.ChallengeParticipant
+    ch = models.Challenge
+    dp = models.DailyProgress
+    user = models.User
+    done_today = (
+        select(dp.id)
+        .where(
+            dp.challenge_id == cp.challenge_id,
+            dp.user_id == cp.user_id,
+            dp.date == today,
+            dp.completed.is_(True),
+        )
+        .exists()
+    )
+    return db.execute(
+        # telegram_id под min(): группировка только по cp.user_id (telegram_id у пользователя один)
+        select(cp.user_id, func.min(user.telegram_id), func.count(), func.min(cp.challenge_id))
+        .select_from(cp)
+        .join(user, user.id == cp.user_id)
+        .join(ch, ch.id == cp.challenge_id)
+        .where(
+            cp.user_id > after_user_id,
+            user.bot_chat_active.is_(True),
+            user.telegram_id != 0,
+            or_(user.reminded_on.is_(None), user.reminded_on < today),
+            ch.archived_at.is_(None),
+            ch.start_date <= today,
+            ch.end_date >= today,
+            ~done_today,
+        )
+        # Группы идут в порядке индекса ix_challenge_participants_user: LIMIT
+        # останавливает чтение на странице, а не после сортировки всего остатка
+        .group_by(cp.user_id)
+        .order_by(cp.user_id)
+        .limit(limit)
+    ).all()
+
+
+def enqueue_reminders(db: Session, today: date) -> int:
+    """Ставит напоминания за today в outbox страницами, каждая — своя транзакция. Возвращает их число."""
+    ch = models.Challenge
+    user = models.User
+    batch = batch_name(today)
+    after = 0
+    total = 0
+    while True:
+        page = _pending_page(db, today, after, REMINDER_BATCH_SIZE)
+        if not page:
+            break
+        challenges = {
+            row.id: row
+            for row in db.execute(
+                select(ch.id, ch.title, ch.invite_code).where(ch.id.in_({row[3] for row in page}))
+            )
+        }
+        outbox.enqueue_batch(
+            db,
+            batch,
+            [
+                (
+                    chat_id,
+                    telegram_bot.reminder_payload(
+                        chat_id,
+                        challenges[challenge_id].title,
+                        challenges[challenge_id].invite_code,
+                        pending,
+                    ),
+                )
+                for _, chat_id, pending, challenge_id in page
+            ],
+        )
+        # Служебная отметка не считается изменением пользователя (updated_at — для выгрузки)
+        db.execute(
+            update(user)
+            .where(user.id.in_([row[0] for row in page]))
+            .values(reminded_on=today, updated_at=user.updated_at)
+        )
+        db.commit()
+        # Отправка начинается, пока следующие страницы ещё отбираются
+        outbox.sender.notify()
+        total += len(page)
+        after = page[-1][0]
+    return total
+
+
+def delivery_report(db: Session, day: date) -> dict:
+    """Состояние рассылки за day: отправлено, ошибки, в очереди, скорость и частые ошибки."""
+    ob = models.OutboundMessage
+    batch = batch_name(day)
+    counts: dict[str, int] = {}
+    started = finished = None
+    for status, count, first_created, last_sent in db.execute(
+        select(ob.status, func.count(), func.min(ob.created_at), func.max(ob.sent_at))
+        .where(ob.batch == batch)
+        .group_by(ob.status)
+    ):
+        counts[status] = count
+        started = min(filter(None, (started, first_created)), default=None)
+        finished = max(filter(None, (finished, last_sent)), default=None)
+
+    errors = db.execute(
+        select(ob.last_error, func.count())
+        .where(ob.batch == batch, ob.status == "failed")
+        .group_by(ob.last_error)
+        .order_by(func.count().desc())
+        .limit(5)
+    ).all()
+
+    sent = counts.get("sent", 0)
+    seconds = (finished - started).total_seconds() if started and finished else 0.0
+    return {
+        "batch": batch,
+        "total": sum(counts.values()),
+        "sent": sent,
+        "failed": counts.get("failed", 0),
+        "queued": counts.get("pending", 0) + counts.get("sending", 0),
+        "seconds": seconds,
+        "per_second": sent / seconds if seconds > 0 else 0.0,
+        "errors": [{"error": error, "count": count} for error, count in errors],
+    }
+
+
+def run_once(today: date | None = None) -> int:
+    today = today or date.today()
+    started = timer.perf_counter()
+    db = SessionLocal()
+    try:
+        total = enqueue_reminders(db, today)
+    finally:
+        db.close()
+    if total:
+        logger.info(
+            "Evening reminders for %s: %s queued in %.1fs", today, total, timer.perf_counter() - started
+        )
+    return total
+
+
+def report_once(day: date | None = None) -> dict:
+    db = SessionLocal()
+    try:
+        return delivery_report(db, day or date.today())
+    finally:
+        db.close()
+
+
+def _log_report(report: dict) -> None:
+    logger.info(
+        "Evening reminders %s: %s/%s sent, %s failed, %s queued, %.1f msg/s",
+        report["batch"],
+        report["sent"],
+        report["total"],
+        report["failed"],
+        report["queued"],
+        report["per_second"],
+    )
+    for error in report["errors"]:
+        logger.warning("Evening reminders %s: %sx %s", report["batch"], error["count"], error["error"])
+
+
+def seconds_until_reminder(now: datetime | None = None) -> float:
+    now = now or datetime.now()
+    at = datetime.combine(now.date(), REMINDER_TIME)
+    if at <= now:
+        at += timedelta(days=1)
+    return (at - now).total_seconds()
+
+
+class EveningReminders:
+    """Фоновая рассылка напоминаний. Один экземпляр на процесс, см. main.lifespan."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+        self._leader_lock = FileLock("reminders")
+
+    def start(self) -> None:
+        if not REMINDERS_ENABLED:
+            logger.warning("REMINDERS_ENABLED=false, evening reminders disabled")
+            return
+        if not outbox.BOT_TOKEN or not telegram_bot.BOT_USERNAME:
+            logger.warning("BOT_TOKEN or BOT_USERNAME not set, evening reminders disabled")
+            return
+        self._task = asyncio.create_task(self._run(), name="evening-reminders")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._leader_lock.release()
+
+    async def _run(self) -> None:
+        while not self._leader_lock.acquire(blocking=False):
+            await asyncio.sleep(REMINDER_RETRY_SECONDS)
+        logger.info("Evening reminders elected in this worker")
+
+        while True:
+            # Запуск после REMINDER_TIME (рестарт вечером) догоняет тех, кому сегодня ещё не писали
+            today = date.today()
+            if datetime.now().time() >= REMINDER_TIME:
+                try:
+                    total = await asyncio.to_thread(run_once, today)
+                except Exception:
+                    logger.exception("Evening reminders failed")
+                    await asyncio.sleep(REMINDER_RETRY_SECONDS)
+                    continue
+                if total:
+                    await self._follow(today)
+            await asyncio.sleep(seconds_until_reminder())
+
+    async def _follow(self, day: date) -> None:
+        """Отчёт о доставке, пока рассылка не разослана (или не кончился день)."""
+        while True:
+            await asyncio.sleep(REMINDER_REPORT_SECONDS)
+            try:
+                report = await asyncio.to_thread(report_once, day)
+            except Exception:
+                logger.exception("Evening reminders report failed")
+                continue
+            _log_report(report)
+            if not report["queued"] or date.today() != day:
+                return
+
+
+reminders = EveningReminders()
+
+
+def main() -> None:
+    from .db import init_db
+
+    parser = argparse.ArgumentParser(description="Вечерние напоминания тем, кто не отметился сегодня")
+    parser.add_argument("--report", action="store_true", help="только отчёт о сегодняшней рассылке")
+    args = parser.parse_args()
+
+    if not args.report and not telegram_bot.BOT_USERNAME:
+        parser.error("TELEGRAM_BOT_USERNAME not set: reminder buttons need the bot username")
+
+    init_db()
+    if not args.report:
+        print(f"Queued {run_once()} reminders")
+    report = report_once()
+    print(
+        f"{report['batch']}: {report['sent']}/{report['total']} sent, {report['failed']} failed, "
+        f"{report['queued']} queued, {report['per_second']:.1f} msg/s"
+    )
+    for error in report["errors"]:
+        print(f"  {error['count']}x {error['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Кэш готовых JSON-ответов читающих эндпоинтов: список челленджей, детали, статистика.
+
+Ключ — (эндпоинт, challenge_id, зритель, дата, параметры): ответы зависят от зрителя
+(свой прогресс, is_owner, last_nudge_at) и от даты («за сегодня», серии). С наступлением
+новой даты кэш сбрасывается целиком — вчерашние ответы больше не нужны.
+
+Записи сбрасываются сразу после коммита пишущих хэндлеров:
+  invalidate_challenge — прогресс, вступление, удаление участника, nudge, сообщения,
+    удаление челленджа, смена имени участника;
+  invalidate_viewer — в списке пользователя появился новый челлендж (создание, вступление).
+Инвалидации рассылаются остальным воркерам через shared.state.
+
+Размер ограничен RESPONSE_CACHE_MAX_BYTES (0 — кэш выключен); статистика попаданий
+и вытеснений — stats() и GET /metrics/cache.
+"""
+import os
+from datetime import date
+
+from . import shared
+from .cache import ResponseCache
+
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Теги записей
+ALL_CHALLENGES = ("all",)  # списки суперадмина, где видны все челленджи
+
+cache: ResponseCache[tuple, object] = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
+_day = date.today()
+_rollovers = 0
+
+
+def _check_day() -> date:
+    global _day, _rollovers
+    today = date.today()
+    if today != _day:
+        _day = today
+        _rollovers += 1
+        cache.clear()
+    return today
+
+
+def enabled() -> bool:
+    return RESPONSE_CACHE_MAX_BYTES > 0
+
+
+def key(endpoint: str, challenge_id: int | None, viewer_id: int, *params) -> tuple:
+    return (endpoint, challenge_id, viewer_id, _check_day(), *params)
+
+
+def get(key: tuple):
+    if not enabled():
+        return None
+    return cache.get(key)
+
+
+def token() -> int:
+    return cache.token()
+
+
+def put(key: tuple, value, size: int, tags: tuple, token: int) -> None:
+    """token — значение token(), взятое до чтения данных из БД."""
+    if enabled():
+        cache.set(key, value, size, tags, token)
+
+
+def challenge_tag(challenge_id: int) -> tuple:
+    return ("challenge", challenge_id)
+
+
+def viewer_tag(user_id: int) -> tuple:
+    return ("viewer", user_id)
+
+
+def invalidate_challenge(challenge_id: int) -> None:
+    """Вызывать после коммита любой записи, меняющей ответы по челленджу."""
+    cache.invalidate(challenge_tag(challenge_id))
+    shared.state.broadcast("response_cache", f"challenge:{challenge_id}")
+
+
+def invalidate_viewer(user_id: int) -> None:
+    """Изменился набор челленджей пользователя (создал, вступил)."""
+    cache.invalidate(viewer_tag(user_id))
+    cache.invalidate(ALL_CHALLENGES)
+    shared.state.broadcast("response_cache", f"viewer:{user_id}")
+
+
+def _on_invalidated(payload: str) -> None:
+    kind, _, raw_id = payload.partition(":")
+    if kind == "challenge":
+        cache.invalidate(challenge_tag(int(raw_id)))
+    elif kind == "viewer":
+        cache.invalidate(viewer_tag(int(raw_id)))
+        cache.invalidate(ALL_CHALLENGES)
+
+
+shared.state.subscribe("response_cache", _on_invalidated)
+shared.state.on_resync(cache.clear)
+
+
+def stats() -> dict:
+    return {**cache.stats(), "rollovers": _rollovers}
@@ -0,0 +1,248 @@
+"""
+Смена дня: итоги закрытых дней, финализация серий и архивация завершённых челленджей.
+
+В начале каждого дня (по тем же серверным суткам, что и date.today() в хэндлерах)
+фоновый DayRollover закрывает вчерашний день всех идущих челленджей:
+
+  - для каждого участника пишет строку daily_summaries: значение, процент и выполнен
+    ли день (пропуск — строка с нулями), так что статистика читает готовые строки, а
+    не пересчитывает историю по календарю;
+  - обнуляет streak_current тем, у кого серия прервалась (streak_best уже актуален);
+  - челлендж, чей end_date закрыт, помечает archived_at и дальше не обходит.
+
+Закрытые дни отмечаются в challenges.summarized_through, поэтому пропущенные смены
+дня (сервер был выключен, первый запуск на старой базе) догоняются при старте.
+Прошлые дни можно править из истории — тогда строка итога перезаписывается
+(write_summary из хэндлеров прогресса), и статистика остаётся точной.
+
+При нескольких воркерах смену дня выполняет один (FileLock("rollover")). Вручную:
+
+    python -m app.rollover
+"""
+import asyncio
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .db import SessionLocal
+from .locks import FileLock
+from .progress import dialect_insert
+
+logger = logging.getLogger(__name__)
+
+ROLLOVER_ENABLED = os.getenv("ROLLOVER_ENABLED", "true").lower() == "true"
+# Пауза после полуночи перед закрытием дня
+ROLLOVER_DELAY_SECONDS = float(os.getenv("ROLLOVER_DELAY_SECONDS", "5"))
+# Повтор после ошибки и опрос лидерства остальными воркерами
+ROLLOVER_RETRY_SECONDS = float(os.getenv("ROLLOVER_RETRY_SECONDS", "60"))
+
+_ONE_DAY = timedelta(days=1)
+
+
+def day_percent(value: int, completed: bool, daily_goal: int | None) -> float:
+    """Процент выполнения дня — как в статистике (GET /challenges/{id}/stats)."""
+    if daily_goal and daily_goal > 0:
+        return min(100.0, value / daily_goal * 100.0)
+    return 100.0 if completed else 0.0
+
+
+def write_summary(
+    db: Session,
+    challenge_id: int,
+    user_id: int,
+    day: date,
+    value: int,
+    completed: bool,
+    daily_goal: int | None,
+) -> None:
+    """Перезаписать итог уже закрытого дня после правки прогресса. Коммит — на стороне вызывающего."""
+    ds = models.DailySummary
+    percent = day_percent(value, completed, daily_goal)
+    stmt = dialect_insert(db)(ds).values(
+        challenge_id=challenge_id,
+        user_id=user_id,
+        date=day,
+        value=value,
+        percent=percent,
+        completed=completed,
+    )
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[ds.challenge_id, ds.user_id, ds.date],
+            set_={"value": value, "percent": percent, "completed": completed},
+        )
+    )
+
+
+def _summarize_day(db: Session, challenge_id: int, daily_goal: int | None, day: date) -> int:
+    cp = models.ChallengeParticipant
+    dp = models.DailyProgress
+    rows = db.execute(
+        select(cp.user_id, dp.value, dp.completed)
+        .select_from(cp)
+        .outerjoin(
+            dp,
+            and_(dp.challenge_id == cp.challenge_id, dp.user_id == cp.user_id, dp.date == day),
+        )
+        .where(cp.challenge_id == challenge_id)
+    ).all()
+    if not rows:
+        return 0
+    summaries = []
+    for user_id, value, completed in rows:
+        value = value or 0
+        completed = bool(completed)
+        summaries.append(
+            {
+                "challenge_id": challenge_id,
+                "user_id": user_id,
+                "date": day,
+                "value": value,
+                "percent": day_percent(value, completed, daily_goal),
+                "completed": completed,
+            }
+        )
+    ds = models.DailySummary
+    # Строка могла появиться раньше — из правки этого дня (write_summary); она актуальнее
+    db.execute(
+        dialect_insert(db)(ds).on_conflict_do_nothing(
+            index_elements=[ds.challenge_id, ds.user_id, ds.date]
+        ),
+        summaries,
+    )
+    return len(summaries)
+
+
+def close_days(db: Session, today: date) -> dict:
+    """
+    Закрывает все дни до вчерашнего включительно, которые ещё не закрыты.
+    Каждый челлендж — своя транзакция. Возвращает счётчики для лога.
+    """
+    closed = today - _ONE_DAY
+    ch = models.Challenge
+    cp = models.ChallengeParticipant
+    pending = db.execute(
+        select(ch.id, ch.daily_goal, ch.start_date, ch.end_date, ch.summarized_through)
+        .where(ch.archived_at.is_(None), ch.start_date <= closed)
+        .order_by(ch.id)
+    ).all()
+
+    totals = {"challenges": 0, "days": 0, "summaries": 0, "archived": 0}
+    for challenge_id, daily_goal, start_date, end_date, summarized_through in pending:
+        first = summarized_through + _ONE_DAY if summarized_through else start_date
+        last = min(end_date, closed)
+        day = first
+        while day <= last:
+            totals["summaries"] += _summarize_day(db, challenge_id, daily_goal, day)
+            totals["days"] += 1
+            day += _ONE_DAY
+
+        values = {}
+        if last >= first:
+            values["summarized_through"] = last
+        if end_date <= closed:
+            values["archived_at"] = datetime.utcnow()
+            totals["archived"] += 1
+        elif values:
+            # Служебная отметка не считается изменением челленджа (updated_at — для выгрузки)
+            values["updated_at"] = ch.updated_at
+        if values:
+            db.execute(update(ch).where(ch.id == challenge_id).values(**values))
+
+        # Серия, не продолженная вчера, прервалась: фиксируем это в строке участника
+        db.execute(
+            update(cp)
+            .where(
+                cp.challenge_id == challenge_id,
+                cp.streak_current != 0,
+                or_(cp.streak_last_date.is_(None), cp.streak_last_date < closed),
+            )
+            .values(streak_current=0)
+        )
+        db.commit()
+        totals["challenges"] += 1
+    return totals
+
+
+def run_once(today: date | None = None) -> dict:
+    db = SessionLocal()
+    try:
+        totals = close_days(db, today or date.today())
+    finally:
+        db.close()
+    if totals["days"] or totals["archived"]:
+        logger.info(
+            "Day rollover: %s days closed in %s challenges, %s summaries, %s archived",
+            totals["days"],
+            totals["challenges"],
+            totals["summaries"],
+            totals["archived"],
+        )
+    return totals
+
+
+def seconds_until_next_day(now: datetime | None = None) -> float:
+    now = now or datetime.now()
+    next_day = datetime.combine(now.date() + _ONE_DAY, time.min)
+    return (next_day - now).total_seconds() + ROLLOVER_DELAY_SECONDS
+
+
+class DayRollover:
+    """Фоновая смена дня. Один экземпляр на процесс, см. main.lifespan."""
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+        self._leader_lock = FileLock("rollover")
+
+    def start(self) -> None:
+        if not ROLLOVER_ENABLED:
+            logger.warning("ROLLOVER_ENABLED=false, day rollover disabled")
+            return
+        self._task = asyncio.create_task(self._run(), name="day-rollover")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._leader_lock.release()
+
+    async def _run(self) -> None:
+        while not self._leader_lock.acquire(blocking=False):
+            await asyncio.sleep(ROLLOVER_RETRY_SECONDS)
+        logger.info("Day rollover elected in this worker")
+
+        while True:
+            # Сначала догоняем пропущенные дни, затем ждём следующей полуночи
+            try:
+                await asyncio.to_thread(run_once)
+            except Exception:
+                logger.exception("Day rollover failed")
+                await asyncio.sleep(ROLLOVER_RETRY_SECONDS)
+                continue
+            await asyncio.sleep(seconds_until_next_day())
+
+
+roller = DayRollover()
+
+
+def main() -> None:
+    from .db import init_db
+
+    init_db()
+    totals = run_once()
+    print(
+        f"Closed {totals['days']} days in {totals['challenges']} challenges "
+        f"({totals['summaries']} summaries, {totals['archived']} archived)"
+    )
+
+
+if __name__ == "__main__":
+    main()
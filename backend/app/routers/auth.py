@@ -1,30 +1,29 @@
 from datetime import datetime, timedelta
 import hashlib
 import hmac
+import logging
 import os
 import time
 import re
 from urllib.parse import parse_qsl, unquote
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from jose import jwt
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 
 from .. import models, schemas
-from ..db import SessionLocal
-from ..deps import SECRET_KEY, ALGORITHM
+from ..db import DbRunner
+from ..deps import SECRET_KEY, ALGORITHM, get_db, invalidate_user
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 
 
-def _get_db() -> Session:
-    return SessionLocal()
-
-
 def _validate_init_data(init_data: str) -> dict:
     """
     Валидация initData по алгоритму Telegram WebApp.
@@ -41,7 +40,7 @@ def _validate_init_data(init_data: str) -> dict:
     )
     
     if skip_validation:
-        print("WARNING: Skipping init_data signature validation")
+        logger.warning("Skipping init_data signature validation")
         data = dict(parse_qsl(init_data, keep_blank_values=True))
         # Базовая проверка auth_date (опционально)
         auth_date_str = data.get("auth_date")
@@ -50,7 +49,7 @@ def _validate_init_data(init_data: str) -> dict:
                 auth_date = int(auth_date_str)
                 now = int(time.time())
                 if now - auth_date > 86400 * 7:  # Не старше недели
-                    print(f"WARNING: init_data is very old (auth_date: {auth_date}, now: {now})")
+                    logger.warning("init_data is very old (auth_date: %s, now: %s)", auth_date, now)
             except (ValueError, TypeError):
                 pass
         return data
@@ -78,14 +77,6 @@ def _validate_init_data(init_data: str) -> dict:
     # Сортируем по ключу и формируем строку для проверки
     pairs.sort(key=lambda x: x[0])
     data_check_string = '\n'.join(f"{k}={v}" for k, v in pairs)
-    
-    print(f"Pairs count: {len(pairs)}, keys: {[k for k, _ in pairs]}")
-    print(f"User value preview: {pairs[2][1][:50] if len(pairs) > 2 else 'N/A'}...")
-    
-    # Логируем для отладки
-    print(f"Data check string preview: {data_check_string[:200]}...")
-    print(f"Hash received: {hash_received[:16]}...")
-    print(f"Data keys: {sorted(data.keys())}")
 
     # По документации Telegram:
     # secret_key = SHA256(bot_token) - просто SHA256, не HMAC!
@@ -97,25 +88,26 @@ def _validate_init_data(init_data: str) -> dict:
         msg=data_check_string.encode(),
         digestmod=hashlib.sha256
     ).hexdigest()
-    
-    print(f"Calculated hash: {h[:16]}..., received: {hash_received[:16]}...")
 
     if h != hash_received:
         # Логируем для отладки (без чувствительных данных)
-        print(f"Validation failed: expected {h[:16]}..., got {hash_received[:16]}...")
-        print(f"Data check string length: {len(data_check_string)}")
-        print(f"BOT_TOKEN present: {bool(BOT_TOKEN)}")
-        print(f"BOT_TOKEN length: {len(BOT_TOKEN) if BOT_TOKEN else 0}")
-        print(f"BOT_TOKEN starts with: {BOT_TOKEN[:10] if BOT_TOKEN else 'N/A'}...")
-        print(f"Data keys: {list(data.keys())}")
-        
+        logger.warning(
+            "init_data signature mismatch: keys=%s, data_check_string length=%s",
+            sorted(data.keys()),
+            len(data_check_string),
+        )
+
         # Проверяем, может быть токен неправильный - пробуем получить информацию о боте
         try:
             import requests
             bot_info = requests.get(f"https://api.telegram.org/bot{BOT_TOKEN}/getMe", timeout=2).json()
-            print(f"Bot info check: {bot_info.get('ok', False)}, username: {bot_info.get('result', {}).get('username', 'N/A')}")
+            logger.warning(
+                "Bot info check: ok=%s, username=%s",
+                bot_info.get("ok", False),
+                bot_info.get("result", {}).get("username", "N/A"),
+            )
         except Exception as e:
-            print(f"Bot info check failed: {e}")
+            logger.warning("Bot info check failed: %s", e)
         
         raise HTTPException(
             status_code=401, 
@@ -140,18 +132,16 @@ def _validate_init_data(init_data: str) -> dict:
 
 
 @router.post("/telegram", response_model=schemas.AuthResponse)
-def auth_telegram(payload: schemas.AuthRequest) -> schemas.AuthResponse:
-    import logging
-    logger = logging.getLogger(__name__)
-    
+async def auth_telegram(
+    payload: schemas.AuthRequest,
+    db: DbRunner = Depends(get_db),
+) -> schemas.AuthResponse:
     init_data = payload.init_data
-    logger.info(f"Auth request received, init_data length: {len(init_data) if init_data else 0}")
-    logger.info(f"BOT_TOKEN configured: {bool(BOT_TOKEN)}")
-    
     try:
-        data = _validate_init_data(init_data)
+        # При неверной подписи валидация ходит в Bot API синхронно — не в event loop
+        data = await run_in_threadpool(_validate_init_data, init_data)
     except HTTPException as e:
-        logger.error(f"Validation failed: {e.detail}")
+        logger.warning("Validation failed: %s", e.detail)
         raise
 
     # user и start_param лежат в JSON-строке внутри полей
@@ -173,59 +163,71 @@ def auth_telegram(payload: schemas.AuthRequest) -> schemas.AuthResponse:
         username = None
         display_name = "User 1"
 
-    db = _get_db()
-    invite_challenge_dto: schemas.ChallengeShort | None = None
+    return await db.run(
+        _login_user,
+        tg_id=tg_id,
+        username=username,
+        display_name=display_name,
+        start_param=start_param,
+    )
 
-    try:
-        user = db.query(models.User).filter_by(telegram_id=tg_id).first()
-        if not user:
-            user = models.User(
-                telegram_id=tg_id,
-                username=username,
-                display_name=display_name,
-            )
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-        else:
-            # обновим имя/username по свежим данным
-            user.username = username
-            if not user.display_name:
-                user.display_name = display_name
-            db.add(user)
-            db.commit()
-
-        # Если есть start_param — это наш invite_code
-        if start_param:
-            ch = db.query(models.Challenge).filter_by(invite_code=start_param).first()
-            if ch:
-                invite_challenge_dto = schemas.ChallengeShort(
-                    id=ch.id,
-                    title=ch.title,
-                    goal_type=ch.goal_type,
-                    unit=ch.unit,
-                    daily_goal=ch.daily_goal,
-                    duration_days=ch.duration_days,
-                    start_date=ch.start_date,
-                    end_date=ch.end_date,
-                )
 
-        # Генерируем JWT
-        expire = datetime.utcnow() + timedelta(days=30)
-        to_encode = {"sub": user.id, "exp": expire}
-        token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-
-        user_me = schemas.UserMe(
-            id=user.id,
-            telegram_id=user.telegram_id,
-            username=user.username,
-            display_name=user.display_name,
-            bot_chat_active=user.bot_chat_active,
-            created_at=user.created_at,
-            updated_at=user.updated_at,
+def _login_user(
+    tg_id: int,
+    username: str | None,
+    display_name: str,
+    start_param: str | None,
+    db: Session,
+) -> schemas.AuthResponse:
+    invite_challenge_dto: schemas.ChallengeShort | None = None
+
+    user = db.query(models.User).filter_by(telegram_id=tg_id).first()
+    if not user:
+        user = models.User(
+            telegram_id=tg_id,
+            username=username,
+            display_name=display_name,
         )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    else:
+        # обновим имя/username по свежим данным
+        user.username = username
+        if not user.display_name:
+            user.display_name = display_name
+        db.add(user)
+        db.commit()
+        invalidate_user(user.id)
+
+    # Если есть start_param — это наш invite_code
+    if start_param:
+        ch = db.query(models.Challenge).filter_by(invite_code=start_param).first()
+        if ch:
+            invite_challenge_dto = schemas.ChallengeShort(
+                id=ch.id,
+                title=ch.title,
+                goal_type=ch.goal_type,
+                unit=ch.unit,
+                daily_goal=ch.daily_goal,
+                duration_days=ch.duration_days,
+                start_date=ch.start_date,
+                end_date=ch.end_date,
+            )
 
-        return schemas.AuthResponse(token=token, user=user_me, invite_challenge=invite_challenge_dto)
-    finally:
-        db.close()
+    # Генерируем JWT
+    expire = datetime.utcnow() + timedelta(days=30)
+    to_encode = {"sub": user.id, "exp": expire}
+    token = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+    user_me = schemas.UserMe(
+        id=user.id,
+        telegram_id=user.telegram_id,
+        username=user.username,
+        display_name=user.display_name,
+        bot_chat_active=user.bot_chat_active,
+        created_at=user.created_at,
+        updated_at=user.updated_at,
+    )
 
+    return schemas.AuthResponse(token=token, user=user_me, invite_challenge=invite_challenge_dto)
@@ -1,117 +1,161 @@
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
+import logging
 from typing import List
 
 from zoneinfo import ZoneInfo
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import func, case
-from sqlalchemy.orm import Session, joinedload
-
-from .. import models, schemas, telegram_bot
-from ..deps import get_current_user, get_db, is_superadmin
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import DateTime, and_, func, literal, or_, tuple_
+from sqlalchemy.orm import Session, aliased
+
+from .. import (
+    aggregates,
+    events,
+    export,
+    leaderboard,
+    models,
+    outbox,
+    progress,
+    response_cache,
+    rollover,
+    schemas,
+    serialization,
+    telegram_bot,
+    versions,
+)
+from ..db import DbRunner, SessionLocal
+from ..deps import (
+    EVENTS_TICKET_TTL_SECONDS,
+    create_events_ticket,
+    events_ticket_user_id,
+    get_current_user,
+    get_db,
+    is_superadmin,
+)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
-def _challenge_short_for(
+def _challenge_short(
     ch: models.Challenge,
-    db: Session,
-    current_user: models.User,
     is_participant: bool,
-) -> schemas.ChallengeShort:
-    today = date.today()
+    today_value: int | None,
+    days_completed: int | None,
+) -> dict:
+    """Элемент списка в форме schemas.ChallengeShort."""
     if not is_participant:
-        return schemas.ChallengeShort(
-            id=ch.id,
-            title=ch.title,
-            description=ch.description,
-            goal_type=ch.goal_type,
-            unit=ch.unit,
-            daily_goal=ch.daily_goal,
-            duration_days=ch.duration_days,
-            start_date=ch.start_date,
-            end_date=ch.end_date,
-            today_progress_value=None,
-            today_progress_percent=None,
-            days_completed=None,
-        )
-    dp = (
-        db.query(models.DailyProgress)
-        .filter_by(
-            challenge_id=ch.id,
-            user_id=current_user.id,
-            date=today,
+        today_value = None
+        percent = None
+        days_completed = None
+    else:
+        today_value = today_value or 0
+        days_completed = days_completed or 0
+        percent = (
+            (today_value / ch.daily_goal * 100.0)
+            if ch.daily_goal and ch.daily_goal > 0
+            else None
         )
-        .first()
+    return {
+        "id": ch.id,
+        "title": ch.title,
+        "description": ch.description,
+        "goal_type": ch.goal_type,
+        "unit": ch.unit,
+        "daily_goal": ch.daily_goal,
+        "duration_days": ch.duration_days,
+        "start_date": ch.start_date,
+        "end_date": ch.end_date,
+        "today_progress_value": today_value,
+        "today_progress_percent": percent,
+        "days_completed": days_completed,
+    }
+
+
+def _list_challenge_shorts(
+    db: Session,
+    current_user: models.User,
+    include_all: bool,
+) -> list[dict]:
+    """
+    Список челленджей одним запросом: участие (с агрегатом выполненных дней)
+    и прогресс за сегодня подтягиваются join'ами, без запросов на каждый челлендж.
+    include_all=True (суперадмин) — все челленджи, в т.ч. где пользователь не участник.
+    """
+    today = date.today()
+    today_dp = aliased(models.DailyProgress)
+    membership = and_(
+        models.ChallengeParticipant.challenge_id == models.Challenge.id,
+        models.ChallengeParticipant.user_id == current_user.id,
     )
-    value = dp.value if dp else 0
-    percent = (
-        (value / ch.daily_goal * 100.0)
-        if ch.daily_goal and ch.daily_goal > 0
-        else None
+    q = db.query(
+        models.Challenge,
+        models.ChallengeParticipant.id,
+        today_dp.value,
+        models.ChallengeParticipant.completed_days,
     )
-    days_completed = (
-        db.query(func.count(models.DailyProgress.id))
-        .filter_by(
-            challenge_id=ch.id,
-            user_id=current_user.id,
-            completed=True,
+    if include_all:
+        q = q.outerjoin(models.ChallengeParticipant, membership)
+    else:
+        q = q.join(models.ChallengeParticipant, membership)
+    rows = (
+        q.outerjoin(
+            today_dp,
+            and_(
+                today_dp.challenge_id == models.Challenge.id,
+                today_dp.user_id == current_user.id,
+                today_dp.date == today,
+            ),
         )
-        .scalar()
-    )
-    return schemas.ChallengeShort(
-        id=ch.id,
-        title=ch.title,
-        description=ch.description,
-        goal_type=ch.goal_type,
-        unit=ch.unit,
-        daily_goal=ch.daily_goal,
-        duration_days=ch.duration_days,
-        start_date=ch.start_date,
-        end_date=ch.end_date,
-        today_progress_value=value,
-        today_progress_percent=percent,
-        days_completed=days_completed,
+        .order_by(models.Challenge.id)
+        .all()
     )
+    return [
+        _challenge_short(
+            ch,
+            is_participant=participant_id is not None,
+            today_value=today_value,
+            days_completed=days_completed,
+        )
+        for ch, participant_id, today_value, days_completed in rows
+    ]
 
 
 @router.get("", response_model=List[schemas.ChallengeShort])
-def list_my_challenges(
-    db: Session = Depends(get_db),
+async def list_my_challenges(
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+    db: DbRunner = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-) -> list[schemas.ChallengeShort]:
-    if is_superadmin(current_user):
-        # Суперадмин видит все челленджи
-        challenges = db.query(models.Challenge).all()
-        participant_challenge_ids = {
-            row[0]
-            for row in db.query(models.ChallengeParticipant.challenge_id)
-            .filter(models.ChallengeParticipant.user_id == current_user.id)
-            .all()
-        }
-        return [
-            _challenge_short_for(
-                ch, db, current_user,
-                is_participant=(ch.id in participant_challenge_ids),
-            )
-            for ch in challenges
-        ]
-    # Обычный пользователь: только челленджи, где участник
-    q = (
-        db.query(models.Challenge)
-        .join(models.ChallengeParticipant)
-        .filter(models.ChallengeParticipant.user_id == current_user.id)
-    )
-    challenges = q.all()
-    return [_challenge_short_for(ch, db, current_user, True) for ch in challenges]
+) -> Response:
+    cache_key = response_cache.key("list", None, current_user.id)
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        token = response_cache.token()
+        # Суперадмин видит все челленджи, обычный пользователь — только те, где участник
+        include_all = is_superadmin(current_user)
+        shorts = await db.run(
+            _list_challenge_shorts,
+            current_user=current_user,
+            include_all=include_all,
+        )
+        body = serialization.dumps(shorts)
+        tags = (
+            response_cache.viewer_tag(current_user.id),
+            *(response_cache.challenge_tag(s["id"]) for s in shorts),
+        )
+        if include_all:
+            tags += (response_cache.ALL_CHALLENGES,)
+        cached = (body, serialization.body_etag(body))
+        response_cache.put(cache_key, cached, len(body), tags, token)
+    return _conditional_json(*cached, if_none_match)
 
 
-@router.post("", response_model=schemas.ChallengeDetail)
-def create_challenge(
+def _create_challenge(
     payload: schemas.ChallengeCreate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
-) -> schemas.ChallengeDetail:
+    db: Session,
+    current_user: models.User,
+) -> dict:
     end_date = payload.start_date + timedelta(days=payload.duration_days - 1)
 
     # Простой invite_code
@@ -143,9 +187,20 @@ def create_challenge(
     )
     db.add(participant)
     db.commit()
+    response_cache.invalidate_viewer(current_user.id)
     db.refresh(challenge)
 
-    return get_challenge(challenge.id, db, current_user)
+    return _get_challenge_impl(challenge.id, db, current_user)
+
+
+@router.post("", response_model=schemas.ChallengeDetail)
+async def create_challenge(
+    payload: schemas.ChallengeCreate,
+    db: DbRunner = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+) -> Response:
+    detail = await db.run(_create_challenge, payload=payload, current_user=current_user)
+    return serialization.json_response(detail)
 
 
 def _require_participant(
@@ -163,126 +218,362 @@ def _require_participant(
     return participant
 
 
+def _get_challenge(
+    challenge_id: int,
+    since: int | None,
+    since_day: date | None,
+    if_none_match: str | None,
+    db: Session,
+    current_user: models.User,
+) -> tuple[dict | None, dict[str, str]]:
+    """Детали и заголовки ответа; None вместо деталей — клиентская копия актуальна (304)."""
+    ch = db.get(models.Challenge, challenge_id)
+    if not ch:
+        raise HTTPException(status_code=404, detail="Challenge not found")
+    today = date.today()
+    if since_day != today:
+        # После полуночи у всех участников сменились значения «за сегодня» и серии,
+        # а их версии — нет: дельта от вчерашней версии была бы пустой. Отдаём полный список
+        since = None
+    etag = versions.detail_etag(ch.version, today, current_user.id, since)
+    # Клиент всегда перепроверяет ответ по ETag; без изменений — 304 без сборки деталей
+    headers = _revalidate_headers(etag)
+    if _etag_matches(etag, if_none_match):
+        return None, headers
+    return _get_challenge_impl(challenge_id, db, current_user, since=since), headers
+
+
+def _revalidate_headers(etag: str) -> dict[str, str]:
+    # Персональные данные: хранит только клиент и каждый раз перепроверяет по ETag
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def _etag_matches(etag: str, if_none_match: str | None) -> bool:
+    return bool(if_none_match) and etag in [t.strip() for t in if_none_match.split(",")]
+
+
+def _conditional_json(body: bytes, etag: str, if_none_match: str | None) -> Response:
+    """Готовый JSON с ETag; клиентская копия актуальна — 304 без тела."""
+    if _etag_matches(etag, if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=_revalidate_headers(etag))
+    return serialization.raw_json_response(body, _revalidate_headers(etag))
+
+
+def _stream_export(records, fmt: str, **kwargs):
+    # Своя сессия: сессия запроса (get_db) закрывается раньше, чем дочитан поток.
+    # Генератор sync — Starlette читает его в threadpool, event loop не блокируется.
+    db = SessionLocal()
+    try:
+        yield from export.encode(records(db, **kwargs), fmt)
+    finally:
+        db.close()
+
+
+def _export_media_type(fmt: str) -> str:
+    media_type = export.FORMATS.get(fmt)
+    if media_type is None:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {fmt}")
+    return media_type
+
+
+# Объявлен раньше /{challenge_id}: иначе "export" разбирался бы как id челленджа
+@router.get("/export")
+async def export_database(
+    fmt: str = Query("ndjson", alias="format", description="csv | ndjson"),
+    since: datetime | None = Query(
+        None, description="X-Export-Watermark предыдущей выгрузки; без него — всё"
+    ),
+    current_user: models.User = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Инкрементальная выгрузка всей базы (только суперадмин): пользователи, челленджи,
+    участники, прогресс, тычки и сообщения, созданные или изменённые после since.
+    Граница выгрузки — в заголовке X-Export-Watermark, её передают как since в следующий раз.
+    """
+    if not is_superadmin(current_user):
+        raise HTTPException(status_code=403, detail="Superadmin only")
+    media_type = _export_media_type(fmt)
+    if since is not None and since.tzinfo is not None:
+        # В базе время UTC без зоны
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    until = export.watermark()
+    return StreamingResponse(
+        _stream_export(export.database_records, fmt, since=since, until=until),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="repday-{until:%Y%m%dT%H%M%S}.{fmt}"',
+            "X-Export-Watermark": until.isoformat(),
+        },
+    )
+
+
 @router.get("/{challenge_id}", response_model=schemas.ChallengeDetail)
-def get_challenge(
+async def get_challenge(
     challenge_id: int,
-    db: Session = Depends(get_db),
+    since: int | None = Query(
+        None, description="Версия из прошлого ответа: вернуть только изменившихся участников"
+    ),
+    since_day: date | None = Query(
+        None, description="day из того же ответа: дельта отдаётся, только если день не сменился"
+    ),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+    db: DbRunner = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-) -> schemas.ChallengeDetail:
-    import logging
-    logger = logging.getLogger(__name__)
+) -> Response:
+    # Полные детали (без since) кэшируются вместе с ETag
+    cache_key = None
+    if since is None:
+        cache_key = response_cache.key("detail", challenge_id, current_user.id)
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return _conditional_json(*cached, if_none_match)
+        token = response_cache.token()
     try:
-        return _get_challenge_impl(challenge_id, db, current_user)
+        detail, headers = await db.run(
+            _get_challenge,
+            challenge_id=challenge_id,
+            since=since,
+            since_day=since_day,
+            if_none_match=if_none_match,
+            current_user=current_user,
+        )
     except Exception as e:
         logger.exception("get_challenge failed: %s", e)
         raise
+    if detail is None:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    body = serialization.dumps(detail)
+    if cache_key is not None:
+        response_cache.put(
+            cache_key,
+            (body, headers["ETag"]),
+            len(body),
+            (response_cache.challenge_tag(challenge_id),),
+            token,
+        )
+    return serialization.raw_json_response(body, headers)
 
 
 def _get_challenge_impl(
     challenge_id: int,
     db: Session,
     current_user: models.User,
-) -> schemas.ChallengeDetail:
+    since: int | None = None,
+) -> dict:
+    """Детали в форме schemas.ChallengeDetail."""
     ch = db.get(models.Challenge, challenge_id)
     if not ch:
         raise HTTPException(status_code=404, detail="Challenge not found")
 
-    participants = (
-        db.query(models.ChallengeParticipant)
-        .options(joinedload(models.ChallengeParticipant.user))
-        .filter_by(challenge_id=challenge_id)
-        .all()
+    today = date.today()
+    # Дельта возможна, только если состав не менялся после since и since не из будущего
+    is_delta = since is not None and ch.members_version <= since <= ch.version
+
+    # Участники вместе с именем и прогрессом за сегодня — одним запросом, кортежами колонок
+    # (без ORM-объектов: на тысячах участников их загрузка дороже самого запроса)
+    cp = models.ChallengeParticipant
+    q = (
+        db.query(
+            cp.user_id,
+            cp.role,
+            cp.version,
+            cp.streak_current,
+            cp.streak_last_date,
+            models.User.id.label("existing_user_id"),
+            models.User.display_name,
+            models.DailyProgress.value,
+            models.DailyProgress.completed,
+        )
+        .outerjoin(models.User, models.User.id == cp.user_id)
+        .outerjoin(
+            models.DailyProgress,
+            and_(
+                models.DailyProgress.challenge_id == models.ChallengeParticipant.challenge_id,
+                models.DailyProgress.user_id == models.ChallengeParticipant.user_id,
+                models.DailyProgress.date == today,
+            ),
+        )
+        .filter(cp.challenge_id == challenge_id)
+        .order_by(cp.id)
     )
+    if is_delta:
+        # Строку текущего пользователя берём всегда — по ней проверяется доступ
+        q = q.filter(
+            or_(
+                models.ChallengeParticipant.version > since,
+                models.ChallengeParticipant.user_id == current_user.id,
+            )
+        )
+    rows = q.all()
     me_participation = next(
-        (p for p in participants if p.user_id == current_user.id), None
+        (p for p in rows if p.user_id == current_user.id), None
     )
     is_participant = me_participation is not None
     if not is_participant and not is_superadmin(current_user):
         raise HTTPException(status_code=403, detail="Not a participant")
 
-    today = date.today()
     is_owner = bool(me_participation and me_participation.role == "owner")
 
-    result_participants: list[schemas.ChallengeDetail.Participant] = []
-
-    for p in participants:
-        if p.user is None:
-            continue
-        dp = (
-            db.query(models.DailyProgress)
-            .filter_by(
-                challenge_id=challenge_id,
-                user_id=p.user_id,
-                date=today,
+    # Последний nudge от текущего пользователя каждому участнику — один сгруппированный запрос
+    last_nudges: dict[int, datetime] = {}
+    if is_participant:
+        last_nudges = dict(
+            db.query(models.Nudge.to_user_id, func.max(models.Nudge.created_at))
+            .filter(
+                models.Nudge.challenge_id == challenge_id,
+                models.Nudge.from_user_id == current_user.id,
             )
-            .first()
+            .group_by(models.Nudge.to_user_id)
+            .all()
         )
-        value = int(dp.value) if dp else 0
-        completed = bool(dp.completed) if dp else False
-        streak_current = int(p.streak_current) if p.streak_current is not None else 0
+
+    result_participants: list[dict] = []
+
+    for (
+        user_id, _role, version, streak, streak_last_date, existing_user_id, display_name, value, completed
+    ) in rows:
+        if existing_user_id is None:
+            continue
+        if is_delta and version <= since:
+            continue
 
         last_nudge_at = None
-        if is_participant and p.user_id != current_user.id:
-            last_nudge = (
-                db.query(models.Nudge)
-                .filter_by(
-                    challenge_id=challenge_id,
-                    from_user_id=current_user.id,
-                    to_user_id=p.user_id,
-                )
-                .order_by(models.Nudge.created_at.desc())
-                .first()
-            )
-            if last_nudge:
-                utc_dt = last_nudge.created_at
-                if utc_dt.tzinfo is None:
-                    utc_dt = utc_dt.replace(tzinfo=ZoneInfo("UTC"))
-                msk_dt = utc_dt.astimezone(ZoneInfo("Europe/Moscow"))
-                last_nudge_at = msk_dt.isoformat()
+        utc_dt = last_nudges.get(user_id) if user_id != current_user.id else None
+        if utc_dt:
+            if utc_dt.tzinfo is None:
+                utc_dt = utc_dt.replace(tzinfo=ZoneInfo("UTC"))
+            msk_dt = utc_dt.astimezone(ZoneInfo("Europe/Moscow"))
+            last_nudge_at = msk_dt.isoformat()
 
         result_participants.append(
-            schemas.ChallengeDetail.Participant(
-                id=p.user.id,
-                display_name=p.user.display_name or "",
-                today_value=value,
-                today_completed=completed,
-                streak_current=streak_current,
-                last_nudge_at=last_nudge_at,
-            )
+            {
+                "id": user_id,
+                "display_name": display_name or "",
+                "today_value": int(value) if value is not None else 0,
+                "today_completed": bool(completed),
+                "streak_current": aggregates.current_streak(streak, streak_last_date, today),
+                "last_nudge_at": last_nudge_at,
+            }
         )
 
     # Для просмотра без участия (суперадмин) не отдаём invite_code
     invite_code = ch.invite_code if is_participant else ""
 
-    return schemas.ChallengeDetail(
-        id=ch.id,
-        title=ch.title,
-        description=ch.description,
-        goal_type=ch.goal_type,
-        daily_goal=ch.daily_goal,
-        unit=ch.unit,
-        duration_days=ch.duration_days,
-        start_date=ch.start_date,
-        end_date=ch.end_date,
-        is_public=ch.is_public,
-        invite_code=invite_code,
-        participants=result_participants,
-        is_owner=is_owner,
-        is_participant=is_participant,
+    return {
+        "id": ch.id,
+        "title": ch.title,
+        "description": ch.description,
+        "goal_type": ch.goal_type,
+        "daily_goal": ch.daily_goal,
+        "unit": ch.unit,
+        "duration_days": ch.duration_days,
+        "start_date": ch.start_date,
+        "end_date": ch.end_date,
+        "is_public": ch.is_public,
+        "invite_code": invite_code,
+        "is_owner": is_owner,
+        "is_participant": is_participant,
+        "participants": result_participants,
+        "version": ch.version,
+        "day": today,
+        "is_delta": is_delta,
+    }
+
+
+def _require_viewer(
+    challenge_id: int,
+    db: Session,
+    user: models.User,
+) -> None:
+    """Челлендж существует и пользователь — участник или суперадмин."""
+    if not db.get(models.Challenge, challenge_id):
+        raise HTTPException(status_code=404, detail="Challenge not found")
+    is_participant = (
+        db.query(models.ChallengeParticipant.id)
+        .filter_by(challenge_id=challenge_id, user_id=user.id)
+        .first()
+        is not None
     )
+    if not is_participant and not is_superadmin(user):
+        raise HTTPException(status_code=403, detail="Not a participant")
 
 
-@router.post("/{challenge_id}/join", response_model=schemas.ChallengeDetail)
-def join_challenge(
+def _require_stream_viewer(challenge_id: int, user_id: int, db: Session) -> None:
+    """Владелец билета всё ещё существует и видит челлендж."""
+    user = db.get(models.User, user_id)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired events ticket")
+    _require_viewer(challenge_id, db, user)
+
+
+@router.post("/{challenge_id}/events/ticket")
+async def create_challenge_events_ticket(
     challenge_id: int,
-    db: Session = Depends(get_db),
+    db: DbRunner = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-) -> schemas.ChallengeDetail:
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    logger.info(f"Join challenge {challenge_id}: current_user.id={current_user.id}, telegram_id={current_user.telegram_id}, display_name={current_user.display_name}")
-    
+) -> dict:
+    """Короткоживущий билет на поток событий челленджа (для ?ticket= в EventSource)."""
+    await db.run(_require_viewer, challenge_id, user=current_user)
+    return {
+        "ticket": create_events_ticket(current_user.id, challenge_id),
+        "expires_in": int(EVENTS_TICKET_TTL_SECONDS),
+    }
+
+
+@router.get("/{challenge_id}/events")
+async def challenge_events(
+    challenge_id: int,
+    ticket: str = Query(..., description="Билет из POST /challenges/{id}/events/ticket"),
+    db: DbRunner = Depends(get_db),
+) -> StreamingResponse:
+    """
+    Поток событий челленджа (SSE): progress, participant_joined, participant_removed,
+    nudge, message, challenge_deleted. В каждом событии есть version для GET ?since=.
+    EventSource не умеет заголовки, поэтому вместо JWT в ?ticket= передаётся билет
+    на этот челлендж. Удалённому участнику и при удалении челленджа поток закрывается
+    после соответствующего события.
+    """
+    user_id = events_ticket_user_id(ticket, challenge_id)
+    await db.run(_require_stream_viewer, challenge_id, user_id)
+    # Соединение с БД на время жизни потока не нужно
+    await db.close()
+    return StreamingResponse(
+        events.bus.stream(challenge_id, user_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # nginx: не буферизовать поток
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@router.get("/{challenge_id}/export")
+async def export_challenge(
+    challenge_id: int,
+    fmt: str = Query("csv", alias="format", description="csv | ndjson"),
+    db: DbRunner = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+) -> StreamingResponse:
+    """
+    Полная история челленджа потоком: участники, прогресс каждого по дням, тычки и
+    сообщения. Память сервера не зависит от объёма (см. export.py). Участники или суперадмин.
+    """
+    media_type = _export_media_type(fmt)
+    await db.run(_require_viewer, challenge_id, user=current_user)
+    await db.close()
+    return StreamingResponse(
+        _stream_export(export.challenge_records, fmt, challenge_id=challenge_id),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="challenge-{challenge_id}.{fmt}"'},
+    )
+
+
+def _join_challenge(
+    challenge_id: int,
+    db: Session,
+    current_user: models.User,
+) -> dict:
     ch = db.get(models.Challenge, challenge_id)
     if not ch:
         raise HTTPException(status_code=404, detail="Challenge not found")
@@ -293,81 +584,231 @@ def join_challenge(
         .first()
     )
     if not existing:
-        logger.info(f"Adding user {current_user.id} to challenge {challenge_id}")
         participant = models.ChallengeParticipant(
             challenge_id=challenge_id,
             user_id=current_user.id,
             role="member",
         )
         db.add(participant)
+        db.flush()
+        version = versions.bump_challenge(
+            db, challenge_id, user_ids=[current_user.id], membership=True
+        )
         db.commit()
-        logger.info(f"User {current_user.id} added to challenge {challenge_id}")
-    else:
-        logger.info(f"User {current_user.id} already in challenge {challenge_id}")
+        response_cache.invalidate_challenge(challenge_id)
+        response_cache.invalidate_viewer(current_user.id)
+        events.bus.publish(
+            challenge_id,
+            "participant_joined",
+            {"user_id": current_user.id, "version": version},
+        )
 
-    return get_challenge(challenge_id, db, current_user)
+    return _get_challenge_impl(challenge_id, db, current_user)
 
 
-@router.post("/{challenge_id}/progress")
-def update_progress(
+@router.post("/{challenge_id}/join", response_model=schemas.ChallengeDetail)
+async def join_challenge(
     challenge_id: int,
-    payload: schemas.ProgressUpdate,
-    db: Session = Depends(get_db),
+    db: DbRunner = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+) -> Response:
+    detail = await db.run(
+        _join_challenge,
+        challenge_id=challenge_id,
+        current_user=current_user,
+    )
+    return serialization.json_response(detail)
+
+
+# Сколько операций принимает один POST /challenges/progress:batch
+PROGRESS_BATCH_MAX_OPERATIONS = 500
+
+
+def _batch_progress(
+    payload: schemas.ProgressBatch,
+    db: Session,
+    current_user: models.User,
+) -> schemas.ProgressBatchResult:
+    operations = payload.operations
+    if len(operations) > PROGRESS_BATCH_MAX_OPERATIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many operations (max {PROGRESS_BATCH_MAX_OPERATIONS})",
+        )
+
+    # Одна проверка на челлендж: существует ли и участвует ли в нём пользователь
+    challenge_ids = {op.challenge_id for op in operations}
+    membership = {
+        ch_id: (daily_goal, cp_id is not None)
+        for ch_id, daily_goal, cp_id in db.query(
+            models.Challenge.id,
+            models.Challenge.daily_goal,
+            models.ChallengeParticipant.id,
+        )
+        .outerjoin(
+            models.ChallengeParticipant,
+            and_(
+                models.ChallengeParticipant.challenge_id == models.Challenge.id,
+                models.ChallengeParticipant.user_id == current_user.id,
+            ),
+        )
+        .filter(models.Challenge.id.in_(challenge_ids))
+        .all()
+    }
+
+    today = date.today()
+    results: list[schemas.ProgressBatchResult.Item] = []
+    # Итоговое состояние дня по каждому затронутому челленджу — для событий SSE
+    touched: dict[int, dict[date, tuple[int, bool]]] = {}
+    for index, op in enumerate(operations):
+        if op.challenge_id not in membership:
+            error = "Challenge not found"
+        elif not membership[op.challenge_id][1]:
+            error = "Not a participant"
+        else:
+            error = None
+        if error:
+            results.append(
+                schemas.ProgressBatchResult.Item(
+                    index=index, challenge_id=op.challenge_id, ok=False, error=error
+                )
+            )
+            continue
+
+        before = aggregates.lock_day(db, op.challenge_id, current_user.id, op.date)
+        value, completed = progress.upsert_daily_progress(
+            db,
+            op.challenge_id,
+            current_user.id,
+            op.date,
+            delta=op.delta,
+            set_value=op.set_value,
+            completed=op.completed,
+            daily_goal=membership[op.challenge_id][0],
+        )
+        aggregates.apply_day(db, op.challenge_id, current_user.id, op.date, before, value, completed)
+        if op.date < today:
+            rollover.write_summary(
+                db, op.challenge_id, current_user.id, op.date, value, completed,
+                membership[op.challenge_id][0],
+            )
+        touched.setdefault(op.challenge_id, {})[op.date] = (value, completed)
+        results.append(
+            schemas.ProgressBatchResult.Item(
+                index=index,
+                challenge_id=op.challenge_id,
+                ok=True,
+                value=value,
+                completed=completed,
+            )
+        )
+
+    published: list[tuple[int, dict]] = []
+    for challenge_id, days in touched.items():
+        version = versions.bump_challenge(db, challenge_id, user_ids=[current_user.id])
+        for day, (value, completed) in days.items():
+            published.append(
+                (
+                    challenge_id,
+                    {
+                        "user_id": current_user.id,
+                        "date": day,
+                        "value": value,
+                        "completed": completed,
+                        "version": version,
+                    },
+                )
+            )
+    db.commit()
+    for challenge_id in touched:
+        response_cache.invalidate_challenge(challenge_id)
+    for challenge_id, event in published:
+        events.bus.publish(challenge_id, "progress", event)
+
+    return schemas.ProgressBatchResult(results=results)
+
+
+@router.post("/progress:batch", response_model=schemas.ProgressBatchResult)
+async def batch_progress(
+    payload: schemas.ProgressBatch,
+    db: DbRunner = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
+) -> schemas.ProgressBatchResult:
+    """
+    Несколько изменений прогресса (в т.ч. разных челленджей) одной транзакцией.
+    Ошибка одной операции не отменяет остальные — результат по каждой в results.
+    """
+    return await db.run(_batch_progress, payload, current_user=current_user)
+
+
+def _update_progress(
+    challenge_id: int,
+    payload: schemas.ProgressUpdate,
+    db: Session,
+    current_user: models.User,
 ) -> dict:
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    logger.info(f"Update progress: challenge={challenge_id}, user_id={current_user.id}, telegram_id={current_user.telegram_id}, date={payload.date}")
-    
     ch = db.get(models.Challenge, challenge_id)
     if not ch:
         raise HTTPException(status_code=404, detail="Challenge not found")
 
     _require_participant(challenge_id, db, current_user)
 
-    dp = (
-        db.query(models.DailyProgress)
-        .filter_by(
-            challenge_id=challenge_id,
-            user_id=current_user.id,
-            date=payload.date,
-        )
-        .first()
+    before = aggregates.lock_day(db, challenge_id, current_user.id, payload.date)
+    # Один атомарный upsert: параллельные дельты не теряются, первая запись дня не конфликтует
+    value, completed = progress.upsert_daily_progress(
+        db,
+        challenge_id,
+        current_user.id,
+        payload.date,
+        delta=payload.delta,
+        set_value=payload.set_value,
+        completed=payload.completed,
+        daily_goal=ch.daily_goal,
     )
-    if not dp:
-        dp = models.DailyProgress(
-            challenge_id=challenge_id,
-            user_id=current_user.id,
-            date=payload.date,
-            value=0,
-            completed=False,
+    # Правка закрытого дня — итог дня для статистики тоже меняется
+    if payload.date < date.today():
+        rollover.write_summary(
+            db, challenge_id, current_user.id, payload.date, value, completed, ch.daily_goal
         )
-        db.add(dp)
-
-    if payload.set_value is not None:
-        dp.value = max(0, payload.set_value)
-    elif payload.delta is not None:
-        dp.value = max(0, dp.value + payload.delta)
-
-    if payload.completed is not None:
-        dp.completed = payload.completed
-    else:
-        # Авторасчет completed
-        if ch.daily_goal and ch.daily_goal > 0:
-            dp.completed = dp.value >= ch.daily_goal
 
+    aggregates.apply_day(db, challenge_id, current_user.id, payload.date, before, value, completed)
+    version = versions.bump_challenge(db, challenge_id, user_ids=[current_user.id])
+    event = {
+        "user_id": current_user.id,
+        "date": payload.date,
+        "value": value,
+        "completed": completed,
+        "version": version,
+    }
     db.commit()
+    response_cache.invalidate_challenge(challenge_id)
+    events.bus.publish(challenge_id, "progress", event)
 
     return {"ok": True}
 
 
-@router.get("/{challenge_id}/stats", response_model=schemas.ChallengeStats)
-def get_stats(
+@router.post("/{challenge_id}/progress")
+async def update_progress(
     challenge_id: int,
-    db: Session = Depends(get_db),
+    payload: schemas.ProgressUpdate,
+    db: DbRunner = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
-) -> schemas.ChallengeStats:
+) -> dict:
+    return await db.run(
+        _update_progress,
+        challenge_id=challenge_id,
+        payload=payload,
+        current_user=current_user,
+    )
+
+
+def _get_stats(
+    challenge_id: int,
+    include_leaderboards: bool,
+    db: Session,
+    current_user: models.User,
+) -> dict:
+    """Статистика в форме schemas.ChallengeStats."""
     ch = db.get(models.Challenge, challenge_id)
     if not ch:
         raise HTTPException(status_code=404, detail="Challenge not found")
@@ -381,108 +822,211 @@ def get_stats(
     if not is_participant and not is_superadmin(current_user):
         raise HTTPException(status_code=403, detail="Not a participant")
 
-    points: list[schemas.ChallengeStats.DayPoint] = []
+    points: list[dict] = []
     completed_days = 0
     missed_days = 0
     today = date.today()
     last_day = min(ch.end_date, today)
 
     if is_participant:
+        # Закрытые дни — готовые итоги (rollover.py)
+        summaries = {
+            day: (value, percent, completed)
+            for day, value, percent, completed in db.query(
+                models.DailySummary.date,
+                models.DailySummary.value,
+                models.DailySummary.percent,
+                models.DailySummary.completed,
+            )
+            .filter(
+                models.DailySummary.challenge_id == challenge_id,
+                models.DailySummary.user_id == current_user.id,
+                models.DailySummary.date >= ch.start_date,
+                models.DailySummary.date <= last_day,
+            )
+            .all()
+        }
+        # Дни без итога (сегодня, ещё не закрытые, до вступления в челлендж) — из daily_progress
+        first_open = ch.start_date
+        while first_open <= last_day and first_open in summaries:
+            first_open += timedelta(days=1)
+        by_date = {}
+        if first_open <= last_day:
+            by_date = {
+                day: (value, completed)
+                for day, value, completed in db.query(
+                    models.DailyProgress.date,
+                    models.DailyProgress.value,
+                    models.DailyProgress.completed,
+                )
+                .filter(
+                    models.DailyProgress.challenge_id == challenge_id,
+                    models.DailyProgress.user_id == current_user.id,
+                    models.DailyProgress.date >= first_open,
+                    models.DailyProgress.date <= last_day,
+                )
+                .all()
+            }
         day = ch.start_date
         while day <= last_day:
-            dp = (
-                db.query(models.DailyProgress)
-                .filter_by(
-                    challenge_id=challenge_id,
-                    user_id=current_user.id,
-                    date=day,
-                )
-                .first()
-            )
-            if dp:
-                if ch.daily_goal and ch.daily_goal > 0:
-                    percent = min(100.0, dp.value / ch.daily_goal * 100.0)
-                else:
-                    percent = 100.0 if dp.completed else 0.0
-                day_value = dp.value
+            summary = summaries.get(day)
+            if summary is not None:
+                day_value, percent, day_completed = summary
             else:
-                percent = 0.0
-                day_value = 0
+                day_value, day_completed = by_date.get(day, (0, False))
+                percent = rollover.day_percent(day_value, day_completed, ch.daily_goal)
 
-            if dp and dp.completed:
+            if day_completed:
                 completed_days += 1
             else:
                 missed_days += 1
 
-            points.append(
-                schemas.ChallengeStats.DayPoint(
-                    date=day,
-                    percent=percent,
-                    value=day_value,
-                )
-            )
+            points.append({"date": day, "percent": percent, "value": day_value})
             day += timedelta(days=1)
 
-    # Лидерборды по всему челленджу
+    stats = {
+        "completed_days": completed_days,
+        "missed_days": missed_days,
+        "points": points,
+        "leaderboard_by_value": [],
+        "leaderboard_by_days": [],
+    }
+    if not include_leaderboards:
+        return stats
+
+    # Лидерборды по всему челленджу — из агрегатов участников, без пересчёта истории.
+    # Для больших челленджей — постранично через GET /{challenge_id}/leaderboard
     rows = (
         db.query(
-            models.User.id.label("user_id"),
+            models.User.id,
             models.User.display_name,
-            func.coalesce(func.sum(models.DailyProgress.value), 0).label("total_value"),
-            func.coalesce(
-                func.sum(case((models.DailyProgress.completed.is_(True), 1), else_=0)),
-                0,
-            ).label("completed_days"),
+            func.coalesce(models.ChallengeParticipant.total_value, 0),
+            func.coalesce(models.ChallengeParticipant.completed_days, 0),
         )
         .join(models.ChallengeParticipant, models.ChallengeParticipant.user_id == models.User.id)
-        .outerjoin(
-            models.DailyProgress,
-            (models.DailyProgress.user_id == models.User.id)
-            & (models.DailyProgress.challenge_id == challenge_id),
-        )
         .filter(models.ChallengeParticipant.challenge_id == challenge_id)
-        .group_by(models.User.id, models.User.display_name)
+        .order_by(models.User.id)
         .all()
     )
 
-    leaderboard_items = [
-        schemas.ChallengeStats.LeaderboardItem(
-            user_id=r.user_id,
-            display_name=r.display_name,
-            total_value=int(r.total_value or 0),
-            completed_days=int(r.completed_days or 0),
-        )
-        for r in rows
-    ]
-
-    leaderboard_by_value = sorted(
-        leaderboard_items, key=lambda x: x.total_value, reverse=True
+    leaderboard_items = serialization.rows_to_dicts(
+        ("user_id", "display_name", "total_value", "completed_days"), rows
     )
-    leaderboard_by_days = sorted(
-        leaderboard_items, key=lambda x: x.completed_days, reverse=True
+    stats["leaderboard_by_value"] = sorted(
+        leaderboard_items, key=lambda x: x["total_value"], reverse=True
     )
-
-    return schemas.ChallengeStats(
-        completed_days=completed_days,
-        missed_days=missed_days,
-        points=points,
-        leaderboard_by_value=leaderboard_by_value,
-        leaderboard_by_days=leaderboard_by_days,
+    stats["leaderboard_by_days"] = sorted(
+        leaderboard_items, key=lambda x: x["completed_days"], reverse=True
     )
+    return stats
 
 
-@router.post("/{challenge_id}/nudge")
-def send_nudge(
+@router.get("/{challenge_id}/stats", response_model=schemas.ChallengeStats)
+async def get_stats(
     challenge_id: int,
-    to_user_id: int = Query(..., description="ID пользователя, которому отправляется nudge"),
-    db: Session = Depends(get_db),
+    leaderboards: bool = Query(True, description="false — только дни, без полных лидербордов"),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+    db: DbRunner = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+) -> Response:
+    cache_key = response_cache.key("stats", challenge_id, current_user.id, leaderboards)
+    cached = response_cache.get(cache_key)
+    if cached is None:
+        token = response_cache.token()
+        stats = await db.run(
+            _get_stats,
+            challenge_id=challenge_id,
+            include_leaderboards=leaderboards,
+            current_user=current_user,
+        )
+        body = serialization.dumps(stats)
+        cached = (body, serialization.body_etag(body))
+        response_cache.put(
+            cache_key, cached, len(body), (response_cache.challenge_tag(challenge_id),), token
+        )
+    return _conditional_json(*cached, if_none_match)
+
+
+LEADERBOARD_LIMIT = 50
+LEADERBOARD_MAX_LIMIT = 200
+LEADERBOARD_MAX_AROUND = 50
+
+
+def _get_leaderboard(
+    challenge_id: int,
+    metric: str,
+    limit: int,
+    offset: int,
+    cursor: str | None,
+    around: int,
+    db: Session,
+    current_user: models.User,
+) -> dict:
+    _require_viewer(challenge_id, db, current_user)
+    if metric not in leaderboard.METRICS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown metric, use one of: {', '.join(leaderboard.METRICS)}",
+        )
+    if cursor is not None and offset:
+        raise HTTPException(status_code=400, detail="Use either cursor or offset")
+    after = None
+    if cursor is not None:
+        try:
+            after = leaderboard.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    items, next_cursor = leaderboard.page(db, challenge_id, metric, limit, offset=offset, cursor=after)
+    me, around_me = leaderboard.around(db, challenge_id, metric, current_user.id, around)
+    # Строки лидерборда — dataclass'ы, orjson кодирует их как объекты schemas.Leaderboard.Entry
+    return {
+        "metric": metric,
+        "total": leaderboard.total(db, challenge_id),
+        "items": items,
+        "next_cursor": next_cursor,
+        "me": me,
+        "around_me": around_me,
+    }
+
+
+@router.get("/{challenge_id}/leaderboard", response_model=schemas.Leaderboard)
+async def get_leaderboard(
+    challenge_id: int,
+    metric: str = Query("total_value", description="total_value | completed_days | streak_best"),
+    limit: int = Query(LEADERBOARD_LIMIT, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    cursor: str | None = Query(None, description="next_cursor предыдущей страницы"),
+    around: int = Query(2, ge=0, le=LEADERBOARD_MAX_AROUND, description="Соседей сверху и снизу от меня"),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+    db: DbRunner = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
+) -> Response:
+    """
+    Лидерборд челленджа по одной метрике: страница (offset или курсор), место
+    текущего пользователя и его соседи. Участники или суперадмин.
+    Читает только нужные строки по индексам ix_challenge_participants_leader_*.
+    """
+    board = await db.run(
+        _get_leaderboard,
+        challenge_id=challenge_id,
+        metric=metric,
+        limit=limit,
+        offset=offset,
+        cursor=cursor,
+        around=around,
+        current_user=current_user,
+    )
+    body = serialization.dumps(board)
+    return _conditional_json(body, serialization.body_etag(body), if_none_match)
+
+
+def _send_nudge(
+    challenge_id: int,
+    to_user_id: int,
+    db: Session,
+    current_user: models.User,
 ) -> dict:
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    logger.info(f"Nudge request: from_user={current_user.id}, to_user={to_user_id}, challenge={challenge_id}")
-    
     if current_user.id == to_user_id:
         raise HTTPException(status_code=400, detail="cannot nudge self")
 
@@ -578,20 +1122,24 @@ def send_nudge(
         challenge_id=challenge_id,
     )
     db.add(nudge)
+    # Сообщение в Telegram уходит через outbox в той же транзакции, что и nudge;
+    # отправляет его фоновый воркер, ответ клиенту не ждёт Bot API
+    queued = telegram_bot.enqueue_nudge_message(
+        db=db,
+        to_user_id=to_user_id,
+        from_user_id=current_user.id,
+        challenge_id=challenge_id,
+    )
+    version = versions.bump_challenge(db, challenge_id, user_ids=[to_user_id])
     db.commit()
-    logger.info(f"Nudge saved to database: id={nudge.id}")
-
-    try:
-        telegram_bot.send_nudge_message(
-            db=db,
-            to_user_id=to_user_id,
-            from_user_id=current_user.id,
-            challenge_id=challenge_id,
-        )
-        logger.info(f"Telegram message sent successfully")
-    except Exception as e:
-        logger.error(f"Failed to send Telegram message: {e}")
-        # Не падаем, если сообщение не отправилось - nudge уже сохранён
+    response_cache.invalidate_challenge(challenge_id)
+    events.bus.publish(
+        challenge_id,
+        "nudge",
+        {"from_user_id": current_user.id, "to_user_id": to_user_id, "version": version},
+    )
+    if queued:
+        outbox.sender.notify()
 
     return {
         "ok": True,
@@ -600,14 +1148,27 @@ def send_nudge(
     }
 
 
-@router.delete("/{challenge_id}/participants/{user_id}")
-def remove_participant(
+@router.post("/{challenge_id}/nudge")
+async def send_nudge(
     challenge_id: int,
-    user_id: int,
-    db: Session = Depends(get_db),
+    to_user_id: int = Query(..., description="ID пользователя, которому отправляется nudge"),
+    db: DbRunner = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ) -> dict:
-    """Исключить участника из челленджа. Только владелец. Нельзя исключить себя."""
+    return await db.run(
+        _send_nudge,
+        challenge_id=challenge_id,
+        to_user_id=to_user_id,
+        current_user=current_user,
+    )
+
+
+def _remove_participant(
+    challenge_id: int,
+    user_id: int,
+    db: Session,
+    current_user: models.User,
+) -> dict:
     if current_user.id == user_id:
         raise HTTPException(status_code=400, detail="Cannot remove yourself")
     ch = db.get(models.Challenge, challenge_id)
@@ -634,59 +1195,144 @@ def remove_participant(
     db.query(models.DailyProgress).filter_by(
         challenge_id=challenge_id, user_id=user_id
     ).delete()
+    db.query(models.DailySummary).filter_by(
+        challenge_id=challenge_id, user_id=user_id
+    ).delete()
     db.delete(target)
+    db.flush()
+    version = versions.bump_challenge(db, challenge_id, membership=True)
     db.commit()
+    response_cache.invalidate_challenge(challenge_id)
+    events.bus.publish(
+        challenge_id,
+        "participant_removed",
+        {"user_id": user_id, "version": version},
+        close_user_id=user_id,
+    )
     return {"ok": True}
 
 
+@router.delete("/{challenge_id}/participants/{user_id}")
+async def remove_participant(
+    challenge_id: int,
+    user_id: int,
+    db: DbRunner = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+) -> dict:
+    """Исключить участника из челленджа. Только владелец. Нельзя исключить себя."""
+    return await db.run(
+        _remove_participant,
+        challenge_id=challenge_id,
+        user_id=user_id,
+        current_user=current_user,
+    )
+
+
 # Лимит сообщений в истории и макс. длина текста
 CHAT_MESSAGE_MAX_LENGTH = 2000
 CHAT_MESSAGES_LIMIT = 100
+CHAT_MESSAGES_MAX_LIMIT = 500
 
 
-@router.get("/{challenge_id}/messages", response_model=List[schemas.ChallengeMessageOut])
-def get_challenge_messages(
+def _get_challenge_messages(
     challenge_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
-) -> list:
-    """История сообщений чата челленджа. Только участники. Сверху вниз: от новых к старым."""
+    before_id: int | None,
+    after_id: int | None,
+    limit: int,
+    db: Session,
+    current_user: models.User,
+) -> list[dict]:
     _require_participant(challenge_id, db, current_user)
-    rows = (
+    if before_id is not None and after_id is not None:
+        raise HTTPException(status_code=400, detail="Use either before_id or after_id")
+
+    cursor_key = tuple_(models.ChallengeMessage.created_at, models.ChallengeMessage.id)
+    q = (
         db.query(models.ChallengeMessage, models.User.display_name)
         .join(models.User, models.ChallengeMessage.user_id == models.User.id)
         .filter(models.ChallengeMessage.challenge_id == challenge_id)
-        .order_by(models.ChallengeMessage.created_at.desc())
-        .limit(CHAT_MESSAGES_LIMIT)
-        .all()
     )
+    cursor_id = before_id if before_id is not None else after_id
+    if cursor_id is not None:
+        cursor_created_at = (
+            db.query(models.ChallengeMessage.created_at)
+            .filter_by(id=cursor_id, challenge_id=challenge_id)
+            .scalar()
+        )
+        if cursor_created_at is None:
+            raise HTTPException(status_code=400, detail="Cursor message not found")
+        cursor = tuple_(literal(cursor_created_at, DateTime()), literal(cursor_id))
+        q = q.filter(cursor_key < cursor if before_id is not None else cursor_key > cursor)
+
+    if after_id is not None:
+        # Ближайшие новые по возрастанию, затем разворачиваем к общему порядку «от новых»
+        rows = (
+            q.order_by(models.ChallengeMessage.created_at, models.ChallengeMessage.id)
+            .limit(limit)
+            .all()
+        )[::-1]
+    else:
+        rows = (
+            q.order_by(
+                models.ChallengeMessage.created_at.desc(),
+                models.ChallengeMessage.id.desc(),
+            )
+            .limit(limit)
+            .all()
+        )
+    # Элементы в форме schemas.ChallengeMessageOut
+    utc, msk = ZoneInfo("UTC"), ZoneInfo("Europe/Moscow")
     result = []
     for msg, display_name in rows:
         utc_dt = msg.created_at
         if utc_dt.tzinfo is None:
-            utc_dt = utc_dt.replace(tzinfo=ZoneInfo("UTC"))
-        msk_dt = utc_dt.astimezone(ZoneInfo("Europe/Moscow"))
+            utc_dt = utc_dt.replace(tzinfo=utc)
         result.append(
-            schemas.ChallengeMessageOut(
-                id=msg.id,
-                challenge_id=msg.challenge_id,
-                user_id=msg.user_id,
-                display_name=display_name,
-                text=msg.text[:CHAT_MESSAGE_MAX_LENGTH],
-                created_at=msk_dt.isoformat(),
-            )
+            {
+                "id": msg.id,
+                "challenge_id": msg.challenge_id,
+                "user_id": msg.user_id,
+                "display_name": display_name,
+                "text": msg.text[:CHAT_MESSAGE_MAX_LENGTH],
+                "created_at": utc_dt.astimezone(msk).isoformat(),
+            }
         )
     return result
 
 
-@router.post("/{challenge_id}/messages", response_model=schemas.ChallengeMessageOut)
-def post_challenge_message(
+@router.get("/{challenge_id}/messages", response_model=List[schemas.ChallengeMessageOut])
+async def get_challenge_messages(
     challenge_id: int,
-    payload: schemas.ChallengeMessageCreate,
-    db: Session = Depends(get_db),
+    before_id: int | None = Query(None, description="Сообщения старше этого (прокрутка назад)"),
+    after_id: int | None = Query(None, description="Только сообщения новее этого"),
+    limit: int = Query(CHAT_MESSAGES_LIMIT, ge=1, le=CHAT_MESSAGES_MAX_LIMIT),
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+    db: DbRunner = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
+) -> Response:
+    """
+    История сообщений чата челленджа. Только участники. Сверху вниз: от новых к старым.
+    Курсор по (created_at, id): before_id — страница старше сообщения, after_id — только новые.
+    Стоимость не зависит от длины истории (индекс ix_challenge_messages_cursor).
+    """
+    messages = await db.run(
+        _get_challenge_messages,
+        challenge_id=challenge_id,
+        before_id=before_id,
+        after_id=after_id,
+        limit=limit,
+        current_user=current_user,
+    )
+    body = serialization.dumps(messages)
+    return _conditional_json(body, serialization.body_etag(body), if_none_match)
+
+
+def _post_challenge_message(
+    challenge_id: int,
+    payload: schemas.ChallengeMessageCreate,
+    db: Session,
+    current_user: models.User,
 ) -> schemas.ChallengeMessageOut:
-    """Отправить сообщение в чат челленджа. Только участники."""
     _require_participant(challenge_id, db, current_user)
     text = (payload.text or "").strip()
     if not text:
@@ -702,13 +1348,15 @@ def post_challenge_message(
         text=text,
     )
     db.add(msg)
+    version = versions.bump_challenge(db, challenge_id)
     db.commit()
+    response_cache.invalidate_challenge(challenge_id)
     db.refresh(msg)
     utc_dt = msg.created_at
     if utc_dt.tzinfo is None:
         utc_dt = utc_dt.replace(tzinfo=ZoneInfo("UTC"))
     msk_dt = utc_dt.astimezone(ZoneInfo("Europe/Moscow"))
-    return schemas.ChallengeMessageOut(
+    out = schemas.ChallengeMessageOut(
         id=msg.id,
         challenge_id=msg.challenge_id,
         user_id=msg.user_id,
@@ -716,13 +1364,32 @@ def post_challenge_message(
         text=msg.text,
         created_at=msk_dt.isoformat(),
     )
+    events.bus.publish(
+        challenge_id, "message", {**out.model_dump(), "version": version}
+    )
+    return out
 
 
-@router.delete("/{challenge_id}")
-def delete_challenge(
+@router.post("/{challenge_id}/messages", response_model=schemas.ChallengeMessageOut)
+async def post_challenge_message(
     challenge_id: int,
-    db: Session = Depends(get_db),
+    payload: schemas.ChallengeMessageCreate,
+    db: DbRunner = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
+) -> schemas.ChallengeMessageOut:
+    """Отправить сообщение в чат челленджа. Только участники."""
+    return await db.run(
+        _post_challenge_message,
+        challenge_id=challenge_id,
+        payload=payload,
+        current_user=current_user,
+    )
+
+
+def _delete_challenge(
+    challenge_id: int,
+    db: Session,
+    current_user: models.User,
 ) -> dict:
     ch = db.get(models.Challenge, challenge_id)
     if not ch:
@@ -741,9 +1408,24 @@ def delete_challenge(
     db.query(models.ChallengeMessage).filter_by(challenge_id=challenge_id).delete()
     db.query(models.Nudge).filter_by(challenge_id=challenge_id).delete()
     db.query(models.DailyProgress).filter_by(challenge_id=challenge_id).delete()
+    db.query(models.DailySummary).filter_by(challenge_id=challenge_id).delete()
     db.query(models.ChallengeParticipant).filter_by(challenge_id=challenge_id).delete()
     db.delete(ch)
     db.commit()
+    response_cache.invalidate_challenge(challenge_id)
+    events.bus.publish(challenge_id, "challenge_deleted", {"challenge_id": challenge_id}, close_all=True)
 
     return {"ok": True}
 
+
+@router.delete("/{challenge_id}")
+async def delete_challenge(
+    challenge_id: int,
+    db: DbRunner = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+) -> dict:
+    return await db.run(
+        _delete_challenge,
+        challenge_id=challenge_id,
+        current_user=current_user,
+    )
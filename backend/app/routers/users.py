@@ -1,14 +1,15 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 
-from .. import models, schemas
-from ..deps import get_current_user, get_db, is_superadmin
+from .. import models, response_cache, schemas, versions
+from ..db import DbRunner
+from ..deps import get_current_user, get_db, invalidate_user, is_superadmin
 
 router = APIRouter()
 
 
 @router.get("", response_model=schemas.UserMe)
-def get_me(
+async def get_me(
     current_user: models.User = Depends(get_current_user),
 ) -> schemas.UserMe:
     return schemas.UserMe(
@@ -23,16 +24,21 @@ def get_me(
     )
 
 
-@router.patch("", response_model=schemas.UserMe)
-def update_me(
+def _update_me(
     payload: schemas.UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session,
+    current_user: models.User,
 ) -> schemas.UserMe:
+    challenge_ids: list[int] = []
     if payload.display_name is not None:
         current_user.display_name = payload.display_name
+        # Имя видно в деталях всех челленджей пользователя — сбрасываем их ETag
+        challenge_ids = versions.bump_user_challenges(db, current_user.id)
     db.add(current_user)
     db.commit()
+    invalidate_user(current_user.id)
+    for challenge_id in challenge_ids:
+        response_cache.invalidate_challenge(challenge_id)
     db.refresh(current_user)
     return schemas.UserMe(
         id=current_user.id,
@@ -45,3 +51,11 @@ def update_me(
         is_superadmin=is_superadmin(current_user),
     )
 
+
+@router.patch("", response_model=schemas.UserMe)
+async def update_me(
+    payload: schemas.UserUpdate,
+    db: DbRunner = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+) -> schemas.UserMe:
+    return await db.run(_update_me, payload, current_user=current_user)
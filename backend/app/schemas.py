@@ -87,6 +87,12 @@ class ChallengeDetail(BaseModel):
 
     participants: list[Participant]
 
+    # Версия данных челленджа (для ?since=) и флаг, что participants — только изменения после since
+    version: int = 0
+    # День, за который посчитаны today_* и серии (для ?since_day= вместе с since)
+    day: Optional[date] = None
+    is_delta: bool = False
+
     class Config:
         from_attributes = True
 
@@ -98,6 +104,26 @@ class ProgressUpdate(BaseModel):
     completed: Optional[bool] = None
 
 
+class ProgressBatchOperation(ProgressUpdate):
+    challenge_id: int
+
+
+class ProgressBatch(BaseModel):
+    operations: list[ProgressBatchOperation]
+
+
+class ProgressBatchResult(BaseModel):
+    class Item(BaseModel):
+        index: int  # Позиция операции в запросе
+        challenge_id: int
+        ok: bool
+        value: Optional[int] = None
+        completed: Optional[bool] = None
+        error: Optional[str] = None
+
+    results: list[Item]
+
+
 class ChallengeStats(BaseModel):
     completed_days: int
     missed_days: int
@@ -119,6 +145,24 @@ class ChallengeStats(BaseModel):
     leaderboard_by_days: list[LeaderboardItem]
 
 
+class Leaderboard(BaseModel):
+    class Entry(BaseModel):
+        rank: int  # Место; у равных значений одно место (1, 2, 2, 4)
+        user_id: int
+        display_name: str
+        value: int
+
+        class Config:
+            from_attributes = True
+
+    metric: str
+    total: int  # Всего участников
+    items: list[Entry]
+    next_cursor: Optional[str] = None  # Для следующей страницы: ?cursor=
+    me: Optional[Entry] = None  # Строка текущего пользователя, если он участник
+    around_me: list[Entry] = []  # Соседи сверху и снизу вместе с me
+
+
 class ChallengeMessageCreate(BaseModel):
     text: str
 
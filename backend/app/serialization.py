@@ -0,0 +1,51 @@
+"""
+Быстрая отдача JSON: orjson вместо stdlib json и без повторной валидации по response_model.
+
+FastAPI заново валидирует результат хэндлера по response_model и кодирует его
+стандартным json. Для больших ответов (детали с тысячами участников, статистика
+с годом точек и лидербордами) это основная доля CPU, а создание Pydantic-объекта
+на каждую строку стоит ещё столько же. Поэтому горячие хэндлеры собирают ответ
+словарями прямо из строк запроса (rows_to_dicts) в форме схемы из response_model
+и отдают его через json_response; схема остаётся контрактом и описанием в OpenAPI.
+
+Замер: python -m tools.bench_serialization
+"""
+import hashlib
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
+
+def _default(obj: Any) -> Any:
+    # Вложенные Pydantic-модели (например, ответ другого хэндлера) — как словари
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON как у FastAPI (даты в ISO, UTF-8 без экранирования), но через orjson."""
+    return orjson.dumps(content, default=_default)
+
+
+def raw_json_response(body: bytes, headers: dict[str, str] | None = None) -> Response:
+    """Ответ из уже закодированного JSON (например, из кэша ответов)."""
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def json_response(content: Any, headers: dict[str, str] | None = None) -> Response:
+    """content уже в форме response_model — отдаём без повторной валидации."""
+    return raw_json_response(dumps(content), headers)
+
+
+def body_etag(body: bytes) -> str:
+    """Слабый ETag по содержимому: сжатое и несжатое представления равнозначны."""
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def rows_to_dicts(keys: Sequence[str], rows: Iterable[Sequence[Any]]) -> list[dict[str, Any]]:
+    """Строки результата запроса -> словари с ключами keys (в порядке полей схемы)."""
+    return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,251 @@
+"""
+Общее состояние нескольких воркеров uvicorn (uvicorn --workers N / WEB_CONCURRENCY=N).
+
+Кэши (deps._user_cache) и шина SSE (events.bus) живут в памяти процесса. Чтобы запись,
+обработанная одним воркером, была видна остальным, воркер публикует короткое
+сообщение в общий журнал (broadcast), а фоновая задача каждого воркера читает чужие
+сообщения и отдаёт их подписчикам своего процесса (subscribe).
+
+Хранилище журнала подключаемое: SHARED_STATE_URL — любой URL SQLAlchemy; по умолчанию
+при WEB_CONCURRENCY > 1 это отдельный SQLite-файл рядом с приложением. Без него
+(один воркер) broadcast ничего не делает: локальные подписчики обслуживаются напрямую.
+"""
+import asyncio
+import logging
+import os
+import threading
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from typing import Protocol
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Engine,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    create_engine,
+    delete,
+    event,
+    func,
+    insert,
+    make_url,
+    select,
+)
+
+from .locks import FileLock
+
+logger = logging.getLogger(__name__)
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL") or (
+    "sqlite:///./repday.shared.db" if WEB_CONCURRENCY > 1 else ""
+)
+# Как часто воркер забирает чужие сообщения: это верхняя граница рассинхронизации кэшей
+SHARED_POLL_SECONDS = float(os.getenv("SHARED_POLL_SECONDS", "0.5"))
+# Сколько хранить сообщения журнала; воркер, не читавший журнал дольше, сбрасывает кэши целиком
+SHARED_RETENTION_SECONDS = float(os.getenv("SHARED_RETENTION_SECONDS", "300"))
+SHARED_BATCH_SIZE = 1000
+
+_metadata = MetaData()
+shared_messages = Table(
+    "shared_messages",
+    _metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("origin", String(32), nullable=False),
+    Column("channel", String(32), nullable=False),
+    Column("payload", Text, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+
+
+class SharedStore(Protocol):
+    """Журнал сообщений между воркерами: append-only, чтение по возрастанию id."""
+
+    def append(self, origin: str, messages: list[tuple[str, str]]) -> None: ...
+
+    def last_id(self) -> int: ...
+
+    def read_after(self, after_id: int, limit: int) -> list[tuple[int, str, str, str]]: ...
+
+    def prune(self, older_than: datetime) -> None: ...
+
+
+class SqlSharedStore:
+    """Журнал в таблице shared_messages базы по URL (по умолчанию — SQLite-файл)."""
+
+    def __init__(self, url: str) -> None:
+        self.engine: Engine = create_engine(url)
+        if make_url(url).get_backend_name() == "sqlite":
+            event.listen(self.engine, "connect", _sqlite_pragmas)
+        # Воркеры стартуют одновременно — таблицу создаёт кто-то один
+        with FileLock("shared"):
+            _metadata.create_all(self.engine, checkfirst=True)
+
+    def append(self, origin: str, messages: list[tuple[str, str]]) -> None:
+        now = datetime.utcnow()
+        with self.engine.begin() as conn:
+            conn.execute(
+                insert(shared_messages),
+                [
+                    {"origin": origin, "channel": channel, "payload": payload, "created_at": now}
+                    for channel, payload in messages
+                ],
+            )
+
+    def last_id(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(func.coalesce(func.max(shared_messages.c.id), 0))
+            ).scalar_one()
+
+    def read_after(self, after_id: int, limit: int) -> list[tuple[int, str, str, str]]:
+        m = shared_messages.c
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(m.id, m.origin, m.channel, m.payload)
+                .where(m.id > after_id)
+                .order_by(m.id)
+                .limit(limit)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def prune(self, older_than: datetime) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(delete(shared_messages).where(shared_messages.c.created_at < older_than))
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+    finally:
+        cursor.close()
+
+
+class SharedState:
+    def __init__(self, store_factory: Callable[[], SharedStore | None]) -> None:
+        self.origin = uuid.uuid4().hex
+        self._store_factory = store_factory
+        self._store: SharedStore | None = None
+        self._handlers: dict[str, list[Callable[[str], None]]] = {}
+        self._resync_handlers: list[Callable[[], None]] = []
+        self._outgoing: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._store is not None
+
+    def subscribe(self, channel: str, handler: Callable[[str], None]) -> None:
+        """handler(payload) вызывается в event loop для сообщений других воркеров."""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def on_resync(self, handler: Callable[[], None]) -> None:
+        """Воркер пропустил часть журнала (долгая пауза) — сбросить всё локальное состояние."""
+        self._resync_handlers.append(handler)
+
+    def broadcast(self, channel: str, payload: str) -> None:
+        """Отправить сообщение остальным воркерам. Безопасно из любого потока, не блокирует."""
+        if self._store is None:
+            return
+        with self._lock:
+            self._outgoing.append((channel, payload))
+        if self._loop is not None and self._wakeup is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass
+
+    async def start(self) -> None:
+        self._store = self._store_factory()
+        if self._store is None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        last_id = await asyncio.to_thread(self._store.last_id)
+        self._task = asyncio.create_task(self._run(last_id), name="shared-state")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._store is not None:
+            # Не теряем сообщения, отправленные перед остановкой
+            await asyncio.to_thread(self._flush)
+            self._store = None
+
+    def _flush(self) -> None:
+        with self._lock:
+            outgoing, self._outgoing = self._outgoing, []
+        if not outgoing:
+            return
+        try:
+            self._store.append(self.origin, outgoing)
+        except Exception:
+            # Вернём в начало очереди, отправим при следующей попытке
+            with self._lock:
+                self._outgoing[:0] = outgoing
+            raise
+
+    async def _run(self, last_id: int) -> None:
+        retention = timedelta(seconds=SHARED_RETENTION_SECONDS)
+        last_prune = last_success = datetime.utcnow()
+        while True:
+            try:
+                await asyncio.to_thread(self._flush)
+                rows = await asyncio.to_thread(self._store.read_after, last_id, SHARED_BATCH_SIZE)
+                now = datetime.utcnow()
+                if now - last_success > retention:
+                    # Журнал был недоступен дольше срока хранения: часть сообщений уже удалена
+                    self._resync()
+                last_success = now
+                for message_id, origin, channel, payload in rows:
+                    last_id = message_id
+                    if origin != self.origin:
+                        self._dispatch(channel, payload)
+                if now - last_prune > retention / 2:
+                    await asyncio.to_thread(self._store.prune, now - retention)
+                    last_prune = now
+                if len(rows) == SHARED_BATCH_SIZE:
+                    continue
+            except Exception:
+                logger.exception("Shared state sync failed")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=SHARED_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self, channel: str, payload: str) -> None:
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(payload)
+            except Exception:
+                logger.exception("Shared state handler for %s failed", channel)
+
+    def _resync(self) -> None:
+        logger.warning("Shared state journal was unavailable too long, resetting local caches")
+        for handler in self._resync_handlers:
+            handler()
+
+
+def _default_store() -> SharedStore | None:
+    return SqlSharedStore(SHARED_STATE_URL) if SHARED_STATE_URL else None
+
+
+state = SharedState(_default_store)
@@ -0,0 +1,74 @@
+"""
+Версии данных челленджа для ETag и дельта-синхронизации GET /challenges/{id}.
+
+Challenge.version растёт на каждой записи, влияющей на челлендж (прогресс, состав,
+nudge, сообщения). ChallengeParticipant.version — версия челленджа, при которой
+изменилась строка участника в ChallengeDetail. Challenge.members_version — версия
+последнего изменения состава: дельту от более старой версии отдать нельзя
+(удалённых участников в ней не видно), поэтому отдаётся полный список.
+Дельта привязана и к дню ответа (ChallengeDetail.day, ?since_day=): в полночь значения
+«за сегодня» и серии меняются у всех без записей и без новых версий.
+"""
+from collections.abc import Iterable
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+def bump_challenge(
+    db: Session,
+    challenge_id: int,
+    user_ids: Iterable[int] = (),
+    membership: bool = False,
+) -> int:
+    """Увеличивает версию челленджа в текущей транзакции. Возвращает новую версию."""
+    values: dict = {models.Challenge.version: models.Challenge.version + 1}
+    if membership:
+        values[models.Challenge.members_version] = models.Challenge.version + 1
+    version = db.execute(
+        update(models.Challenge)
+        .where(models.Challenge.id == challenge_id)
+        .values(values)
+        .returning(models.Challenge.version)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+
+    user_ids = list(user_ids)
+    if user_ids:
+        db.execute(
+            update(models.ChallengeParticipant)
+            .where(
+                models.ChallengeParticipant.challenge_id == challenge_id,
+                models.ChallengeParticipant.user_id.in_(user_ids),
+            )
+            .values(version=version)
+            .execution_options(synchronize_session=False)
+        )
+    return version
+
+
+def bump_user_challenges(db: Session, user_id: int) -> list[int]:
+    """
+    Данные пользователя (имя) видны во всех его челленджах — поднимаем версии всех.
+    Возвращает id этих челленджей.
+    """
+    challenge_ids = [
+        row[0]
+        for row in db.query(models.ChallengeParticipant.challenge_id)
+        .filter(models.ChallengeParticipant.user_id == user_id)
+        .all()
+    ]
+    for challenge_id in challenge_ids:
+        bump_challenge(db, challenge_id, user_ids=[user_id])
+    return challenge_ids
+
+
+def detail_etag(version: int, today, viewer_id: int, since: int | None) -> str:
+    """
+    ETag ответа ChallengeDetail. Зависит от даты (значения «за сегодня» и серии
+    меняются в полночь без записей) и от зрителя (is_owner, last_nudge_at).
+    """
+    suffix = f"-since{since}" if since is not None else ""
+    return f'W/"{version}-{today.isoformat()}-{viewer_id}{suffix}"'
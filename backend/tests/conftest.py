@@ -0,0 +1,115 @@
+"""
+Общие фикстуры тестов: приложение поднимается на временной SQLite-базе.
+
+Переменные окружения задаются до первого импорта app — модули читают их при импорте.
+Запуск (из каталога backend):
+
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+from collections.abc import Iterator
+from datetime import date, datetime, timedelta
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="repday-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_workdir}/repday.db")
+os.environ["SHARED_STATE_URL"] = ""
+os.environ["LOCK_DIR"] = _workdir
+os.environ["TELEGRAM_BOT_TOKEN"] = ""
+os.environ["ROLLOVER_ENABLED"] = "false"
+os.environ["REMINDERS_ENABLED"] = "false"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app import models  # noqa: E402
+from app.db import SessionLocal, engine, init_db  # noqa: E402
+
+init_db()
+
+_next_id = iter(range(1, 10**9))
+
+
+@pytest.fixture
+def db() -> Iterator[Session]:
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+class QueryCounter:
+    """Считает SQL-запросы к engine приложения (before_cursor_execute)."""
+
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@pytest.fixture
+def count_queries() -> Iterator[QueryCounter]:
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+
+
+def make_user(db: Session, **fields) -> models.User:
+    n = next(_next_id)
+    user = models.User(
+        **{"telegram_id": 5_000_000 + n, "username": f"user{n}", "display_name": f"User {n}", **fields}
+    )
+    db.add(user)
+    db.commit()
+    return user
+
+
+def make_challenge(db: Session, owner: models.User, members: list[models.User] = (), **fields) -> models.Challenge:
+    """Идущий челлендж owner'а с участниками members и сегодняшним прогрессом у каждого."""
+    today = date.today()
+    n = next(_next_id)
+    fields = {
+        "title": f"Challenge {n}",
+        "goal_type": "reps",
+        "daily_goal": 10,
+        "unit": "x",
+        "duration_days": 30,
+        "start_date": today - timedelta(days=10),
+        "end_date": today + timedelta(days=19),
+        "invite_code": f"test{n}",
+        **fields,
+    }
+    challenge = models.Challenge(creator_id=owner.id, **fields)
+    db.add(challenge)
+    db.flush()
+    for i, user in enumerate([owner, *members]):
+        db.add(
+            models.ChallengeParticipant(
+                challenge_id=challenge.id, user_id=user.id, role="owner" if i == 0 else "member"
+            )
+        )
+        db.add(
+            models.DailyProgress(
+                challenge_id=challenge.id,
+                user_id=user.id,
+                date=today,
+                value=5 + i,
+                completed=False,
+                updated_at=datetime.utcnow(),
+            )
+        )
+    db.commit()
+    return challenge
@@ -0,0 +1,91 @@
+"""Агрегаты участника после записей прогресса совпадают с полным пересчётом по истории."""
+import random
+from datetime import date, timedelta
+
+from conftest import make_challenge, make_user
+
+from app import aggregates, models, schemas
+from app.routers.challenges import _batch_progress, _update_progress
+
+_FIELDS = ("total_value", "completed_days", "streak_current", "streak_best", "streak_last_date")
+
+
+def _aggregates(db, challenge_id: int, user_id: int) -> dict:
+    db.expire_all()
+    participant = db.query(models.ChallengeParticipant).filter_by(challenge_id=challenge_id, user_id=user_id).one()
+    return {field: getattr(participant, field) for field in _FIELDS}
+
+
+def _recomputed(db, challenge_id: int, user_id: int) -> dict:
+    aggregates.refresh_participant(db, challenge_id, user_id)
+    result = _aggregates(db, challenge_id, user_id)
+    db.rollback()
+    return result
+
+
+def _challenge(db, user, **fields) -> models.Challenge:
+    # make_challenge пишет сегодняшний прогресс напрямую — агрегаты досчитываем сами
+    challenge = make_challenge(db, user, **fields)
+    aggregates.recompute_all(db, challenge.id)
+    db.commit()
+    return challenge
+
+
+def test_random_writes_match_full_recompute(db):
+    user = make_user(db)
+    today = date.today()
+    challenge = _challenge(db, user, start_date=today - timedelta(days=40), daily_goal=10)
+    rnd = random.Random(7)
+
+    for step in range(300):
+        # Чаще всего — сегодня и вчера, иногда правка из истории
+        day = today - timedelta(days=rnd.choice((0, 0, 0, 1, 1, rnd.randint(2, 40))))
+        kind = rnd.random()
+        if kind < 0.6:
+            payload = schemas.ProgressUpdate(date=day, delta=rnd.randint(-6, 8))
+        elif kind < 0.85:
+            payload = schemas.ProgressUpdate(date=day, set_value=rnd.randint(0, 15))
+        else:
+            payload = schemas.ProgressUpdate(date=day, completed=rnd.random() < 0.5)
+        _update_progress(challenge.id, payload, db, user)
+        assert _aggregates(db, challenge.id, user.id) == _recomputed(db, challenge.id, user.id), step
+
+
+def test_batch_writes_match_full_recompute(db):
+    user = make_user(db)
+    today = date.today()
+    first = _challenge(db, user, daily_goal=10)
+    second = _challenge(db, user, daily_goal=5)
+    operations = [
+        schemas.ProgressBatchOperation(challenge_id=first.id, date=today - timedelta(days=2), set_value=12),
+        schemas.ProgressBatchOperation(challenge_id=first.id, date=today - timedelta(days=1), delta=11),
+        schemas.ProgressBatchOperation(challenge_id=first.id, date=today, delta=10),
+        schemas.ProgressBatchOperation(challenge_id=second.id, date=today, delta=5),
+        schemas.ProgressBatchOperation(challenge_id=first.id, date=today - timedelta(days=1), set_value=0),
+    ]
+    _batch_progress(schemas.ProgressBatch(operations=operations), db, user)
+
+    for challenge in (first, second):
+        assert _aggregates(db, challenge.id, user.id) == _recomputed(db, challenge.id, user.id)
+
+
+def test_today_tap_does_not_read_history(db, count_queries):
+    user = make_user(db)
+    today = date.today()
+    challenge = make_challenge(db, user, start_date=today - timedelta(days=200), daily_goal=10)
+    db.add_all(
+        models.DailyProgress(challenge_id=challenge.id, user_id=user.id, date=today - timedelta(days=d), value=10, completed=True)
+        for d in range(1, 200)
+    )
+    db.commit()
+    aggregates.refresh_participant(db, challenge.id, user.id)
+    db.commit()
+
+    before = count_queries.count
+    _update_progress(challenge.id, schemas.ProgressUpdate(date=today, delta=5), db, user)
+    statements = count_queries.statements[before:]
+
+    history = [s for s in statements if "daily_progress" in s and ("sum(" in s or "ORDER BY daily_progress.date" in s)]
+    assert not history, history
+    assert _aggregates(db, challenge.id, user.id) == _recomputed(db, challenge.id, user.id)
+    assert _aggregates(db, challenge.id, user.id)["streak_current"] == 200
@@ -0,0 +1,85 @@
+"""Кэш пользователей аутентификации: invalidate_user сбрасывает устаревший снимок в этом и в других воркерах."""
+import asyncio
+import time
+
+from conftest import make_user
+from jose import jwt
+
+from app import deps, shared
+from app.db import SessionLocal
+from app.models import User
+
+
+def _bearer(user_id: int) -> str:
+    return "Bearer " + jwt.encode({"sub": str(user_id)}, deps.SECRET_KEY, algorithm=deps.ALGORITHM)
+
+
+def _display_name(authorization: str) -> str:
+    db = SessionLocal()
+    try:
+        return deps._resolve_current_user(authorization, db).display_name
+    finally:
+        db.close()
+
+
+def _rename(user_id: int, name: str) -> None:
+    # Как запись из другого процесса: в обход кэша и без инвалидации
+    db = SessionLocal()
+    try:
+        db.query(User).filter_by(id=user_id).update({"display_name": name})
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_invalidate_user_evicts_stale_snapshot_locally(db):
+    user = make_user(db, display_name="Before")
+    authorization = _bearer(user.id)
+    assert _display_name(authorization) == "Before"
+
+    _rename(user.id, "After")
+    # Снимок из кэша привязывается к сессии merge(load=False) — без SELECT, значит устаревший
+    assert _display_name(authorization) == "Before"
+
+    deps.invalidate_user(user.id)
+    assert _display_name(authorization) == "After"
+
+
+async def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.05)
+    return condition()
+
+
+def test_invalidate_user_reaches_other_workers(db, tmp_path, monkeypatch):
+    user = make_user(db, display_name="Before")
+    authorization = _bearer(user.id)
+    url = f"sqlite:///{tmp_path}/shared.db"
+    # Этот процесс — один воркер, other — второй воркер на том же журнале
+    monkeypatch.setattr(shared.state, "_store_factory", lambda: shared.SqlSharedStore(url))
+    other = shared.SharedState(lambda: shared.SqlSharedStore(url))
+    received: list[str] = []
+    other.subscribe("user", received.append)
+
+    async def scenario() -> None:
+        await shared.state.start()
+        await other.start()
+        try:
+            # Инвалидация в этом воркере доходит до другого
+            deps.invalidate_user(user.id)
+            assert await _wait_for(lambda: str(user.id) in received), received
+
+            # Другой воркер переименовал пользователя и инвалидировал его у себя
+            assert await asyncio.to_thread(_display_name, authorization) == "Before"
+            await asyncio.to_thread(_rename, user.id, "After")
+            other.broadcast("user", str(user.id))
+            assert await _wait_for(lambda: deps._user_cache.get(user.id) is None)
+            assert await asyncio.to_thread(_display_name, authorization) == "After"
+        finally:
+            await other.stop()
+            await shared.state.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,81 @@
+"""Обновления бота: дедупликация по update_id, схлопывание по пользователю и применение по одному при сбое пачки."""
+from conftest import make_user
+
+from app import bot_updates, models
+
+
+def _message(update_id: int, telegram_id: int, username: str | None = None, first_name: str = "Ivan") -> dict:
+    sender = {"id": telegram_id, "first_name": first_name}
+    if username:
+        sender["username"] = username
+    return {"update_id": update_id, "message": {"message_id": update_id, "from": sender, "text": "/start"}}
+
+
+def _user(db, telegram_id: int) -> models.User | None:
+    db.expire_all()
+    return db.query(models.User).filter_by(telegram_id=telegram_id).one_or_none()
+
+
+def test_repeated_update_id_is_applied_once(db):
+    update = _message(9_100_001, 7_100_001, "first")
+
+    # Повтор внутри пачки
+    totals = bot_updates.apply_once([update, update])
+    assert (totals["applied"], totals["duplicates"], totals["users_created"]) == (1, 1, 1)
+    assert db.get(models.ProcessedUpdate, 9_100_001) is not None
+
+    # Повтор от Telegram позже (в том числе принятый другим воркером): отброшен по processed_updates,
+    # даже если с тех пор пользователь изменился
+    user = _user(db, 7_100_001)
+    user.bot_chat_active = False
+    db.commit()
+    totals = bot_updates.apply_once([_message(9_100_001, 7_100_001, "renamed")])
+    assert (totals["applied"], totals["duplicates"], totals["users_updated"]) == (0, 1, 0)
+    user = _user(db, 7_100_001)
+    assert (user.username, user.bot_chat_active) == ("first", False)
+
+
+def test_updates_of_one_user_are_coalesced(db):
+    inactive = make_user(db, username="known", bot_chat_active=False)
+    active = make_user(db, username="same", bot_chat_active=True)
+
+    totals = bot_updates.apply_once(
+        [
+            # Пришли не по порядку: применяется последнее по update_id
+            _message(9_200_003, 7_200_001, "newest", first_name="C"),
+            _message(9_200_001, 7_200_001, "oldest", first_name="A"),
+            _message(9_200_002, 7_200_001, "middle", first_name="B"),
+            # Последнее без username не стирает известный
+            _message(9_200_005, inactive.telegram_id, None),
+            _message(9_200_004, inactive.telegram_id, "fresh"),
+            _message(9_200_006, active.telegram_id, "same"),
+        ]
+    )
+
+    assert totals == {"applied": 6, "duplicates": 0, "users_created": 1, "users_updated": 1}
+    created = _user(db, 7_200_001)
+    assert (created.username, created.display_name, created.bot_chat_active) == ("newest", "C", True)
+    # Ничего не изменилось у active — строка не пишется, а inactive активирован
+    reactivated = _user(db, inactive.telegram_id)
+    assert (reactivated.username, reactivated.bot_chat_active) == ("fresh", True)
+
+
+def test_failed_batch_is_applied_one_by_one(db, monkeypatch):
+    apply_once = bot_updates.apply_once
+
+    def failing_on_bad(updates):
+        if any(item["update_id"] == 9_300_002 for item in updates):
+            raise RuntimeError("bad update")
+        return apply_once(updates)
+
+    monkeypatch.setattr(bot_updates, "apply_once", failing_on_bad)
+    batch = [_message(9_300_000 + i, 7_300_000 + i) for i in (1, 2, 3)]
+
+    totals = bot_updates._apply_batch(batch)
+
+    assert totals["batches"] == 1 and totals["failed"] == 1
+    assert totals["applied"] == 2 and totals["users_created"] == 2
+    assert _user(db, 7_300_001) is not None and _user(db, 7_300_003) is not None
+    # Упавшее обновление не помечено обработанным — повтор от Telegram применится
+    assert _user(db, 7_300_002) is None
+    assert db.get(models.ProcessedUpdate, 9_300_002) is None
@@ -0,0 +1,28 @@
+"""ThreadpoolDb: запросов в полёте больше, чем соединений в пуле, — и ни один не ждёт DB_POOL_TIMEOUT."""
+import asyncio
+
+from sqlalchemy import text
+
+from app.db import DB_MAX_OVERFLOW, DB_POOL_SIZE, ThreadpoolDb
+
+
+def _select(db) -> int:
+    return db.execute(text("SELECT 1")).scalar_one()
+
+
+def test_burst_above_pool_size_does_not_stall():
+    async def request() -> None:
+        # Как запрос: get_current_user и хэндлер — два захода в threadpool одной сессией
+        db = ThreadpoolDb()
+        try:
+            await db.run(_select)
+            await asyncio.sleep(0)
+            await db.run(_select)
+        finally:
+            await db.close()
+
+    async def burst() -> None:
+        requests = 4 * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+        await asyncio.wait_for(asyncio.gather(*(request() for _ in range(requests))), timeout=10)
+
+    asyncio.run(burst())
@@ -0,0 +1,55 @@
+"""GET /challenges/{id}?since=: дельта участников привязана к дню ответа."""
+from datetime import date, timedelta
+
+from conftest import make_challenge, make_user
+
+from app import aggregates
+from app.routers import challenges
+from app.routers.challenges import _get_challenge
+
+
+def _participants(detail: dict) -> list[tuple[int, int, int]]:
+    return [(p["id"], p["today_value"], p["streak_current"]) for p in detail["participants"]]
+
+
+def test_delta_same_day_returns_only_changes(db):
+    owner = make_user(db)
+    challenge = make_challenge(db, owner, members=[make_user(db)])
+
+    full, _ = _get_challenge(challenge.id, None, None, None, db, owner)
+    assert not full["is_delta"] and len(full["participants"]) == 2
+
+    delta, _ = _get_challenge(challenge.id, full["version"], full["day"], None, db, owner)
+    assert delta["is_delta"] and delta["participants"] == []
+
+
+def test_delta_across_midnight_returns_full_list(db, monkeypatch):
+    owner, member = make_user(db), make_user(db)
+    challenge = make_challenge(db, owner, members=[member])
+    aggregates.recompute_all(db, challenge.id)
+    db.commit()
+
+    full, _ = _get_challenge(challenge.id, None, None, None, db, owner)
+    assert {value for _, value, _ in _participants(full)} == {5, 6}
+
+    later = full["day"] + timedelta(days=2)
+
+    class _Later(date):
+        @classmethod
+        def today(cls) -> date:
+            return later
+
+    monkeypatch.setattr(challenges, "date", _Later)
+
+    # Версии не менялись, но «за сегодня» и серии у всех обнулились
+    after, _ = _get_challenge(challenge.id, full["version"], full["day"], None, db, owner)
+    assert not after["is_delta"]
+    assert after["day"] == later
+    assert sorted(_participants(after)) == [(owner.id, 0, 0), (member.id, 0, 0)]
+    # Без since_day день клиента неизвестен — тоже полный список
+    unknown, _ = _get_challenge(challenge.id, full["version"], None, None, db, owner)
+    assert not unknown["is_delta"] and len(unknown["participants"]) == 2
+
+    # С новым днём дельта снова работает
+    again, _ = _get_challenge(challenge.id, after["version"], after["day"], None, db, owner)
+    assert again["is_delta"] and again["participants"] == []
@@ -0,0 +1,75 @@
+"""
+Диалектозависимые пути: INSERT ... ON CONFLICT (progress.dialect_insert), блокировка
+миграций (файловая для SQLite, pg_advisory_lock для PostgreSQL) и Telegram ID в BIGINT. Идут
+на той базе, что задана DATABASE_URL, — так же запускаются и против PostgreSQL (см. README).
+"""
+import threading
+import time
+from datetime import date
+
+import pytest
+from conftest import make_challenge, make_user
+
+from app import db as app_db
+from app import models
+from app.db import engine, init_db
+from app.migrations import migration_lock
+from app.progress import upsert_daily_progress
+
+
+def test_upsert_daily_progress_on_conflict(db):
+    owner = make_user(db)
+    challenge = make_challenge(db, owner)
+    today = date.today()
+
+    # Строка за сегодня уже есть (value=5): дельта прибавляется к ней, а не падает на уникальном ключе
+    assert upsert_daily_progress(db, challenge.id, owner.id, today, delta=3, daily_goal=10) == (8, False)
+    assert upsert_daily_progress(db, challenge.id, owner.id, today, delta=4, daily_goal=10) == (12, True)
+    assert upsert_daily_progress(db, challenge.id, owner.id, today, set_value=2, daily_goal=10) == (2, False)
+    db.commit()
+    rows = db.query(models.DailyProgress).filter_by(challenge_id=challenge.id, user_id=owner.id).all()
+    assert [(row.value, row.completed) for row in rows] == [(2, False)]
+
+
+def test_migration_lock_is_exclusive():
+    entered = threading.Event()
+    release = threading.Event()
+    order: list[str] = []
+
+    def first() -> None:
+        with migration_lock(engine):
+            order.append("first in")
+            entered.set()
+            release.wait(5)
+            order.append("first out")
+
+    def second() -> None:
+        with migration_lock(engine):
+            order.append("second in")
+
+    holder = threading.Thread(target=first)
+    holder.start()
+    assert entered.wait(5)
+    waiter = threading.Thread(target=second)
+    waiter.start()
+    time.sleep(0.3)
+    # Второй воркер ждёт, пока первый не отпустит блокировку
+    assert order == ["first in"]
+    release.set()
+    holder.join(5)
+    waiter.join(5)
+    assert order == ["first in", "first out", "second in"]
+
+
+def test_init_db_rejects_unsupported_dialect(monkeypatch):
+    monkeypatch.setattr(app_db.engine.dialect, "name", "mssql")
+    with pytest.raises(NotImplementedError, match="mssql"):
+        init_db()
+
+
+def test_telegram_id_beyond_32_bits(db):
+    # Telegram ID уже не помещаются в 32-битный INTEGER PostgreSQL
+    telegram_id = 2**40 + 7
+    user = make_user(db, telegram_id=telegram_id)
+    db.expire_all()
+    assert db.get(models.User, user.id).telegram_id == telegram_id
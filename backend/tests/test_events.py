@@ -0,0 +1,195 @@
+"""Поток событий SSE: билеты на один челлендж и закрытие потока при потере доступа."""
+import asyncio
+import time
+
+import httpx
+import pytest
+from conftest import make_challenge, make_user
+from fastapi import HTTPException
+from jose import jwt
+
+from app import deps, events, shared
+from app.db import SessionLocal
+from app.main import app
+from app.routers.challenges import _delete_challenge, _remove_participant
+
+
+def _call(fn, *args, **kwargs):
+    # Хэндлер в своей сессии, как в threadpool приложения
+    db = SessionLocal()
+    try:
+        return fn(*args, db=db, **kwargs)
+    finally:
+        db.close()
+
+
+async def _next(stream) -> str:
+    return await asyncio.wait_for(stream.__anext__(), timeout=2)
+
+
+async def _wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        await asyncio.sleep(0.02)
+    return condition()
+
+
+def test_ticket_is_scoped_to_one_challenge(db, monkeypatch):
+    owner = make_user(db)
+    first, second = make_challenge(db, owner), make_challenge(db, owner)
+    ticket = deps.create_events_ticket(owner.id, first.id)
+
+    assert deps.events_ticket_user_id(ticket, first.id) == owner.id
+    with pytest.raises(HTTPException) as exc:
+        deps.events_ticket_user_id(ticket, second.id)
+    assert exc.value.status_code == 401
+    # Сессионный JWT билетом не является
+    session_token = jwt.encode({"sub": str(owner.id)}, deps.SECRET_KEY, algorithm=deps.ALGORITHM)
+    with pytest.raises(HTTPException):
+        deps.events_ticket_user_id(session_token, first.id)
+    # А билет не годится как Bearer-токен
+    assert deps._decode_user_id(ticket, is_dev_mode=False) is None
+
+    monkeypatch.setattr(deps, "EVENTS_TICKET_TTL_SECONDS", -1)
+    with pytest.raises(HTTPException):
+        deps.events_ticket_user_id(deps.create_events_ticket(owner.id, first.id), first.id)
+
+
+def test_events_endpoint_requires_ticket(db):
+    owner, outsider = make_user(db), make_user(db)
+    challenge = make_challenge(db, owner)
+
+    def bearer(user) -> dict:
+        return {"Authorization": "Bearer " + jwt.encode({"sub": str(user.id)}, deps.SECRET_KEY, algorithm=deps.ALGORITHM)}
+
+    async def scenario() -> None:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(f"/challenges/{challenge.id}/events/ticket", headers=bearer(outsider))
+            assert response.status_code == 403
+            response = await client.post(f"/challenges/{challenge.id}/events/ticket", headers=bearer(owner))
+            assert response.status_code == 200
+            assert response.json()["expires_in"] == int(deps.EVENTS_TICKET_TTL_SECONDS)
+
+            token = bearer(owner)["Authorization"].removeprefix("Bearer ")
+            response = await client.get(f"/challenges/{challenge.id}/events", params={"ticket": token})
+            assert response.status_code == 401
+            response = await client.get(f"/challenges/{challenge.id}/events", params={"token": token})
+            assert response.status_code == 422
+
+    asyncio.run(scenario())
+
+
+def test_stream_subscribes_only_while_body_is_read(db, monkeypatch):
+    owner = make_user(db)
+    challenge = make_challenge(db, owner)
+
+    async def scenario() -> None:
+        monkeypatch.setattr(events.bus, "_loop", asyncio.get_running_loop())
+        stream = events.bus.stream(challenge.id, owner.id)
+        # Клиент отключился до начала ответа — генератор не запускался, подписки нет
+        assert events.bus.subscriber_count(challenge.id) == 0
+        assert await _next(stream) == "retry: 3000\n\n"
+        assert events.bus.subscriber_count(challenge.id) == 1
+        await stream.aclose()
+        assert events.bus.subscriber_count(challenge.id) == 0
+
+    asyncio.run(scenario())
+
+
+def test_removed_participant_stream_is_closed(db, monkeypatch):
+    owner, member = make_user(db), make_user(db)
+    challenge = make_challenge(db, owner, members=[member])
+
+    async def scenario() -> None:
+        monkeypatch.setattr(events.bus, "_loop", asyncio.get_running_loop())
+        owner_stream = events.bus.stream(challenge.id, owner.id)
+        member_stream = events.bus.stream(challenge.id, member.id)
+        await _next(owner_stream)
+        await _next(member_stream)
+
+        await asyncio.to_thread(_call, _remove_participant, challenge.id, member.id, current_user=owner)
+
+        assert (await _next(member_stream)).startswith("event: participant_removed\n")
+        with pytest.raises(StopAsyncIteration):
+            await _next(member_stream)
+        # Остальные участники продолжают получать события
+        assert (await _next(owner_stream)).startswith("event: participant_removed\n")
+        assert events.bus.subscriber_count(challenge.id) == 1
+        await owner_stream.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_deleted_challenge_closes_all_streams(db, monkeypatch):
+    owner, member = make_user(db), make_user(db)
+    challenge = make_challenge(db, owner, members=[member])
+
+    async def scenario() -> None:
+        monkeypatch.setattr(events.bus, "_loop", asyncio.get_running_loop())
+        streams = [events.bus.stream(challenge.id, user.id) for user in (owner, member)]
+        for stream in streams:
+            await _next(stream)
+
+        await asyncio.to_thread(_call, _delete_challenge, challenge.id, current_user=owner)
+
+        for stream in streams:
+            assert (await _next(stream)).startswith("event: challenge_deleted\n")
+            with pytest.raises(StopAsyncIteration):
+                await _next(stream)
+        assert events.bus.subscriber_count(challenge.id) == 0
+
+    asyncio.run(scenario())
+
+
+def test_events_are_forwarded_only_to_workers_with_subscribers(tmp_path, monkeypatch):
+    # Два воркера на общем журнале; события челленджа 1 публикует второй
+    url = f"sqlite:///{tmp_path}/shared.db"
+    monkeypatch.setattr(shared, "SHARED_POLL_SECONDS", 0.05)
+    monkeypatch.setattr(events, "EVENTS_WATCH_REFRESH_SECONDS", 0.2)
+    state_a = shared.SharedState(lambda: shared.SqlSharedStore(url))
+    state_b = shared.SharedState(lambda: shared.SqlSharedStore(url))
+    bus_a, bus_b = events.EventBus(state_a), events.EventBus(state_b)
+    forwarded: list[str] = []
+    broadcast = state_b.broadcast
+
+    def spy(channel: str, payload: str) -> None:
+        if channel == "event":
+            forwarded.append(payload)
+        broadcast(channel, payload)
+
+    monkeypatch.setattr(state_b, "broadcast", spy)
+
+    async def scenario() -> None:
+        loop = asyncio.get_running_loop()
+        for state, bus in ((state_a, bus_a), (state_b, bus_b)):
+            bus.bind(loop)
+            await state.start()
+            bus.start()
+        try:
+            # Пока списки соседей не собраны, пересылается всё
+            bus_b.publish(1, "progress", {"version": 1})
+            assert len(forwarded) == 1
+            await asyncio.sleep(0.4)
+            bus_b.publish(1, "progress", {"version": 2})
+            assert len(forwarded) == 1
+
+            stream = bus_a.stream(1, 7)
+            await _next(stream)
+            assert await _wait_for(lambda: 1 in bus_b._remote_watched)
+            bus_b.publish(1, "progress", {"version": 3})
+            assert len(forwarded) == 2
+            assert '"version": 3' in await asyncio.wait_for(stream.__anext__(), timeout=5)
+
+            await stream.aclose()
+            assert await _wait_for(lambda: 1 not in bus_b._remote_watched)
+            bus_b.publish(1, "progress", {"version": 4})
+            assert len(forwarded) == 2
+        finally:
+            for state, bus in ((state_a, bus_a), (state_b, bus_b)):
+                await bus.stop()
+                await state.stop()
+
+    asyncio.run(scenario())
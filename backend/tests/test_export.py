@@ -0,0 +1,31 @@
+"""Выгрузка всей базы: окно (since, until] и строки без отметки времени."""
+from datetime import datetime, timedelta
+
+from conftest import make_challenge, make_user
+from sqlalchemy import update
+
+from app import export, models
+
+
+def _progress(records) -> set[tuple[int, int]]:
+    return {(fields["challenge_id"], fields["user_id"]) for record, fields in records if record == "progress"}
+
+
+def test_full_export_includes_rows_without_updated_at(db):
+    owner, member = make_user(db), make_user(db)
+    challenge = make_challenge(db, owner, members=[member])
+    # Как строка, записанная до миграции 1: updated_at не заполнен
+    db.execute(
+        update(models.DailyProgress)
+        .where(models.DailyProgress.user_id == member.id)
+        .values(updated_at=None)
+    )
+    db.commit()
+    until = export.watermark(datetime.utcnow() + timedelta(minutes=1))
+
+    full = _progress(export.database_records(db, None, until))
+    assert {(challenge.id, owner.id), (challenge.id, member.id)} <= full
+
+    increment = _progress(export.database_records(db, datetime.utcnow() - timedelta(hours=1), until))
+    assert (challenge.id, owner.id) in increment
+    assert (challenge.id, member.id) not in increment
@@ -0,0 +1,105 @@
+"""Лидерборд: спортивные места, страницы по offset и курсору, соседи и проверка метрики."""
+import pytest
+from conftest import make_challenge, make_user
+from fastapi import HTTPException
+from sqlalchemy import delete, update
+
+from app import leaderboard, models
+from app.routers.challenges import _get_leaderboard
+
+
+def _board(db, totals: list[int]) -> tuple[models.Challenge, list[models.User]]:
+    """Челлендж, где у i-го участника total_value = totals[i]."""
+    users = [make_user(db) for _ in totals]
+    challenge = make_challenge(db, users[0], members=users[1:])
+    for user, value in zip(users, totals):
+        db.execute(
+            update(models.ChallengeParticipant)
+            .where(
+                models.ChallengeParticipant.challenge_id == challenge.id,
+                models.ChallengeParticipant.user_id == user.id,
+            )
+            .values(total_value=value)
+        )
+    db.commit()
+    return challenge, users
+
+
+def _ranks(entries) -> list[tuple[int, int, int]]:
+    return [(e.rank, e.user_id, e.value) for e in entries]
+
+
+def test_ties_share_rank_and_skip_next(db):
+    challenge, (a, b, c, d) = _board(db, [50, 30, 30, 10])
+
+    entries, next_cursor = leaderboard.page(db, challenge.id, "total_value", limit=10)
+    # При равенстве — по user_id
+    assert _ranks(entries) == [(1, a.id, 50), (2, b.id, 30), (2, c.id, 30), (4, d.id, 10)]
+    assert next_cursor is None
+    assert leaderboard.total(db, challenge.id) == 4
+
+
+def test_cursor_pages_match_offset_pages(db):
+    challenge, _ = _board(db, [70, 40, 40, 40, 20, 20, 5])
+
+    by_offset = [leaderboard.page(db, challenge.id, "total_value", limit=3, offset=o)[0] for o in (0, 3, 6)]
+
+    by_cursor = []
+    cursor = None
+    while True:
+        entries, next_cursor = leaderboard.page(db, challenge.id, "total_value", limit=3, cursor=cursor)
+        by_cursor.append(entries)
+        if next_cursor is None:
+            break
+        cursor = leaderboard.decode_cursor(next_cursor)
+
+    assert [_ranks(p) for p in by_cursor] == [_ranks(p) for p in by_offset]
+    # Место на границе страниц не сбрасывается: 40 делят 2-е место, 20 — 5-е
+    assert [e.rank for p in by_cursor for e in p] == [1, 2, 2, 2, 5, 5, 7]
+
+
+def test_around_returns_neighbours_with_ranks(db):
+    challenge, users = _board(db, [90, 80, 80, 60, 50, 40])
+    me = users[3]
+
+    entry, window = leaderboard.around(db, challenge.id, "total_value", me.id, neighbors=2)
+    assert (entry.rank, entry.user_id, entry.value) == (4, me.id, 60)
+    assert _ranks(window) == [
+        (2, users[1].id, 80),
+        (2, users[2].id, 80),
+        (4, me.id, 60),
+        (5, users[4].id, 50),
+        (6, users[5].id, 40),
+    ]
+
+    # У края таблицы соседей меньше
+    entry, window = leaderboard.around(db, challenge.id, "total_value", users[0].id, neighbors=2)
+    assert entry.rank == 1 and [e.user_id for e in window] == [u.id for u in users[:3]]
+
+    outsider = make_user(db)
+    assert leaderboard.around(db, challenge.id, "total_value", outsider.id, neighbors=2) == (None, [])
+
+
+def test_participant_without_user_row_is_not_counted(db):
+    challenge, (a, b, c) = _board(db, [30, 20, 10])
+    # SQLite не проверяет внешние ключи: строка участника пережила пользователя
+    db.execute(delete(models.User).where(models.User.id == b.id))
+    db.commit()
+
+    entries, _ = leaderboard.page(db, challenge.id, "total_value", limit=10)
+    assert _ranks(entries) == [(1, a.id, 30), (2, c.id, 10)]
+    assert leaderboard.total(db, challenge.id) == 2
+    entry, _ = leaderboard.around(db, challenge.id, "total_value", c.id, neighbors=1)
+    assert entry.rank == 2
+
+
+def test_endpoint_validates_metric_and_cursor(db):
+    challenge, (owner, _) = _board(db, [3, 1])
+
+    board = _get_leaderboard(challenge.id, "streak_best", 10, 0, None, 1, db, owner)
+    assert board["metric"] == "streak_best" and board["total"] == 2
+
+    for metric, offset, cursor in (("bogus", 0, None), ("total_value", 0, "oops"), ("total_value", 1, "1:1")):
+        with pytest.raises(HTTPException) as exc:
+            _get_leaderboard(challenge.id, metric, 10, offset, cursor, 1, db, owner)
+        assert exc.value.status_code == 400
@@ -0,0 +1,78 @@
+"""История чата: курсорная пагинация before_id / after_id по (created_at, id).
+
+План запросов этих же вызовов проверяет test_query_plans.test_chat_history_uses_cursor_index.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import make_challenge, make_user
+from fastapi import HTTPException
+
+from app import models
+from app.routers.challenges import _get_challenge_messages
+
+
+def _chat(db, owner, times: list[datetime]) -> tuple[models.Challenge, list[int]]:
+    """Челлендж с сообщениями, созданными в моменты times; id сообщений в порядке вставки."""
+    challenge = make_challenge(db, owner)
+    messages = [
+        models.ChallengeMessage(challenge_id=challenge.id, user_id=owner.id, text=f"m{i}", created_at=at)
+        for i, at in enumerate(times)
+    ]
+    db.add_all(messages)
+    db.commit()
+    return challenge, [m.id for m in messages]
+
+
+def _ids(page: list[dict]) -> list[int]:
+    return [m["id"] for m in page]
+
+
+def test_pages_go_from_newest_without_gaps_or_repeats(db):
+    owner = make_user(db)
+    start = datetime(2026, 1, 1, 12)
+    challenge, ids = _chat(db, owner, [start + timedelta(minutes=i) for i in range(7)])
+    newest_first = ids[::-1]
+
+    first = _get_challenge_messages(challenge.id, None, None, 3, db, owner)
+    assert _ids(first) == newest_first[:3]
+    second = _get_challenge_messages(challenge.id, first[-1]["id"], None, 3, db, owner)
+    assert _ids(second) == newest_first[3:6]
+    last = _get_challenge_messages(challenge.id, second[-1]["id"], None, 3, db, owner)
+    assert _ids(last) == newest_first[6:]
+    assert _get_challenge_messages(challenge.id, last[-1]["id"], None, 3, db, owner) == []
+
+    # after_id — ближайшие новые сообщения, но в том же порядке «от новых»
+    newer = _get_challenge_messages(challenge.id, None, ids[1], 3, db, owner)
+    assert _ids(newer) == [ids[4], ids[3], ids[2]]
+    assert _get_challenge_messages(challenge.id, None, ids[-1], 3, db, owner) == []
+
+
+def test_same_timestamp_is_ordered_by_id(db):
+    owner = make_user(db)
+    at = datetime(2026, 1, 1, 12)
+    # Пять сообщений в одну и ту же секунду и одно раньше
+    challenge, ids = _chat(db, owner, [at - timedelta(seconds=1)] + [at] * 5)
+
+    first = _get_challenge_messages(challenge.id, None, None, 2, db, owner)
+    assert _ids(first) == [ids[5], ids[4]]
+    # Граница страницы внутри группы с равным created_at
+    second = _get_challenge_messages(challenge.id, first[-1]["id"], None, 2, db, owner)
+    assert _ids(second) == [ids[3], ids[2]]
+    third = _get_challenge_messages(challenge.id, second[-1]["id"], None, 2, db, owner)
+    assert _ids(third) == [ids[1], ids[0]]
+
+    newer = _get_challenge_messages(challenge.id, None, ids[2], 2, db, owner)
+    assert _ids(newer) == [ids[4], ids[3]]
+
+
+def test_unknown_cursor_is_rejected(db):
+    owner = make_user(db)
+    challenge, ids = _chat(db, owner, [datetime(2026, 1, 1, 12)])
+    _, other_ids = _chat(db, owner, [datetime(2026, 1, 1, 12)])
+
+    # Несуществующий id и id сообщения из чужого челленджа
+    for before_id, after_id in ((ids[0] + 10_000, None), (None, other_ids[0]), (ids[0], ids[0])):
+        with pytest.raises(HTTPException) as exc:
+            _get_challenge_messages(challenge.id, before_id, after_id, 10, db, owner)
+        assert exc.value.status_code == 400
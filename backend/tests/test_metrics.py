@@ -0,0 +1,34 @@
+"""GET /metrics и /metrics/cache: только суперадмину."""
+import asyncio
+
+import httpx
+from conftest import make_user
+from jose import jwt
+
+from app import deps
+from app.main import app
+
+
+def _bearer(user) -> dict:
+    return {"Authorization": "Bearer " + jwt.encode({"sub": str(user.id)}, deps.SECRET_KEY, algorithm=deps.ALGORITHM)}
+
+
+def test_metrics_require_superadmin(db, monkeypatch):
+    # Прод-режим: без токена запросы не подменяются dev-пользователем
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "test")
+    admin, user = make_user(db), make_user(db)
+    monkeypatch.setenv("SUPERADMIN_TELEGRAM_ID", str(admin.telegram_id))
+
+    async def scenario() -> None:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for path in ("/metrics", "/metrics/cache"):
+                assert (await client.get(path)).status_code == 401
+                assert (await client.get(path, headers=_bearer(user))).status_code == 403
+
+            response = await client.get("/metrics", headers=_bearer(admin))
+            assert response.status_code == 200 and "repday_response_cache_entries" in response.text
+            response = await client.get("/metrics/cache", headers=_bearer(admin))
+            assert response.status_code == 200 and "entries" in response.json()
+
+    asyncio.run(scenario())
@@ -0,0 +1,73 @@
+"""
+Параллельные дельты POST /challenges/{id}/progress за ещё не начатый день:
+итог каждого участника равен сумме подтверждённых дельт, 5xx нет.
+
+Уменьшенная копия tools.stress_progress — регрессия на потерянные апдейты и
+IntegrityError на первой записи дня (uix_progress_day).
+"""
+import asyncio
+import random
+from collections import Counter
+from datetime import date
+
+import httpx
+from conftest import make_challenge, make_user
+from jose import jwt
+
+from app import deps, models
+from app.main import app
+
+_REQUESTS = 150
+_CONCURRENCY = 30
+
+
+def test_concurrent_deltas_are_neither_lost_nor_doubled(db):
+    users = [make_user(db) for _ in range(3)]
+    challenge = make_challenge(db, users[0], members=users[1:], daily_goal=_REQUESTS * 5)
+    # Сегодняшний день ещё не начат: первые записи дня гоняются за вставку строки
+    db.query(models.DailyProgress).filter_by(challenge_id=challenge.id).delete()
+    db.commit()
+
+    headers = {
+        user.id: {"Authorization": "Bearer " + jwt.encode({"sub": str(user.id)}, deps.SECRET_KEY, algorithm=deps.ALGORITHM)}
+        for user in users
+    }
+    rnd = random.Random(1)
+    # Только положительные дельты: сумма не зависит от порядка (без обрезки нулём)
+    ops = [(rnd.choice(users).id, rnd.randint(1, 5)) for _ in range(_REQUESTS)]
+    expected: Counter = Counter()
+    statuses: Counter = Counter()
+
+    async def scenario() -> None:
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        semaphore = asyncio.Semaphore(_CONCURRENCY)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=60) as client:
+
+            async def tap(user_id: int, delta: int) -> None:
+                async with semaphore:
+                    response = await client.post(
+                        f"/challenges/{challenge.id}/progress",
+                        json={"date": str(date.today()), "delta": delta},
+                        headers=headers[user_id],
+                    )
+                statuses[response.status_code] += 1
+                if response.status_code == 200:
+                    expected[user_id] += delta
+
+            await asyncio.gather(*(tap(user_id, delta) for user_id, delta in ops))
+
+    asyncio.run(scenario())
+
+    assert statuses == {200: _REQUESTS}
+    db.expire_all()
+    progress = {
+        row.user_id: row.value
+        for row in db.query(models.DailyProgress).filter_by(challenge_id=challenge.id, date=date.today())
+    }
+    totals = {
+        row.user_id: row.total_value
+        for row in db.query(models.ChallengeParticipant).filter_by(challenge_id=challenge.id)
+    }
+    assert progress == dict(expected)
+    # Агрегат участника сходится с днём так же, как при последовательной записи
+    assert {user_id: totals[user_id] for user_id in expected} == dict(expected)
@@ -0,0 +1,61 @@
+"""Число SQL-запросов списка и деталей челленджа не зависит от объёма данных (нет N+1)."""
+from conftest import make_challenge, make_user
+
+from app import models
+from app.db import SessionLocal
+from app.routers.challenges import _get_challenge, _list_challenge_shorts
+
+
+def _list_queries(user_id: int, count_queries, include_all: bool = False) -> int:
+    # Свежая сессия: identity map не должна прятать запросы
+    db = SessionLocal()
+    try:
+        user = db.get(models.User, user_id)
+        before = count_queries.count
+        _list_challenge_shorts(db, user, include_all)
+        return count_queries.count - before
+    finally:
+        db.close()
+
+
+def _detail_queries(challenge_id: int, user_id: int, count_queries) -> int:
+    db = SessionLocal()
+    try:
+        user = db.get(models.User, user_id)
+        before = count_queries.count
+        detail, _ = _get_challenge(challenge_id, None, None, None, db, user)
+        assert detail is not None
+        return count_queries.count - before
+    finally:
+        db.close()
+
+
+def test_list_query_count_does_not_grow_with_challenges(db, count_queries):
+    one, many = make_user(db), make_user(db)
+    make_challenge(db, one)
+    for _ in range(15):
+        make_challenge(db, many, members=[one])
+
+    assert _list_queries(one.id, count_queries) == _list_queries(many.id, count_queries) == 1
+
+
+def test_list_query_count_for_superadmin(db, count_queries):
+    admin = make_user(db)
+    before = _list_queries(admin.id, count_queries, include_all=True)
+    for _ in range(10):
+        make_challenge(db, make_user(db))
+
+    assert _list_queries(admin.id, count_queries, include_all=True) == before
+
+
+def test_detail_query_count_does_not_grow_with_participants(db, count_queries):
+    owner = make_user(db)
+    small = make_challenge(db, owner)
+    members = [make_user(db) for _ in range(20)]
+    big = make_challenge(db, owner, members=members)
+    # Последние nudge владельца собираются одним сгруппированным запросом
+    for member in members[:5]:
+        db.add(models.Nudge(from_user_id=owner.id, to_user_id=member.id, challenge_id=big.id))
+    db.commit()
+
+    assert _detail_queries(small.id, owner.id, count_queries) == _detail_queries(big.id, owner.id, count_queries)
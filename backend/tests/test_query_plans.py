@@ -0,0 +1,169 @@
+"""Горячие запросы routers/challenges.py на мигрированной схеме идут по индексам (EXPLAIN QUERY PLAN)."""
+from datetime import datetime, timedelta
+
+import pytest
+from conftest import make_challenge, make_user
+from sqlalchemy import create_engine, event, inspect, text, update
+
+from app import models
+from app.db import IS_SQLITE, Base, engine
+from app.migrations import run_migrations
+from app.routers.challenges import (
+    _get_challenge,
+    _get_challenge_messages,
+    _get_stats,
+    _list_challenge_shorts,
+    _send_nudge,
+)
+
+# Планы читаются через EXPLAIN QUERY PLAN — это SQLite
+pytestmark = pytest.mark.skipif(not IS_SQLITE, reason="EXPLAIN QUERY PLAN is SQLite-specific")
+
+
+class _CapturePlans:
+    """Собирает SELECT'ы, выполненные внутри with, и строит по ним EXPLAIN QUERY PLAN."""
+
+    def __init__(self) -> None:
+        self.statements: list[tuple[str, object]] = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if statement.lstrip().upper().startswith("SELECT"):
+            self.statements.append((statement, parameters))
+
+    def __enter__(self) -> "_CapturePlans":
+        event.listen(engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        event.remove(engine, "before_cursor_execute", self)
+
+    def plans(self) -> list[str]:
+        """Строки планов всех запросов."""
+        with engine.connect() as conn:
+            return [
+                row[3]
+                for statement, parameters in self.statements
+                for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            ]
+
+
+def _assert_uses(plans: list[str], index: str) -> None:
+    assert any(f"USING INDEX {index}" in line or f"USING COVERING INDEX {index}" in line for line in plans), plans
+
+
+def _assert_no_progress_scan(plans: list[str]) -> None:
+    assert not [line for line in plans if line.startswith("SCAN daily_progress")], plans
+
+
+def _nudge_setup(db):
+    """Челлендж, где owner может пнуть member: оба отметились сегодня, member — больше часа назад."""
+    owner, member = make_user(db), make_user(db)
+    challenge = make_challenge(db, owner, members=[member])
+    db.execute(
+        update(models.DailyProgress)
+        .where(models.DailyProgress.user_id == member.id)
+        .values(updated_at=datetime.utcnow() - timedelta(hours=2))
+    )
+    db.commit()
+    return challenge, owner, member
+
+
+def test_nudge_queries_use_recent_progress_and_pair_indexes(db):
+    challenge, owner, member = _nudge_setup(db)
+
+    with _CapturePlans() as capture:
+        _send_nudge(challenge.id, member.id, db, owner)
+    plans = capture.plans()
+
+    _assert_uses(plans, "ix_daily_progress_recent")
+    _assert_uses(plans, "ix_nudges_pair_created")
+    _assert_no_progress_scan(plans)
+
+
+def test_detail_last_nudges_use_pair_index(db):
+    challenge, owner, member = _nudge_setup(db)
+    _send_nudge(challenge.id, member.id, db, owner)
+
+    with _CapturePlans() as capture:
+        _get_challenge(challenge.id, None, None, None, db, owner)
+    plans = capture.plans()
+
+    _assert_uses(plans, "ix_nudges_pair_created")
+    _assert_no_progress_scan(plans)
+
+
+def test_list_uses_participant_user_index(db):
+    user = make_user(db)
+    for _ in range(3):
+        make_challenge(db, make_user(db), members=[user])
+
+    with _CapturePlans() as capture:
+        _list_challenge_shorts(db, user, include_all=False)
+    plans = capture.plans()
+
+    _assert_uses(plans, "ix_challenge_participants_user")
+    _assert_no_progress_scan(plans)
+
+
+def test_chat_history_uses_cursor_index(db):
+    owner = make_user(db)
+    challenge = make_challenge(db, owner)
+    messages = [
+        models.ChallengeMessage(challenge_id=challenge.id, user_id=owner.id, text=f"m{i}") for i in range(5)
+    ]
+    db.add_all(messages)
+    db.commit()
+
+    with _CapturePlans() as capture:
+        _get_challenge_messages(challenge.id, None, None, 50, db, owner)
+        _get_challenge_messages(challenge.id, messages[3].id, None, 50, db, owner)
+        _get_challenge_messages(challenge.id, None, messages[1].id, 50, db, owner)
+    plans = capture.plans()
+
+    _assert_uses(plans, "ix_challenge_messages_cursor")
+    assert not [line for line in plans if line.startswith("SCAN challenge_messages")], plans
+
+
+def test_stats_timeline_does_not_scan_progress(db):
+    owner = make_user(db)
+    challenge = make_challenge(db, owner, members=[make_user(db)])
+
+    with _CapturePlans() as capture:
+        _get_stats(challenge.id, True, db, owner)
+    plans = capture.plans()
+
+    # Диапазон дат — по уникальному индексу uix_progress_day (в SQLite он sqlite_autoindex_*)
+    assert any(line.startswith("SEARCH daily_progress") and "date>?" in line for line in plans), plans
+    _assert_no_progress_scan(plans)
+
+
+def test_migrations_create_hot_path_indexes_on_old_database(tmp_path):
+    # БД, созданная до шага 2: таблицы есть, индексов под горячие запросы нет
+    old = create_engine(f"sqlite:///{tmp_path}/old.db")
+    Base.metadata.create_all(bind=old)
+    hot = {
+        "daily_progress": "ix_daily_progress_recent",
+        "nudges": "ix_nudges_pair_created",
+        "challenge_participants": "ix_challenge_participants_user",
+        "challenge_messages": "ix_challenge_messages_cursor",
+    }
+    with old.begin() as conn:
+        for index in hot.values():
+            conn.execute(text(f"DROP INDEX {index}"))
+
+    run_migrations(old)
+
+    inspector = inspect(old)
+    for table, index in hot.items():
+        assert index in {ix["name"] for ix in inspector.get_indexes(table)}, (table, index)
+    with old.connect() as conn:
+        plan = [
+            row[3]
+            for row in conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT * FROM daily_progress "
+                "WHERE challenge_id = 1 AND user_id = 2 AND updated_at IS NOT NULL "
+                "ORDER BY updated_at DESC LIMIT 1"
+            )
+        ]
+    _assert_uses(plan, "ix_daily_progress_recent")
+    old.dispose()
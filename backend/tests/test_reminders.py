@@ -0,0 +1,120 @@
+"""Вечерние напоминания: кому пишем, не дважды за день, 403 выключает чат."""
+import asyncio
+import json
+from datetime import date, datetime, timedelta
+
+import httpx
+from conftest import make_challenge, make_user
+
+from app import models, outbox, reminders, telegram_bot
+
+# День рассылки далеко впереди: в него идут только челленджи этого файла
+_DAY = date.today() + timedelta(days=1000)
+
+
+def _running(db, owner, members=(), **fields) -> models.Challenge:
+    fields = {"start_date": _DAY - timedelta(days=5), "end_date": _DAY + timedelta(days=5), **fields}
+    return make_challenge(db, owner, members=members, **fields)
+
+
+def _completed(db, challenge, user, day: date = _DAY) -> None:
+    db.add(
+        models.DailyProgress(
+            challenge_id=challenge.id,
+            user_id=user.id,
+            date=day,
+            value=10,
+            completed=True,
+            updated_at=datetime.utcnow(),
+        )
+    )
+    db.commit()
+
+
+def _queued(db, day: date) -> dict[int, str]:
+    """chat_id -> текст напоминаний рассылки day."""
+    rows = db.query(models.OutboundMessage).filter_by(batch=reminders.batch_name(day)).all()
+    texts = {row.chat_id: json.loads(row.payload)["text"] for row in rows}
+    assert len(texts) == len(rows), "больше одного напоминания в один чат"
+    return texts
+
+
+def test_reminds_only_active_chats_with_unfinished_running_challenges(db, monkeypatch):
+    monkeypatch.setattr(telegram_bot, "BOT_USERNAME", "repday_test_bot")
+    # Страница меньше числа получателей — проверяется и переход между страницами
+    monkeypatch.setattr(reminders, "REMINDER_BATCH_SIZE", 2)
+    owner = make_user(db, bot_chat_active=True)
+    two_pending = make_user(db, bot_chat_active=True)
+    done = make_user(db, bot_chat_active=True)
+    half_done = make_user(db, bot_chat_active=True)
+    inactive = make_user(db, bot_chat_active=False)
+    only_ended = make_user(db, bot_chat_active=True)
+
+    first = _running(db, owner, members=[two_pending, done, half_done, inactive])
+    second = _running(db, owner, members=[two_pending, half_done])
+    _running(db, only_ended, end_date=_DAY - timedelta(days=1))
+    _running(db, only_ended, archived_at=datetime.utcnow())
+    _completed(db, first, owner)
+    _completed(db, first, done)
+    _completed(db, second, half_done)
+
+    assert reminders.enqueue_reminders(db, _DAY) == 3
+    texts = _queued(db, _DAY)
+    assert set(texts) == {owner.telegram_id, two_pending.telegram_id, half_done.telegram_id}
+    assert "в 2 челленджах" in texts[two_pending.telegram_id]
+    assert f"«{first.title}»" in texts[half_done.telegram_id]
+    db.expire_all()
+    assert db.get(models.User, owner.id).reminded_on == _DAY
+    assert db.get(models.User, done.id).reminded_on is None
+
+
+def test_rerun_on_the_same_day_sends_nothing(db, monkeypatch):
+    monkeypatch.setattr(telegram_bot, "BOT_USERNAME", "repday_test_bot")
+    day = _DAY + timedelta(days=1)
+    owner = make_user(db, bot_chat_active=True)
+    _running(db, owner)
+
+    assert reminders.enqueue_reminders(db, day) >= 1
+    queued = _queued(db, day)
+    assert owner.telegram_id in queued
+
+    # Рестарт, второй воркер или ручной запуск в тот же день
+    assert reminders.enqueue_reminders(db, day) == 0
+    assert _queued(db, day) == queued
+
+    # А на следующий день — снова
+    next_day = day + timedelta(days=1)
+    reminders.enqueue_reminders(db, next_day)
+    assert owner.telegram_id in _queued(db, next_day)
+
+
+def test_blocked_bot_deactivates_chat(db, monkeypatch):
+    monkeypatch.setattr(telegram_bot, "BOT_USERNAME", "repday_test_bot")
+    day = _DAY + timedelta(days=3)
+    blocker = make_user(db, bot_chat_active=True)
+    _running(db, blocker)
+    reminders.enqueue_reminders(db, day)
+    message = (
+        db.query(models.OutboundMessage)
+        .filter_by(batch=reminders.batch_name(day), chat_id=blocker.telegram_id)
+        .one()
+    )
+
+    def forbidden(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(403, json={"ok": False, "description": "Forbidden: bot was blocked by the user"})
+
+    async def send() -> outbox.SendResult:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(forbidden)) as client:
+            return await outbox.call_bot_api(client, message.method, json.loads(message.payload))
+
+    result = asyncio.run(send())
+    assert result.blocked and not result.retryable
+    assert outbox._record_result(message.id, message.chat_id, 1, result) == "failed"
+
+    db.expire_all()
+    assert db.get(models.User, blocker.id).bot_chat_active is False
+    assert db.get(models.OutboundMessage, message.id).status == "failed"
+    # Заблокировавший бота в следующую рассылку не попадает
+    next_day = day + timedelta(days=1)
+    reminders.enqueue_reminders(db, next_day)
+    assert blocker.telegram_id not in _queued(db, next_day)
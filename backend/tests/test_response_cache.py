@@ -0,0 +1,88 @@
+"""Кэш ответов: токен поколения против гонки с записью, сброс при смене даты, LRU по байтам."""
+from datetime import date, timedelta
+
+from app import response_cache
+from app.cache import ResponseCache
+
+
+def test_value_computed_before_invalidation_is_not_stored():
+    cache: ResponseCache[str, str] = ResponseCache(1024)
+    tag = ("challenge", 1)
+
+    # Чтение взяло токен, запись закоммитилась и инвалидировала тег, чтение закончилось
+    token = cache.token()
+    cache.invalidate(tag)
+    assert cache.set("detail", "stale", 10, (tag,), token) is False
+    assert cache.get("detail") is None
+    assert cache.stats()["rejected"] == 1
+
+    # Инвалидация другого тега значение не отклоняет
+    token = cache.token()
+    cache.invalidate(("challenge", 2))
+    assert cache.set("detail", "fresh", 10, (tag,), token) is True
+    assert cache.get("detail") == "fresh"
+
+    # clear() отклоняет все токены, взятые до него
+    token = cache.token()
+    cache.clear()
+    assert cache.set("detail", "stale", 10, (tag,), token) is False
+
+
+def test_module_put_after_invalidate_challenge_is_dropped():
+    key = response_cache.key("detail", 10_001, 1)
+    token = response_cache.token()
+    response_cache.invalidate_challenge(10_001)
+    response_cache.put(key, b"stale", 5, (response_cache.challenge_tag(10_001),), token)
+    assert response_cache.get(key) is None
+
+    token = response_cache.token()
+    response_cache.put(key, b"fresh", 5, (response_cache.challenge_tag(10_001),), token)
+    assert response_cache.get(key) == b"fresh"
+
+
+def test_date_rollover_clears_cache(monkeypatch):
+    # После теста модуль вернётся к сегодняшнему дню
+    monkeypatch.setattr(response_cache, "_day", response_cache._day)
+    key = response_cache.key("stats", 10_002, 1, False)
+    response_cache.put(key, b"today", 5, (response_cache.challenge_tag(10_002),), response_cache.token())
+    assert response_cache.get(key) == b"today"
+    rollovers = response_cache.stats()["rollovers"]
+
+    tomorrow = date.today() + timedelta(days=1)
+
+    class _Tomorrow(date):
+        @classmethod
+        def today(cls) -> date:
+            return tomorrow
+
+    monkeypatch.setattr(response_cache, "date", _Tomorrow)
+
+    # Ключ нового дня другой, а записи вчерашнего дня удалены целиком
+    new_key = response_cache.key("stats", 10_002, 1, False)
+    assert new_key != key
+    assert response_cache.get(key) is None
+    assert len(response_cache.cache) == 0
+    assert response_cache.stats()["rollovers"] == rollovers + 1
+
+
+def test_byte_cap_evicts_least_recently_used():
+    cache: ResponseCache[str, str] = ResponseCache(100)
+    tag = ("challenge", 1)
+    cache.set("a", "a", 40, (tag,), cache.token())
+    cache.set("b", "b", 40, (tag,), cache.token())
+    # После чтения «a» дольше всех не использовалась «b»
+    assert cache.get("a") == "a"
+
+    cache.set("c", "c", 40, (tag,), cache.token())
+    assert cache.get("b") is None
+    assert cache.get("a") == "a" and cache.get("c") == "c"
+    stats = cache.stats()
+    assert stats["bytes"] == 80 and stats["evictions"] == 1
+
+    # Больше лимита целиком — не сохраняется и ничего не вытесняет
+    assert cache.set("huge", "x", 101, (tag,), cache.token()) is False
+    assert len(cache) == 2
+
+    # Вытесненная запись ушла и из индекса тегов
+    assert cache.invalidate(tag) == 2
+    assert cache.stats()["bytes"] == 0
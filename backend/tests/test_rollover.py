@@ -0,0 +1,156 @@
+"""Смена дня: итоги закрытых дней, обнуление прерванных серий, архивация и догон пропущенных дней."""
+from datetime import date, datetime, timedelta
+
+from conftest import make_challenge, make_user
+
+from app import aggregates, models, rollover
+from app.routers.challenges import _get_stats
+
+_DAY = timedelta(days=1)
+
+
+def _progress(db, challenge, user, day: date, value: int, completed: bool) -> None:
+    db.add(
+        models.DailyProgress(
+            challenge_id=challenge.id,
+            user_id=user.id,
+            date=day,
+            value=value,
+            completed=completed,
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+
+def _challenge(db, owner, members=(), history=(), **fields) -> models.Challenge:
+    """Челлендж с прогрессом history = [(user, дней назад, value, completed)] и пересчитанными агрегатами."""
+    challenge = make_challenge(db, owner, members=members, **fields)
+    today = date.today()
+    for user, days_ago, value, completed in history:
+        _progress(db, challenge, user, today - days_ago * _DAY, value, completed)
+    db.commit()
+    aggregates.recompute_all(db, challenge.id)
+    db.commit()
+    return challenge
+
+
+def _summaries(db, challenge_id: int) -> dict:
+    rows = db.query(models.DailySummary).filter_by(challenge_id=challenge_id).all()
+    return {(s.user_id, s.date): (s.value, s.percent, s.completed) for s in rows}
+
+
+def _participant(db, challenge_id: int, user_id: int) -> models.ChallengeParticipant:
+    return db.query(models.ChallengeParticipant).filter_by(challenge_id=challenge_id, user_id=user_id).one()
+
+
+def test_summaries_streaks_and_catch_up(db):
+    owner, member = make_user(db), make_user(db)
+    today = date.today()
+    challenge = _challenge(
+        db,
+        owner,
+        members=[member],
+        start_date=today - 4 * _DAY,
+        daily_goal=10,
+        history=[
+            (owner, 3, 5, False),
+            (owner, 2, 10, True),
+            (owner, 1, 10, True),
+            (member, 4, 10, True),
+            (member, 3, 4, False),
+        ],
+    )
+    assert _participant(db, challenge.id, member.id).streak_current == 1
+
+    # Смена дня два дня не выполнялась: закрыты только первые два дня
+    rollover.close_days(db, today - 2 * _DAY)
+    assert db.get(models.Challenge, challenge.id).summarized_through == today - 3 * _DAY
+    assert len(_summaries(db, challenge.id)) == 4
+
+    # Следующий запуск догоняет пропущенные дни, сегодняшний остаётся открытым
+    rollover.close_days(db, today)
+    ch = db.get(models.Challenge, challenge.id)
+    assert ch.summarized_through == today - _DAY and ch.archived_at is None
+    ago = [today - n * _DAY for n in range(5)]
+    assert _summaries(db, challenge.id) == {
+        (owner.id, ago[4]): (0, 0.0, False),
+        (owner.id, ago[3]): (5, 50.0, False),
+        (owner.id, ago[2]): (10, 100.0, True),
+        (owner.id, ago[1]): (10, 100.0, True),
+        (member.id, ago[4]): (10, 100.0, True),
+        (member.id, ago[3]): (4, 40.0, False),
+        (member.id, ago[2]): (0, 0.0, False),
+        (member.id, ago[1]): (0, 0.0, False),
+    }
+
+    # Серия участника прервалась позавчера — обнулена; серия владельца продолжается со вчера
+    assert _participant(db, challenge.id, member.id).streak_current == 0
+    owner_row = _participant(db, challenge.id, owner.id)
+    assert (owner_row.streak_current, owner_row.streak_best) == (2, 2)
+
+    # Повторный запуск в тот же день ничего не закрывает
+    rollover.close_days(db, today)
+    assert len(_summaries(db, challenge.id)) == 8
+
+
+def test_summary_written_by_history_edit_is_kept(db):
+    owner = make_user(db)
+    today = date.today()
+    challenge = _challenge(db, owner, start_date=today - _DAY, daily_goal=10, history=[(owner, 1, 3, False)])
+    # Правка вчерашнего дня уже записала итог — смена дня его не перетирает
+    rollover.write_summary(db, challenge.id, owner.id, today - _DAY, 8, False, 10)
+    db.commit()
+
+    rollover.close_days(db, today)
+    assert _summaries(db, challenge.id) == {(owner.id, today - _DAY): (8, 80.0, False)}
+
+
+def test_ended_challenge_is_archived_and_skipped(db):
+    owner = make_user(db)
+    today = date.today()
+    ended = _challenge(
+        db,
+        owner,
+        start_date=today - 5 * _DAY,
+        end_date=today - 2 * _DAY,
+        history=[(owner, 3, 10, True)],
+    )
+    ends_today = _challenge(db, owner, start_date=today - 2 * _DAY, end_date=today)
+
+    rollover.close_days(db, today)
+    ch = db.get(models.Challenge, ended.id)
+    assert ch.archived_at is not None
+    # Итоги — только по дням челленджа, после end_date строк нет
+    assert ch.summarized_through == today - 2 * _DAY
+    assert sorted(d for _, d in _summaries(db, ended.id)) == [today - days * _DAY for days in (5, 4, 3, 2)]
+    assert db.get(models.Challenge, ends_today.id).archived_at is None
+
+    # Архивный челлендж больше не обходится: удалённые итоги не восстанавливаются
+    archived_at = ch.archived_at
+    db.query(models.DailySummary).filter_by(challenge_id=ended.id).delete()
+    db.commit()
+    rollover.close_days(db, today)
+    assert db.get(models.Challenge, ended.id).archived_at == archived_at
+    assert _summaries(db, ended.id) == {}
+
+
+def test_stats_from_summaries_match_calendar_walk(db):
+    owner, member = make_user(db), make_user(db)
+    today = date.today()
+    challenge = _challenge(
+        db,
+        owner,
+        members=[member],
+        start_date=today - 6 * _DAY,
+        daily_goal=10,
+        history=[(owner, 6, 10, True), (owner, 4, 7, False), (owner, 2, 12, True), (owner, 1, 3, False)],
+    )
+
+    # До смены дня статистика собирается из daily_progress по календарю
+    walked = _get_stats(challenge.id, True, db, owner)
+    assert not db.query(models.DailySummary).filter_by(challenge_id=challenge.id).count()
+
+    rollover.close_days(db, today)
+    assert db.query(models.DailySummary).filter_by(challenge_id=challenge.id, user_id=owner.id).count() == 6
+    assert _get_stats(challenge.id, True, db, owner) == walked
+    assert walked["completed_days"] == 2 and walked["missed_days"] == 5
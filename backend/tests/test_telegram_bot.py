@@ -0,0 +1,40 @@
+"""Тексты сообщений бота с parse_mode HTML: пользовательский текст экранируется."""
+import json
+
+from conftest import make_challenge, make_user
+
+from app import models, telegram_bot
+
+
+def _queued_payload(db, chat_id: int) -> dict:
+    message = (
+        db.query(models.OutboundMessage)
+        .filter_by(chat_id=chat_id)
+        .order_by(models.OutboundMessage.id.desc())
+        .first()
+    )
+    return json.loads(message.payload)
+
+
+def test_nudge_message_escapes_title_and_name(db, monkeypatch):
+    monkeypatch.setattr(telegram_bot, "BOT_TOKEN", "test")
+    monkeypatch.setattr(telegram_bot, "BOT_USERNAME", "repday_test_bot")
+    sender = make_user(db, display_name="<b>Vasya</b>")
+    receiver = make_user(db)
+    challenge = make_challenge(db, sender, members=[receiver], title="a<b & c")
+
+    assert telegram_bot.enqueue_nudge_message(db, receiver.id, sender.id, challenge.id)
+    db.commit()
+
+    payload = _queued_payload(db, receiver.telegram_id)
+    assert payload["parse_mode"] == "HTML"
+    assert "«a&lt;b &amp; c»" in payload["text"]
+    assert payload["text"].startswith("&lt;b&gt;Vasya&lt;/b&gt; пнул(а)")
+
+
+def test_reminder_payload_escapes_title(monkeypatch):
+    monkeypatch.setattr(telegram_bot, "BOT_USERNAME", "repday_test_bot")
+
+    payload = telegram_bot.reminder_payload(1, "a<b & c", "code", pending=1)
+
+    assert "«a&lt;b &amp; c»" in payload["text"]
@@ -0,0 +1,347 @@
+"""
+Воспроизводимый бенчмарк API: синтетические данные + смешанная нагрузка как у фронтенда.
+
+Во временную SQLite-базу засеваются --users пользователей, --challenges челленджей по
+--participants участников и --days дней истории (DailyProgress, тычки, чат), агрегаты
+участников пересчитываются как в проде. Затем приложение гоняется в процессе через
+httpx.ASGITransport (без сети и uvicorn): --requests запросов с параллельностью
+--concurrency, операции выбираются по весам WORKLOAD из генератора с --seed, так что
+при одних параметрах последовательность запросов одна и та же.
+
+Итог — общий RPS, p50/p95/p99 и по каждой операции: RPS, перцентили, SQL-запросов на
+запрос (из app.metrics) и ошибки. Результат сохраняется в JSON (--json), а с --baseline
+печатается сравнение с прошлым прогоном:
+
+    python -m tools.bench_api --json before.json
+    python -m tools.bench_api --json after.json --baseline before.json
+
+Из каталога backend. DB_MODE и прочие настройки приложения берутся из окружения;
+--threadpool задаёт размер threadpool Starlette (по умолчанию 40 потоков AnyIO).
+Сравнение DB_MODE=threadpool и async на одной нагрузке — tools.bench_db_mode.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+# Операция, её доля в нагрузке и маршрут (для SQL-запросов на запрос из app.metrics)
+WORKLOAD = [
+    ("list", 0.20, "GET", "/challenges"),
+    ("detail", 0.35, "GET", "/challenges/{challenge_id}"),
+    ("progress", 0.20, "POST", "/challenges/{challenge_id}/progress"),
+    ("stats", 0.10, "GET", "/challenges/{challenge_id}/stats"),
+    ("chat_read", 0.10, "GET", "/challenges/{challenge_id}/messages"),
+    ("chat_send", 0.05, "POST", "/challenges/{challenge_id}/messages"),
+]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def _seed(db, args: argparse.Namespace) -> dict[int, list[int]]:
+    """Засевает базу; возвращает для каждого пользователя его челленджи."""
+    from sqlalchemy import insert
+
+    from app import aggregates, models
+
+    rnd = random.Random(args.seed)
+    today = date.today()
+    start = today - timedelta(days=args.days - 1)
+    now = datetime.utcnow()
+
+    db.execute(
+        insert(models.User),
+        [
+            {"id": u, "telegram_id": 10_000_000 + u, "display_name": f"Участник {u}", "created_at": now, "updated_at": now}
+            for u in range(1, args.users + 1)
+        ],
+    )
+    db.execute(
+        insert(models.Challenge),
+        [
+            {
+                "id": c,
+                "title": f"Челлендж {c}",
+                "goal_type": "reps",
+                "daily_goal": 100,
+                "unit": "раз",
+                # Идёт ещё месяц после сегодняшнего дня
+                "duration_days": args.days + 30,
+                "start_date": start,
+                "end_date": start + timedelta(days=args.days + 29),
+                "is_public": True,
+                "invite_code": f"bench{c}",
+                "creator_id": 1 + (c - 1) % args.users,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for c in range(1, args.challenges + 1)
+        ],
+    )
+
+    members: dict[int, list[int]] = {}
+    participants, progress, nudges, messages = [], [], [], []
+    for c in range(1, args.challenges + 1):
+        owner = 1 + (c - 1) % args.users
+        others = [u for u in range(1, args.users + 1) if u != owner]
+        users = [owner] + rnd.sample(others, min(len(others), args.participants - 1))
+        for u in users:
+            members.setdefault(u, []).append(c)
+            participants.append(
+                {"challenge_id": c, "user_id": u, "role": "owner" if u == owner else "member", "joined_at": now}
+            )
+            # Пропуски дней — чтобы серии были разной длины
+            for d in range(args.days):
+                if rnd.random() < 0.8:
+                    value = rnd.randint(0, 150)
+                    progress.append(
+                        {
+                            "challenge_id": c,
+                            "user_id": u,
+                            "date": start + timedelta(days=d),
+                            "value": value,
+                            "completed": value >= 100,
+                            "updated_at": now,
+                        }
+                    )
+        for _ in range(args.nudges):
+            from_user, to_user = rnd.sample(users, 2)
+            nudges.append({"from_user_id": from_user, "to_user_id": to_user, "challenge_id": c, "created_at": now})
+        for i in range(args.messages):
+            messages.append(
+                {
+                    "challenge_id": c,
+                    "user_id": rnd.choice(users),
+                    "text": f"сообщение {i}",
+                    "created_at": now - timedelta(minutes=args.messages - i),
+                }
+            )
+    db.execute(insert(models.ChallengeParticipant), participants)
+    db.execute(insert(models.DailyProgress), progress)
+    if nudges:
+        db.execute(insert(models.Nudge), nudges)
+    if messages:
+        db.execute(insert(models.ChallengeMessage), messages)
+    aggregates.recompute_all(db)
+    db.commit()
+    return members
+
+
+async def _drive(client, members: dict[int, list[int]], args: argparse.Namespace) -> dict:
+    from jose import jwt
+
+    from app.deps import ALGORITHM, SECRET_KEY
+
+    tokens = {
+        u: f"Bearer {jwt.encode({'sub': str(u)}, SECRET_KEY, algorithm=ALGORITHM)}" for u in members
+    }
+    rnd = random.Random(args.seed)
+    users = sorted(members)
+    names = [name for name, *_ in WORKLOAD]
+    weights = [w for _, w, *_ in WORKLOAD]
+    # План запросов заранее: от параллельности и скорости он не зависит
+    plan = []
+    for _ in range(args.requests):
+        user = rnd.choice(users)
+        plan.append((rnd.choices(names, weights)[0], user, rnd.choice(members[user]), rnd.randint(1, 5)))
+
+    today = str(date.today())
+    latencies: dict[str, list[float]] = {name: [] for name in names}
+    errors: dict[str, int] = {name: 0 for name in names}
+    queue = iter(plan)
+
+    async def request(op: str, user: int, challenge_id: int, delta: int):
+        headers = {"Authorization": tokens[user]}
+        if op == "list":
+            return await client.get("/challenges", headers=headers)
+        if op == "detail":
+            return await client.get(f"/challenges/{challenge_id}", headers=headers)
+        if op == "progress":
+            return await client.post(
+                f"/challenges/{challenge_id}/progress", json={"date": today, "delta": delta}, headers=headers
+            )
+        if op == "stats":
+            return await client.get(f"/challenges/{challenge_id}/stats", headers=headers)
+        if op == "chat_read":
+            return await client.get(f"/challenges/{challenge_id}/messages", headers=headers)
+        return await client.post(
+            f"/challenges/{challenge_id}/messages", json={"text": f"тап {delta}"}, headers=headers
+        )
+
+    async def worker() -> None:
+        for op, user, challenge_id, delta in queue:
+            started = time.perf_counter()
+            r = await request(op, user, challenge_id, delta)
+            latencies[op].append(time.perf_counter() - started)
+            if r.status_code >= 400:
+                errors[op] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    from app import metrics
+
+    routes = metrics.registry.snapshot()
+    every = [x for values in latencies.values() for x in values]
+    result = {
+        "requests": len(every),
+        "errors": sum(errors.values()),
+        "seconds": elapsed,
+        "rps": len(every) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(every, 0.50) * 1000,
+        "p95_ms": _percentile(every, 0.95) * 1000,
+        "p99_ms": _percentile(every, 0.99) * 1000,
+        "operations": {},
+    }
+    for name, _, method, route in WORKLOAD:
+        values = latencies[name]
+        route_stats = routes.get((method, route), {})
+        count = route_stats.get("count", 0)
+        result["operations"][name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "rps": len(values) / elapsed if elapsed else 0.0,
+            "mean_ms": statistics.fmean(values) * 1000 if values else 0.0,
+            "p50_ms": _percentile(values, 0.50) * 1000,
+            "p95_ms": _percentile(values, 0.95) * 1000,
+            "p99_ms": _percentile(values, 0.99) * 1000,
+            "queries_per_request": route_stats.get("queries", 0) / count if count else 0.0,
+            "queries_max": route_stats.get("queries_max", 0),
+            "sql_ms_per_request": route_stats.get("sql_seconds", 0.0) * 1000 / count if count else 0.0,
+            "bytes_per_request": route_stats.get("response_bytes", 0) / count if count else 0.0,
+        }
+    return result
+
+
+async def run(args: argparse.Namespace) -> dict:
+    import httpx
+
+    from app import metrics
+    from app.db import SessionLocal, dispose_async_engine
+    from app.main import app
+
+    if args.threadpool:
+        import anyio.to_thread
+
+        anyio.to_thread.current_default_thread_limiter().total_tokens = args.threadpool
+
+    db = SessionLocal()
+    seeding_started = time.perf_counter()
+    members = _seed(db, args)
+    db.close()
+    seed_seconds = time.perf_counter() - seeding_started
+
+    # Ошибка приложения — это ответ 500 в статистике, а не исключение в клиенте
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        if args.warmup:
+            warmup = argparse.Namespace(**{**vars(args), "requests": args.warmup, "seed": args.seed + 1})
+            await _drive(client, members, warmup)
+        metrics.registry.reset()
+        result = await _drive(client, members, args)
+    # lifespan приложения здесь не запускается — закрываем пул сами
+    await dispose_async_engine()
+
+    return {
+        "params": {
+            key: getattr(args, key)
+            for key in (
+                "users", "challenges", "participants", "days", "nudges", "messages",
+                "requests", "warmup", "concurrency", "threadpool", "seed",
+            )
+        },
+        "environment": {
+            "db_mode": os.getenv("DB_MODE", "threadpool"),
+            "response_cache": os.getenv("RESPONSE_CACHE_MAX_BYTES", "default"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": str(date.today()),
+        },
+        "seed_seconds": seed_seconds,
+        "result": result,
+    }
+
+
+def _print(report: dict, baseline: dict | None) -> None:
+    def delta(new: float, old: float | None) -> str:
+        if not old:
+            return ""
+        return f" ({(new - old) / old:+.0%})"
+
+    result = report["result"]
+    base = baseline["result"] if baseline else {}
+    base_ops = base.get("operations", {})
+    print(
+        f"{result['requests']} requests in {result['seconds']:.2f}s: "
+        f"{result['rps']:.1f} rps{delta(result['rps'], base.get('rps'))}, "
+        f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms{delta(result['p95_ms'], base.get('p95_ms'))} "
+        f"p99={result['p99_ms']:.1f}ms, errors={result['errors']}"
+    )
+    print(f"{'operation':10} {'requests':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'queries':>8} {'bytes':>9} {'errors':>6}")
+    for name, op in result["operations"].items():
+        old = base_ops.get(name, {})
+        print(
+            f"{name:10} {op['requests']:>8} {op['p50_ms']:>7.1f}ms {op['p95_ms']:>7.1f}ms {op['p99_ms']:>7.1f}ms "
+            f"{op['queries_per_request']:>8.1f} {op['bytes_per_request']:>9.0f} {op['errors']:>6}"
+            + (
+                f"   p95{delta(op['p95_ms'], old.get('p95_ms'))} queries{delta(op['queries_per_request'], old.get('queries_per_request'))}"
+                if old
+                else ""
+            )
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Смешанная нагрузка на API в процессе на синтетических данных")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--challenges", type=int, default=20)
+    parser.add_argument("--participants", type=int, default=50)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--nudges", type=int, default=20, help="Тычков на челлендж")
+    parser.add_argument("--messages", type=int, default=200, help="Сообщений чата на челлендж")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--threadpool", type=int, default=None, help="Потоков в threadpool Starlette")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", default=None, help="Сохранить результаты в файл")
+    parser.add_argument("--baseline", default=None, help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+    if args.participants < 2 or args.participants > args.users:
+        parser.error("--participants must be between 2 and --users")
+
+    # Своя временная база: приложение создаёт её при импорте app.main
+    workdir = tempfile.mkdtemp(prefix="repday-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/repday.db"
+    os.environ["SHARED_STATE_URL"] = f"sqlite:///{workdir}/repday.shared.db"
+    os.environ["TELEGRAM_BOT_TOKEN"] = ""
+    os.environ["LOCK_DIR"] = workdir
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("params") != report["params"]:
+            print("warning: baseline was run with different parameters", file=sys.stderr)
+    _print(report, baseline)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
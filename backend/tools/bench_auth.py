@@ -0,0 +1,125 @@
+"""
+Микробенчмарк аутентификации: get_current_user с кэшами deps._token_cache / _user_cache и без них.
+
+Во временную SQLite-базу засеваются --users пользователей, для каждого — свой JWT
+с exp (прод-режим: подпись проверяется). Затем deps._resolve_current_user вызывается
+--iterations раз по случайным токенам в трёх режимах:
+
+  cold   — оба кэша сбрасываются перед каждым вызовом: проверка HMAC + SELECT users;
+  token  — кэш токенов тёплый, снимки пользователей сбрасываются: только SELECT users;
+  warm   — оба кэша тёплые: пользователь из снимка через merge(load=False), без SQL.
+
+Для каждого: мкс на вызов, вызовов в секунду и SQL-запросов на вызов.
+
+Запуск (из каталога backend):
+
+    python -m tools.bench_auth --users 1000 --iterations 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def _seed(args: argparse.Namespace) -> dict[int, str]:
+    """Засевает пользователей; возвращает заголовок Authorization каждого."""
+    from jose import jwt
+    from sqlalchemy import insert
+
+    from app import models
+    from app.db import SessionLocal
+    from app.deps import ALGORITHM, SECRET_KEY
+
+    now = datetime.utcnow()
+    db = SessionLocal()
+    db.execute(
+        insert(models.User),
+        [
+            {"id": u, "telegram_id": 10_000_000 + u, "display_name": f"Участник {u}", "created_at": now, "updated_at": now}
+            for u in range(1, args.users + 1)
+        ],
+    )
+    db.commit()
+    db.close()
+    exp = now + timedelta(days=1)
+    return {
+        u: "Bearer " + jwt.encode({"sub": str(u), "exp": exp}, SECRET_KEY, algorithm=ALGORITHM)
+        for u in range(1, args.users + 1)
+    }
+
+
+def _run(mode: str, headers: dict[int, str], args: argparse.Namespace) -> None:
+    from sqlalchemy import event
+
+    from app import deps
+    from app.db import SessionLocal, engine
+
+    queries = 0
+
+    def count(*_) -> None:
+        nonlocal queries
+        queries += 1
+
+    rnd = random.Random(args.seed)
+    order = [headers[rnd.randint(1, args.users)] for _ in range(args.iterations)]
+    deps._token_cache.clear()
+    deps._user_cache.clear()
+    if mode != "cold":
+        # Прогрев: каждый токен уже встречался
+        db = SessionLocal()
+        for authorization in headers.values():
+            deps._resolve_current_user(authorization, db)
+        db.close()
+
+    event.listen(engine, "before_cursor_execute", count)
+    timings: list[float] = []
+    for authorization in order:
+        # Сессия на запрос, как в приложении (get_db)
+        db = SessionLocal()
+        if mode == "cold":
+            deps._token_cache.clear()
+        if mode != "warm":
+            deps._user_cache.clear()
+        started = time.perf_counter()
+        deps._resolve_current_user(authorization, db)
+        timings.append((time.perf_counter() - started) * 1_000_000)
+        db.close()
+    event.remove(engine, "before_cursor_execute", count)
+
+    mean = statistics.mean(timings)
+    print(
+        f"{mode:6} {mean:8.1f}us/call {1_000_000 / mean:9.0f} calls/s "
+        f"p50={statistics.median(timings):.1f}us queries/call={queries / args.iterations:.2f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Стоимость аутентификации запроса с кэшами и без")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="repday-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/repday.db"
+    os.environ["SHARED_STATE_URL"] = ""
+    os.environ["LOCK_DIR"] = workdir
+    # Прод-режим: подпись и exp проверяются
+    os.environ["TELEGRAM_BOT_TOKEN"] = "bench"
+    os.environ.pop("SKIP_INIT_DATA_VALIDATION", None)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from app.db import init_db
+
+    init_db()
+    headers = _seed(args)
+    for mode in ("cold", "token", "warm"):
+        _run(mode, headers, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Байты «на проводе» и CPU на запрос при разных уровнях сжатия ответов API.
+
+Собирает реальные ответы горячих эндпоинтов на большом челлендже (та же база, что
+у tools.bench_serialization) и для каждого сжимает их gzip уровней 1..9 и brotli
+(если установлен пакет brotli) — тем же кодом, что CompressionMiddleware.
+Итог по каждому эндпоинту и уровню: размер, доля от исходного и время сжатия.
+
+Запуск (из каталога backend):
+
+    python -m tools.bench_compression --participants 10000 --days 365
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+GZIP_LEVELS = [1, 3, 5, 6, 9]
+BROTLI_QUALITIES = [1, 3, 4, 5, 8, 11]
+
+
+def _payloads(args: argparse.Namespace) -> list[tuple[str, bytes]]:
+    from app import models, serialization
+    from app.db import SessionLocal
+    from app.routers import challenges
+
+    from .bench_serialization import _seed
+
+    db = SessionLocal()
+    challenge_id, user_id = _seed(db, args.participants, args.days, args.messages)
+    user = db.get(models.User, user_id)
+    handlers = [
+        ("GET /challenges", lambda: challenges._list_challenge_shorts(db, user, include_all=False)),
+        ("GET /challenges/{id}", lambda: challenges._get_challenge_impl(challenge_id, db, user)),
+        ("GET /challenges/{id}/stats", lambda: challenges._get_stats(challenge_id, True, db, user)),
+        (
+            "GET /challenges/{id}/stats?leaderboards=false",
+            lambda: challenges._get_stats(challenge_id, False, db, user),
+        ),
+        (
+            "GET /challenges/{id}/leaderboard",
+            lambda: challenges._get_leaderboard(
+                challenge_id, "total_value", challenges.LEADERBOARD_LIMIT, 0, None, 2, db, user
+            ),
+        ),
+        (
+            "GET /challenges/{id}/messages",
+            lambda: challenges._get_challenge_messages(
+                challenge_id, None, None, challenges.CHAT_MESSAGES_LIMIT, db, user
+            ),
+        ),
+    ]
+    payloads = [(name, serialization.dumps(handler())) for name, handler in handlers]
+    db.close()
+    return payloads
+
+
+def run(args: argparse.Namespace) -> list[dict]:
+    from app.middleware import COMPRESSION_MIN_SIZE, _Compressor, brotli
+
+    from .bench_serialization import _timed
+
+    codecs = [("gzip", level) for level in GZIP_LEVELS]
+    if brotli is not None:
+        codecs += [("br", quality) for quality in BROTLI_QUALITIES]
+    else:
+        print("brotli не установлен — только gzip (pip install brotli)", file=sys.stderr)
+
+    results = []
+    for name, body in _payloads(args):
+        results.append(
+            {"endpoint": name, "encoding": "identity", "level": 0, "bytes": len(body), "ratio": 1.0, "cpu_ms": 0.0}
+        )
+        if len(body) < COMPRESSION_MIN_SIZE:
+            # Middleware такие ответы не сжимает
+            continue
+        for encoding, level in codecs:
+            cpu_ms, compressed = _timed(
+                lambda: _Compressor(encoding, level, level).finish(body), args.repeat
+            )
+            results.append(
+                {
+                    "endpoint": name,
+                    "encoding": encoding,
+                    "level": level,
+                    "bytes": len(compressed),
+                    "ratio": len(compressed) / len(body),
+                    "cpu_ms": cpu_ms,
+                }
+            )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Размер и CPU сжатия ответов API по уровням")
+    parser.add_argument("--participants", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", dest="json_path", default=None, help="Сохранить результаты в файл")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="repday-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/repday.db"
+    os.environ["TELEGRAM_BOT_TOKEN"] = ""
+    os.environ["LOCK_DIR"] = workdir
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    # app.main создаёт схему во временной базе
+    import app.main  # noqa: F401
+
+    results = run(args)
+    print(f"{'endpoint':46} {'encoding':>8} {'level':>5} {'bytes':>9} {'ratio':>6} {'cpu':>9}")
+    for r in results:
+        print(
+            f"{r['endpoint']:46} {r['encoding']:>8} {r['level']:>5} {r['bytes']:>9} "
+            f"{r['ratio']:>6.1%} {r['cpu_ms']:>7.2f}ms"
+        )
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Пропускная способность DB_MODE=threadpool против DB_MODE=async на одной нагрузке.
+
+Для каждого режима и каждой параллельности из --concurrency запускается отдельный
+процесс tools.bench_api (DB_MODE читается при импорте приложения) с одними и теми же
+данными и планом запросов (--seed). Кэш ответов выключен, чтобы каждое чтение шло
+в базу. --threadpool ограничивает threadpool Starlette — так виден всплеск, когда
+запросов в полёте больше, чем потоков: в режиме threadpool они ждут свободный поток,
+в async — только соединение пула (DB_ASYNC_POOL_SIZE).
+
+Итог — таблица RPS и p50/p99 по режимам и прирост async относительно threadpool:
+
+    python -m tools.bench_db_mode --concurrency 16 64 256
+    python -m tools.bench_db_mode --concurrency 64 256 --threadpool 8
+
+Из каталога backend.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("threadpool", "async")
+
+
+def _run(mode: str, concurrency: int, args: argparse.Namespace) -> dict:
+    with tempfile.NamedTemporaryFile(prefix=f"repday-{mode}-", suffix=".json", delete=False) as f:
+        path = f.name
+    command = [
+        sys.executable, "-m", "tools.bench_api",
+        "--json", path,
+        "--concurrency", str(concurrency),
+        "--requests", str(args.requests),
+        "--warmup", str(args.warmup),
+        "--users", str(args.users),
+        "--challenges", str(args.challenges),
+        "--participants", str(args.participants),
+        "--days", str(args.days),
+        "--seed", str(args.seed),
+    ]
+    if args.threadpool:
+        command += ["--threadpool", str(args.threadpool)]
+    env = {**os.environ, "DB_MODE": mode, "RESPONSE_CACHE_MAX_BYTES": "0"}
+    try:
+        # Лог медленных запросов приложения в таблицу не нужен; при падении покажем его хвост
+        proc = subprocess.run(
+            command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+        )
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr[-4000:])
+            raise SystemExit(f"bench_api failed for DB_MODE={mode}, concurrency={concurrency}")
+        with open(path) as f:
+            return json.load(f)["result"]
+    finally:
+        os.unlink(path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="DB_MODE=threadpool против async на нагрузке bench_api")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--threadpool", type=int, default=None, help="Потоков в threadpool Starlette")
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--challenges", type=int, default=20)
+    parser.add_argument("--participants", type=int, default=50)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"threadpool={args.threadpool or 'default'}, requests={args.requests}, response cache off")
+    print(f"{'concurrency':>11} {'mode':10} {'rps':>8} {'p50':>9} {'p99':>9} {'errors':>6}")
+    for concurrency in args.concurrency:
+        results = {mode: _run(mode, concurrency, args) for mode in MODES}
+        for mode, result in results.items():
+            print(
+                f"{concurrency:>11} {mode:10} {result['rps']:>8.1f} {result['p50_ms']:>7.1f}ms "
+                f"{result['p99_ms']:>7.1f}ms {result['errors']:>6}"
+            )
+        base = results["threadpool"]["rps"]
+        if base:
+            print(f"{'':>11} async/threadpool rps: {results['async']['rps'] / base:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Вечерние напоминания на большой базе: отбор получателей, постановка в outbox и доставка.
+
+Во временную SQLite-базу засеваются --users пользователей по --per-user идущих
+челленджей; доля --done уже выполнила сегодняшний день во всех своих челленджах,
+у доли --inactive чат с ботом не активен. Затем:
+
+  enqueue  — reminders.run_once: время, пиковая память Python (tracemalloc, отдельным
+             прогоном) и число поставленных сообщений против ожидаемого; повторный
+             запуск в тот же день должен поставить 0;
+  deliver  — настоящий OutboxSender --deliver-seconds секунд шлёт очередь в
+             tools/fake_telegram_api (в процессе, через httpx.ASGITransport, с его
+             лимитом 30 запросов в секунду): скорость доставки, 429 и ошибки, доля
+             --blocked заблокировала бота (403) и должна получить bot_chat_active = false.
+
+Запуск (из каталога backend):
+
+    python -m tools.bench_reminders --users 100000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+
+def _chunks(rows: list, size: int = 5000):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _seed(db, args: argparse.Namespace) -> int:
+    """Засевает базу; возвращает ожидаемое число напоминаний."""
+    from sqlalchemy import insert
+
+    from app import models
+
+    rnd = random.Random(args.seed)
+    today = date.today()
+    now = datetime.utcnow()
+
+    db.execute(
+        insert(models.Challenge),
+        [
+            {
+                "id": c,
+                "title": f"Челлендж {c}",
+                "goal_type": "reps",
+                "daily_goal": 100,
+                "unit": "раз",
+                "duration_days": 60,
+                "start_date": today - timedelta(days=30),
+                "end_date": today + timedelta(days=29),
+                "is_public": True,
+                "invite_code": f"bench{c}",
+                "creator_id": 1,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for c in range(1, args.challenges + 1)
+        ],
+    )
+
+    expected = 0
+    users, participants, progress = [], [], []
+    for u in range(1, args.users + 1):
+        active = rnd.random() >= args.inactive
+        done = rnd.random() < args.done
+        challenges = rnd.sample(range(1, args.challenges + 1), args.per_user)
+        users.append(
+            {
+                "id": u,
+                "telegram_id": 10_000_000 + u,
+                "display_name": f"Участник {u}",
+                "bot_chat_active": active,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+        for i, c in enumerate(challenges):
+            participants.append({"challenge_id": c, "user_id": u, "role": "member", "joined_at": now})
+            # Невыполнивший день — с частичным прогрессом в одном из челленджей
+            if done or i == 0:
+                progress.append(
+                    {
+                        "challenge_id": c,
+                        "user_id": u,
+                        "date": today,
+                        "value": 100 if done else 40,
+                        "completed": done,
+                        "updated_at": now,
+                    }
+                )
+        expected += active and not done
+
+    for table, rows in (
+        (models.User, users),
+        (models.ChallengeParticipant, participants),
+        (models.DailyProgress, progress),
+    ):
+        for chunk in _chunks(rows):
+            db.execute(insert(table), chunk)
+    db.commit()
+    return expected
+
+
+def _enqueue(args: argparse.Namespace, expected: int) -> None:
+    from sqlalchemy import delete, update
+
+    from app import models, reminders
+    from app.db import SessionLocal
+
+    started = time.perf_counter()
+    total = reminders.run_once()
+    seconds = time.perf_counter() - started
+
+    # Память — отдельным прогоном заново: под tracemalloc время не показательно
+    db = SessionLocal()
+    db.execute(delete(models.OutboundMessage))
+    db.execute(update(models.User).values(reminded_on=None))
+    db.commit()
+    db.close()
+    tracemalloc.start()
+    reminders.run_once()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    again = reminders.run_once()
+    print(
+        f"enqueue: {total} reminders (expected {expected}) in {seconds:.2f}s, "
+        f"{total / seconds if seconds else 0:.0f}/s, peak python memory {peak / 1024 / 1024:.1f} MiB; "
+        f"second run queued {again}"
+    )
+
+
+async def _deliver(args: argparse.Namespace) -> None:
+    import httpx
+    from sqlalchemy import func, select
+
+    from app import models, outbox, reminders
+    from app.db import SessionLocal
+    from tools import fake_telegram_api
+
+    def inactive_blocked() -> int:
+        db = SessionLocal()
+        try:
+            return db.execute(
+                select(func.count()).select_from(models.User).where(
+                    models.User.telegram_id.in_(fake_telegram_api.BLOCKED_CHATS),
+                    models.User.bot_chat_active.is_(False),
+                )
+            ).scalar()
+        finally:
+            db.close()
+
+    inactive_before = inactive_blocked()
+    sender = outbox.OutboxSender()
+    sender.start()
+    # Тот же отправитель, но Bot API — заглушка в этом процессе
+    await sender.client.aclose()
+    sender.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_telegram_api.app))
+    started = time.perf_counter()
+    await asyncio.sleep(args.deliver_seconds)
+    await sender.stop()
+    seconds = time.perf_counter() - started
+
+    stats = sender.stats()
+    fake = fake_telegram_api._stats
+    report = reminders.report_once()
+    deactivated = inactive_blocked() - inactive_before
+    print(
+        f"deliver: {stats['sent']} sent in {seconds:.1f}s ({stats['sent'] / seconds:.1f} msg/s), "
+        f"{stats['retried']} retried, {stats['failed']} failed; "
+        f"bot api saw {fake['requests']} requests, {fake['rate_limited']} rate limited (429), "
+        f"{fake['blocked']} blocked (403); {deactivated} blocked chats deactivated"
+    )
+    print(
+        f"report: {report['sent']}/{report['total']} sent, {report['failed']} failed, "
+        f"{report['queued']} queued"
+    )
+    for error in report["errors"]:
+        print(f"  {error['count']}x {error['error']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Вечерние напоминания на синтетической базе")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--challenges", type=int, default=500)
+    parser.add_argument("--per-user", type=int, default=2, help="Челленджей у каждого пользователя")
+    parser.add_argument("--done", type=float, default=0.4, help="Доля выполнивших сегодняшний день")
+    parser.add_argument("--inactive", type=float, default=0.1, help="Доля с неактивным чатом бота")
+    parser.add_argument("--blocked", type=float, default=0.02, help="Доля заблокировавших бота")
+    parser.add_argument("--deliver-seconds", type=float, default=10.0, help="0 — без доставки")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.per_user > args.challenges:
+        parser.error("--per-user must not exceed --challenges")
+
+    workdir = tempfile.mkdtemp(prefix="repday-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/repday.db"
+    os.environ["SHARED_STATE_URL"] = f"sqlite:///{workdir}/repday.shared.db"
+    os.environ["LOCK_DIR"] = workdir
+    os.environ["TELEGRAM_BOT_TOKEN"] = "bench"
+    os.environ["TELEGRAM_BOT_USERNAME"] = "repday_bench_bot"
+    os.environ["TELEGRAM_API_URL"] = "http://fake-telegram"
+    blocked = random.Random(args.seed).sample(range(1, args.users + 1), int(args.users * args.blocked))
+    os.environ["FAKE_TG_BLOCKED_CHATS"] = ",".join(str(10_000_000 + u) for u in blocked)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from app.db import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    started = time.perf_counter()
+    expected = _seed(db, args)
+    db.close()
+    print(f"seed: {args.users} users in {time.perf_counter() - started:.1f}s")
+
+    _enqueue(args, expected)
+    if args.deliver_seconds > 0:
+        asyncio.run(_deliver(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Стоимость сборки и сериализации ответов горячих эндпоинтов на большом челлендже.
+
+Поднимает временную SQLite-базу с одним челленджем на --participants участников и
+--days дней (год истории текущего пользователя, прогресс всех за сегодня, чат),
+и для каждого эндпоинта замеряет по отдельности:
+
+  handler  — хэндлер целиком: запросы к БД и сборка ответа словарями (текущий путь);
+  models   — сборка того же ответа Pydantic-объектами (как раньше: объект на строку);
+  fastapi  — штатный путь FastAPI: валидация по response_model + stdlib json;
+  orjson   — serialization.dumps, которым ответ отдаётся сейчас.
+
+Запуск (из каталога backend):
+
+    python -m tools.bench_serialization --participants 10000 --days 365
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+
+def _timed(fn, repeat: int) -> tuple[float, object]:
+    """Медиана времени вызова в миллисекундах и результат последнего вызова."""
+    result = fn()  # прогрев
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def _seed(db, participants: int, days: int, messages: int) -> tuple[int, int]:
+    from sqlalchemy import insert
+
+    from app import models
+
+    rnd = random.Random(1)
+    today = date.today()
+    start = today - timedelta(days=days - 1)
+    now = datetime.utcnow()
+
+    db.execute(
+        insert(models.User),
+        [
+            {"id": i, "telegram_id": 10_000_000 + i, "display_name": f"Участник {i}", "created_at": now, "updated_at": now}
+            for i in range(1, participants + 1)
+        ],
+    )
+    challenge = models.Challenge(
+        title="Bench",
+        goal_type="reps",
+        daily_goal=100,
+        unit="раз",
+        duration_days=days,
+        start_date=start,
+        end_date=today,
+        is_public=True,
+        invite_code="bench",
+        creator_id=1,
+    )
+    db.add(challenge)
+    db.flush()
+    db.execute(
+        insert(models.ChallengeParticipant),
+        [
+            {
+                "challenge_id": challenge.id,
+                "user_id": i,
+                "role": "owner" if i == 1 else "member",
+                "joined_at": now,
+                "total_value": rnd.randint(0, 100 * days),
+                "completed_days": rnd.randint(0, days),
+                "streak_current": rnd.randint(0, 30),
+                "streak_best": rnd.randint(0, 60),
+                "streak_last_date": today,
+            }
+            for i in range(1, participants + 1)
+        ],
+    )
+    # История текущего пользователя (user 1) за все дни и прогресс всех за сегодня
+    progress = [
+        {"challenge_id": challenge.id, "user_id": 1, "date": start + timedelta(days=d), "value": rnd.randint(0, 150)}
+        for d in range(days - 1)
+    ]
+    progress += [
+        {"challenge_id": challenge.id, "user_id": i, "date": today, "value": rnd.randint(0, 150)}
+        for i in range(1, participants + 1)
+    ]
+    for row in progress:
+        row["completed"] = row["value"] >= 100
+        row["updated_at"] = now
+    db.execute(insert(models.DailyProgress), progress)
+    db.execute(
+        insert(models.ChallengeMessage),
+        [
+            {"challenge_id": challenge.id, "user_id": rnd.randint(1, participants), "text": f"сообщение {i}", "created_at": now}
+            for i in range(messages)
+        ],
+    )
+    db.commit()
+    return challenge.id, 1
+
+
+def run(args: argparse.Namespace) -> list[dict]:
+    from fastapi.routing import APIRoute, serialize_response
+
+    from app import models, serialization
+    from app.db import SessionLocal
+    from app.main import app
+    from app.routers import challenges
+
+    db = SessionLocal()
+    challenge_id, user_id = _seed(db, args.participants, args.days, args.messages)
+    user = db.get(models.User, user_id)
+
+    routes = {
+        (route.path, tuple(sorted(route.methods))): route
+        for route in app.routes
+        if isinstance(route, APIRoute)
+    }
+
+    def route_field(path: str):
+        return routes[(path, ("GET",))].response_field
+
+    cases = [
+        (
+            "GET /challenges",
+            "/challenges",
+            lambda: challenges._list_challenge_shorts(db, user, include_all=False),
+        ),
+        (
+            "GET /challenges/{id}",
+            "/challenges/{challenge_id}",
+            lambda: challenges._get_challenge_impl(challenge_id, db, user),
+        ),
+        (
+            "GET /challenges/{id}/stats",
+            "/challenges/{challenge_id}/stats",
+            lambda: challenges._get_stats(challenge_id, True, db, user),
+        ),
+        (
+            "GET /challenges/{id}/leaderboard",
+            "/challenges/{challenge_id}/leaderboard",
+            lambda: challenges._get_leaderboard(
+                challenge_id, "total_value", challenges.LEADERBOARD_MAX_LIMIT, 0, None, 2, db, user
+            ),
+        ),
+        (
+            "GET /challenges/{id}/messages",
+            "/challenges/{challenge_id}/messages",
+            lambda: challenges._get_challenge_messages(
+                challenge_id, None, None, challenges.CHAT_MESSAGES_MAX_LIMIT, db, user
+            ),
+        ),
+    ]
+
+    loop = asyncio.new_event_loop()
+    results = []
+    for name, path, handler in cases:
+        field = route_field(path)
+        handler_ms, payload = _timed(handler, args.repeat)
+        # Ответ как его собирали бы Pydantic-объектами (валидация каждой строки)
+        plain = json.loads(serialization.dumps(payload))
+        models_ms, model = _timed(lambda: field.validate(plain, {}, loc=("response",))[0], args.repeat)
+
+        def fastapi_path():
+            content = loop.run_until_complete(
+                serialize_response(field=field, response_content=model, is_coroutine=True)
+            )
+            return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+        fastapi_ms, fastapi_body = _timed(fastapi_path, args.repeat)
+        orjson_ms, body = _timed(lambda: serialization.dumps(payload), args.repeat)
+        if json.loads(fastapi_body) != json.loads(body):
+            raise RuntimeError(f"{name}: orjson body differs from FastAPI body")
+        results.append(
+            {
+                "endpoint": name,
+                "bytes": len(body),
+                "handler_ms": handler_ms,
+                "models_ms": models_ms,
+                "fastapi_ms": fastapi_ms,
+                "orjson_ms": orjson_ms,
+                # Было: объекты + FastAPI; стало: словари (внутри handler) + orjson
+                "speedup": (models_ms + fastapi_ms) / orjson_ms if orjson_ms else 0.0,
+            }
+        )
+    loop.close()
+    db.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сборка и сериализация ответов на большом челлендже")
+    parser.add_argument("--participants", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", dest="json_path", default=None, help="Сохранить результаты в файл")
+    args = parser.parse_args()
+
+    # Своя временная база: приложение создаёт её при импорте app.main
+    workdir = tempfile.mkdtemp(prefix="repday-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/repday.db"
+    os.environ["TELEGRAM_BOT_TOKEN"] = ""
+    os.environ["LOCK_DIR"] = workdir
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    results = run(args)
+    print(
+        f"{'endpoint':34} {'bytes':>9} {'handler':>9} {'models':>9} {'fastapi':>9} {'orjson':>9} {'speedup':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['endpoint']:34} {r['bytes']:>9} {r['handler_ms']:>7.1f}ms {r['models_ms']:>7.1f}ms "
+            f"{r['fastapi_ms']:>7.1f}ms {r['orjson_ms']:>7.1f}ms {r['speedup']:>7.1f}x"
+        )
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
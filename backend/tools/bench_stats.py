@@ -0,0 +1,206 @@
+"""
+Статистика и запись прогресса на длинной истории: 1000 челленджей × 365 дней.
+
+Во временную SQLite-базу засеваются --users пользователей и --challenges челленджей
+по --participants участников, каждый с --days днями DailyProgress (часть дней
+пропущена). Итогов дней (daily_summaries) нет, так что статистика читает историю
+из daily_progress — это и замеряется. Затем последовательно, по одному запросу,
+через приложение в процессе (httpx.ASGITransport):
+
+  stats     — GET /challenges/{id}/stats?leaderboards=false случайного участника;
+  today     — POST /challenges/{id}/progress с delta за сегодня;
+  past      — POST /challenges/{id}/progress с set_value за случайный прошлый день
+              (правка из истории).
+
+Для каждой операции: p50/p99, среднее и SQL-запросов на запрос (счётчик на engine
+приложения). Кэш ответов выключен. Скрипт обращается к приложению только по HTTP,
+поэтому его можно запустить и на прошлой ревизии (git worktree) для замера «до».
+
+Запуск (из каталога backend):
+
+    python -m tools.bench_stats --challenges 1000 --days 365
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+from tools.bench_api import _percentile
+
+
+def _chunks(rows: list, size: int = 20000):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _seed(db, args: argparse.Namespace) -> dict[int, list[int]]:
+    """Засевает базу; возвращает для каждого челленджа его участников."""
+    from sqlalchemy import insert
+
+    from app import models
+
+    rnd = random.Random(args.seed)
+    today = date.today()
+    start = today - timedelta(days=args.days - 1)
+    now = datetime.utcnow()
+
+    db.execute(
+        insert(models.User),
+        [
+            {"id": u, "telegram_id": 10_000_000 + u, "display_name": f"Участник {u}", "created_at": now, "updated_at": now}
+            for u in range(1, args.users + 1)
+        ],
+    )
+    db.execute(
+        insert(models.Challenge),
+        [
+            {
+                "id": c,
+                "title": f"Челлендж {c}",
+                "goal_type": "reps",
+                "daily_goal": 100,
+                "unit": "раз",
+                "duration_days": args.days + 30,
+                "start_date": start,
+                "end_date": start + timedelta(days=args.days + 29),
+                "is_public": True,
+                "invite_code": f"bench{c}",
+                "creator_id": 1 + (c - 1) % args.users,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for c in range(1, args.challenges + 1)
+        ],
+    )
+
+    members: dict[int, list[int]] = {}
+    participants, progress = [], []
+    for c in range(1, args.challenges + 1):
+        owner = 1 + (c - 1) % args.users
+        others = [u for u in range(1, args.users + 1) if u != owner]
+        users = [owner] + rnd.sample(others, min(len(others), args.participants - 1))
+        members[c] = users
+        for u in users:
+            participants.append(
+                {"challenge_id": c, "user_id": u, "role": "owner" if u == owner else "member", "joined_at": now}
+            )
+            for d in range(args.days):
+                if rnd.random() < 0.8:
+                    value = rnd.randint(0, 150)
+                    progress.append(
+                        {
+                            "challenge_id": c,
+                            "user_id": u,
+                            "date": start + timedelta(days=d),
+                            "value": value,
+                            "completed": value >= 100,
+                            "updated_at": now,
+                        }
+                    )
+    for table, rows in ((models.ChallengeParticipant, participants), (models.DailyProgress, progress)):
+        for chunk in _chunks(rows):
+            db.execute(insert(table), chunk)
+    db.commit()
+    print(f"seed: {args.challenges} challenges × {args.participants} participants, {len(progress)} progress rows")
+    return members
+
+
+async def _measure(args: argparse.Namespace, members: dict[int, list[int]]) -> None:
+    import httpx
+    from jose import jwt
+    from sqlalchemy import event
+
+    from app.db import engine
+    from app.deps import ALGORITHM, SECRET_KEY
+    from app.main import app
+
+    queries = 0
+
+    def count(*_) -> None:
+        nonlocal queries
+        queries += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+
+    rnd = random.Random(args.seed + 1)
+    today = date.today()
+
+    def request(op: str) -> tuple[str, str, dict]:
+        challenge_id = rnd.randint(1, args.challenges)
+        user_id = rnd.choice(members[challenge_id])
+        headers = {"Authorization": "Bearer " + jwt.encode({"sub": str(user_id)}, SECRET_KEY, algorithm=ALGORITHM)}
+        if op == "stats":
+            return "GET", f"/challenges/{challenge_id}/stats?leaderboards=false", {"headers": headers}
+        if op == "today":
+            payload = {"date": str(today), "delta": rnd.randint(1, 20)}
+        else:
+            day = today - timedelta(days=rnd.randint(1, args.days - 1))
+            payload = {"date": str(day), "set_value": rnd.randint(0, 150)}
+        return "POST", f"/challenges/{challenge_id}/progress", {"headers": headers, "json": payload}
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        print(f"{'operation':10} {'requests':>8} {'p50':>9} {'p99':>9} {'mean':>9} {'queries':>8} {'errors':>6}")
+        for op in ("stats", "today", "past"):
+            for _ in range(args.warmup):
+                method, url, kwargs = request(op)
+                await client.request(method, url, **kwargs)
+            latencies: list[float] = []
+            errors = 0
+            queries = 0
+            for _ in range(args.requests):
+                method, url, kwargs = request(op)
+                started = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                latencies.append((time.perf_counter() - started) * 1000)
+                errors += response.status_code != 200
+            print(
+                f"{op:10} {args.requests:>8} {_percentile(latencies, 0.5):>7.2f}ms "
+                f"{_percentile(latencies, 0.99):>7.2f}ms {statistics.mean(latencies):>7.2f}ms "
+                f"{queries / args.requests:>8.1f} {errors:>6}"
+            )
+    event.remove(engine, "before_cursor_execute", count)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Статистика и прогресс на длинной истории")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--challenges", type=int, default=1000)
+    parser.add_argument("--participants", type=int, default=3)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--requests", type=int, default=300, help="На каждую операцию")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.participants < 1 or args.participants > args.users:
+        parser.error("--participants must be between 1 and --users")
+    if args.days < 2:
+        parser.error("--days must be at least 2")
+
+    workdir = tempfile.mkdtemp(prefix="repday-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/repday.db"
+    os.environ["SHARED_STATE_URL"] = f"sqlite:///{workdir}/repday.shared.db"
+    os.environ["LOCK_DIR"] = workdir
+    os.environ["TELEGRAM_BOT_TOKEN"] = ""
+    os.environ["RESPONSE_CACHE_MAX_BYTES"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from app.db import SessionLocal, init_db
+
+    init_db()
+    db = SessionLocal()
+    started = time.perf_counter()
+    members = _seed(db, args)
+    db.close()
+    print(f"seed: {time.perf_counter() - started:.1f}s")
+
+    asyncio.run(_measure(args, members))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Повтор всплеска обновлений бота через POST /telegram/webhook: подтверждение и применение.
+
+Во временную SQLite-базу засевается часть авторов (--known, из них половина с
+неактивным чатом), затем --updates обновлений от --users авторов отправляются в
+приложение в процессе (httpx.ASGITransport) с параллельностью --concurrency, как
+Telegram шлёт накопившееся после простоя; доля --duplicates — повторы уже
+отправленных update_id.
+
+Прогоны на одинаковых данных:
+
+  inline — воркер очереди не запущен: каждое обновление применяется в запросе
+           своей транзакцией (так webhook работал раньше);
+  queue  — bot_updates.queue: ответ сразу, применение пачками в фоне;
+  apply  — без HTTP: те же пачки по WEBHOOK_BATCH_SIZE сразу в применение — потолок
+           воркера, когда приём не узкое место.
+
+Для каждого: скорость и p50/p99 подтверждений, время до применения последнего
+обновления, счётчики очереди и проверка итога (все авторы есть и активны, каждый
+update_id записан один раз).
+
+Запуск (из каталога backend):
+
+    python -m tools.bench_webhook --updates 50000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from tools.bench_api import _percentile
+
+
+def _updates(args: argparse.Namespace) -> list[dict]:
+    rnd = random.Random(args.seed)
+    updates: list[dict] = []
+    next_id = 1_000_000
+    for _ in range(args.updates):
+        if updates and rnd.random() < args.duplicates:
+            updates.append(rnd.choice(updates))
+            continue
+        author = rnd.randint(1, args.users)
+        # Изредка автор меняет username
+        username = f"user{author}" if rnd.random() > 0.05 else f"user{author}_{next_id}"
+        updates.append(
+            {
+                "update_id": next_id,
+                "message": {
+                    "message_id": next_id,
+                    "date": int(time.time()),
+                    "chat": {"id": 10_000_000 + author, "type": "private"},
+                    "from": {"id": 10_000_000 + author, "first_name": f"Участник {author}", "username": username},
+                    "text": "/start",
+                },
+            }
+        )
+        next_id += 1
+    return updates
+
+
+def _reset(args: argparse.Namespace) -> None:
+    """Исходное состояние: известные авторы (половина — с неактивным чатом), без обработанных update_id."""
+    from datetime import datetime
+
+    from sqlalchemy import delete, insert
+
+    from app import models
+    from app.db import SessionLocal
+
+    now = datetime.utcnow()
+    db = SessionLocal()
+    db.execute(delete(models.ProcessedUpdate))
+    db.execute(delete(models.User))
+    known = int(args.users * args.known)
+    if known:
+        db.execute(
+            insert(models.User),
+            [
+                {
+                    "id": u,
+                    "telegram_id": 10_000_000 + u,
+                    "username": f"user{u}",
+                    "display_name": f"Участник {u}",
+                    "bot_chat_active": u % 2 == 0,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for u in range(1, known + 1)
+            ],
+        )
+    db.commit()
+    db.close()
+
+
+def _verify(updates: list[dict]) -> str:
+    from sqlalchemy import func, select
+
+    from app import models
+    from app.db import SessionLocal
+
+    authors = {u["message"]["from"]["id"] for u in updates}
+    unique_ids = {u["update_id"] for u in updates}
+    db = SessionLocal()
+    active = db.execute(
+        select(func.count()).select_from(models.User).where(
+            models.User.telegram_id.in_(authors), models.User.bot_chat_active.is_(True)
+        )
+    ).scalar()
+    processed = db.execute(select(func.count()).select_from(models.ProcessedUpdate)).scalar()
+    db.close()
+    ok = active == len(authors) and processed == len(unique_ids)
+    return (
+        f"{'ok' if ok else 'MISMATCH'}: {active}/{len(authors)} authors active, "
+        f"{processed}/{len(unique_ids)} update_ids recorded"
+    )
+
+
+def _apply_only(updates: list[dict]) -> None:
+    from collections import Counter
+
+    from app import bot_updates
+
+    totals: Counter = Counter()
+    started = time.perf_counter()
+    for i in range(0, len(updates), bot_updates.WEBHOOK_BATCH_SIZE):
+        totals.update(bot_updates._apply_batch(updates[i:i + bot_updates.WEBHOOK_BATCH_SIZE]))
+    seconds = time.perf_counter() - started
+    print(
+        f"{'apply':6} applied in {seconds:.2f}s ({len(updates) / seconds:.0f} updates/s), "
+        f"{totals['batches']} transactions, {totals['duplicates']} duplicates dropped, "
+        f"{totals['users_created']} users created, {totals['users_updated']} updated, {totals['failed']} failed"
+    )
+    print(f"{'':6} {_verify(updates)}")
+
+
+async def _replay(args: argparse.Namespace, updates: list[dict], mode: str) -> None:
+    import httpx
+
+    from app import bot_updates
+    from app.main import app
+
+    bot_updates.queue.counters.clear()
+    if mode == "queue":
+        bot_updates.queue.start()
+
+    latencies: list[float] = []
+    errors = 0
+    pending = iter(updates)
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        nonlocal errors
+        for update in pending:
+            started = time.perf_counter()
+            response = await client.post("/telegram/webhook", json=update)
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += response.status_code != 200
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+    acked = time.perf_counter() - started
+    # Остановка дописывает очередь: конец — когда применено последнее обновление
+    await bot_updates.queue.stop()
+    applied = time.perf_counter() - started
+
+    stats = bot_updates.queue.stats()
+    print(
+        f"{mode:6} acks: {len(updates) / acked:8.0f}/s p50={_percentile(latencies, 0.5):.1f}ms "
+        f"p99={_percentile(latencies, 0.99):.1f}ms errors={errors} | "
+        f"applied in {applied:.2f}s ({len(updates) / applied:.0f} updates/s, last {applied - acked:.2f}s after acks), "
+        f"{stats['batches']} transactions, {stats['duplicates']} duplicates dropped, "
+        f"{stats['users_created']} users created, {stats['users_updated']} updated, {stats['failed']} failed"
+    )
+    print(f"{'':6} {_verify(updates)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Всплеск обновлений webhook бота: inline против очереди")
+    parser.add_argument("--updates", type=int, default=50_000)
+    parser.add_argument("--users", type=int, default=5_000, help="Разных авторов")
+    parser.add_argument("--known", type=float, default=0.5, help="Доля авторов, уже известных базе")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Доля повторов update_id")
+    parser.add_argument("--concurrency", type=int, default=40, help="Как max_connections у setWebhook")
+    parser.add_argument("--mode", choices=("all", "inline", "queue", "apply"), default="all")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="repday-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/repday.db"
+    os.environ["SHARED_STATE_URL"] = f"sqlite:///{workdir}/repday.shared.db"
+    os.environ["LOCK_DIR"] = workdir
+    os.environ["TELEGRAM_BOT_TOKEN"] = ""
+    os.environ.setdefault("WEBHOOK_DRAIN_SECONDS", "600")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from app.db import init_db
+
+    # Ожидание места в очереди — не «медленный запрос» в смысле app.metrics
+    logging.getLogger("app.metrics.slow").setLevel(logging.ERROR)
+    init_db()
+    updates = _updates(args)
+    for mode in ("inline", "queue", "apply") if args.mode == "all" else (args.mode,):
+        _reset(args)
+        if mode == "apply":
+            _apply_only(updates)
+        else:
+            asyncio.run(_replay(args, updates, mode))
+
+
+if __name__ == "__main__":
+    main()
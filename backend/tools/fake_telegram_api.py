@@ -0,0 +1,102 @@
+"""
+Локальная заглушка Telegram Bot API для офлайн-проверки outbox и рассылок.
+
+Запуск (из каталога backend):
+
+    uvicorn tools.fake_telegram_api:app --port 8081
+
+и в .env бэкенда:
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081
+    TELEGRAM_BOT_TOKEN=любой_непустой
+
+Поведение настраивается переменными окружения:
+    FAKE_TG_FAIL_RATE      — доля ответов 500 (0..1), по умолчанию 0
+    FAKE_TG_RATE_LIMIT     — сколько запросов в секунду пропускать до ответа 429, по умолчанию 30
+    FAKE_TG_LATENCY_MS     — искусственная задержка ответа, по умолчанию 0
+    FAKE_TG_BLOCKED_CHATS  — chat_id через запятую, для которых отвечаем 403 (бот заблокирован)
+
+GET /_messages отдаёт принятые сообщения, DELETE /_messages очищает журнал.
+"""
+import asyncio
+import os
+import random
+import time
+from collections import deque
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+FAIL_RATE = float(os.getenv("FAKE_TG_FAIL_RATE", "0"))
+RATE_LIMIT = int(os.getenv("FAKE_TG_RATE_LIMIT", "30"))
+LATENCY_MS = float(os.getenv("FAKE_TG_LATENCY_MS", "0"))
+BLOCKED_CHATS = {
+    int(x) for x in os.getenv("FAKE_TG_BLOCKED_CHATS", "").split(",") if x.strip()
+}
+
+app = FastAPI(title="Fake Telegram Bot API")
+
+_messages: list[dict] = []
+_recent: deque[float] = deque()
+_stats = {"requests": 0, "ok": 0, "rate_limited": 0, "failed": 0, "blocked": 0}
+
+
+@app.post("/bot{token}/{method}")
+async def bot_method(token: str, method: str, request: Request) -> JSONResponse:
+    _stats["requests"] += 1
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000)
+
+    now = time.monotonic()
+    while _recent and now - _recent[0] > 1.0:
+        _recent.popleft()
+    if len(_recent) >= RATE_LIMIT:
+        _stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            content={
+                "ok": False,
+                "error_code": 429,
+                "description": "Too Many Requests: retry after 1",
+                "parameters": {"retry_after": 1},
+            },
+        )
+    _recent.append(now)
+
+    if random.random() < FAIL_RATE:
+        _stats["failed"] += 1
+        return JSONResponse(
+            status_code=500,
+            content={"ok": False, "error_code": 500, "description": "Internal Server Error"},
+        )
+
+    payload = await request.json()
+    if payload.get("chat_id") in BLOCKED_CHATS:
+        _stats["blocked"] += 1
+        return JSONResponse(
+            status_code=403,
+            content={"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"},
+        )
+
+    message = {
+        "message_id": len(_messages) + 1,
+        "method": method,
+        "date": int(time.time()),
+        "payload": payload,
+    }
+    _messages.append(message)
+    _stats["ok"] += 1
+    return JSONResponse(content={"ok": True, "result": message})
+
+
+@app.get("/_messages")
+async def list_messages() -> dict:
+    return {"stats": _stats, "messages": _messages}
+
+
+@app.delete("/_messages")
+async def clear_messages() -> dict:
+    _messages.clear()
+    for key in _stats:
+        _stats[key] = 0
+    return {"ok": True}
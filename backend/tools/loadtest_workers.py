@@ -0,0 +1,227 @@
+"""
+Нагрузочный прогон бэкенда с разным числом воркеров uvicorn: показывает, как растёт
+пропускная способность от 1 до N процессов.
+
+Запуск (из каталога backend):
+
+    python -m tools.loadtest_workers --workers 1 2 4 --concurrency 64 --duration 15
+
+Для каждого N поднимается отдельный uvicorn с WEB_CONCURRENCY=N на временной базе,
+через API создаются пользователи и челленджи, затем в течение --duration секунд
+идёт смешанная нагрузка как у фронтенда: деталь челленджа, список, тап прогресса.
+Итог — запросы в секунду, p50/p95/p99 и ускорение относительно первого N.
+Сервер работает в dev-режиме (без TELEGRAM_BOT_TOKEN): токены не проверяются по подписи.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date
+
+import httpx
+from jose import jwt
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Доли операций в смешанной нагрузке
+WORKLOAD = [
+    ("detail", 0.6),
+    ("list", 0.25),
+    ("progress", 0.15),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _token(user_id: int, secret: str) -> str:
+    return jwt.encode({"sub": str(user_id)}, secret, algorithm="HS256")
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+async def _wait_ready(client: httpx.AsyncClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/openapi.json")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def _seed(client: httpx.AsyncClient, users: int, challenges: int, secret: str) -> list[int]:
+    headers = {u: {"Authorization": f"Bearer {_token(u, secret)}"} for u in range(1, users + 1)}
+    challenge_ids = []
+    for i in range(challenges):
+        owner = 1 + i % users
+        r = await client.post(
+            "/challenges",
+            json={
+                "title": f"Load {i}",
+                "goal_type": "reps",
+                "daily_goal": 100,
+                "unit": "раз",
+                "duration_days": 30,
+                "start_date": str(date.today()),
+            },
+            headers=headers[owner],
+        )
+        r.raise_for_status()
+        challenge_ids.append(r.json()["id"])
+    for ch_id in challenge_ids:
+        for u in range(1, users + 1):
+            await client.post(f"/challenges/{ch_id}/join", headers=headers[u])
+    return challenge_ids
+
+
+async def _drive(
+    client: httpx.AsyncClient,
+    challenge_ids: list[int],
+    users: int,
+    concurrency: int,
+    duration: float,
+    secret: str,
+) -> dict:
+    tokens = {u: f"Bearer {_token(u, secret)}" for u in range(1, users + 1)}
+    names = [name for name, _ in WORKLOAD]
+    weights = [w for _, w in WORKLOAD]
+    latencies: list[float] = []
+    errors = 0
+    stop_at = time.monotonic() + duration
+
+    async def one_client(seed: int) -> None:
+        nonlocal errors
+        rnd = random.Random(seed)
+        while time.monotonic() < stop_at:
+            user = rnd.randint(1, users)
+            ch_id = rnd.choice(challenge_ids)
+            headers = {"Authorization": tokens[user]}
+            op = rnd.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                if op == "detail":
+                    r = await client.get(f"/challenges/{ch_id}", headers=headers)
+                elif op == "list":
+                    r = await client.get("/challenges", headers=headers)
+                else:
+                    r = await client.post(
+                        f"/challenges/{ch_id}/progress",
+                        json={"date": str(date.today()), "delta": 1},
+                        headers=headers,
+                    )
+                if r.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(one_client(i) for i in range(concurrency)))
+    elapsed = time.monotonic() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+async def _run_for_workers(workers: int, args: argparse.Namespace) -> dict:
+    port = _free_port()
+    secret = "loadtest-secret"
+    with tempfile.TemporaryDirectory(prefix="repday-load-") as workdir:
+        env = {
+            **os.environ,
+            "WEB_CONCURRENCY": str(workers),
+            "SECRET_KEY": secret,
+            "TELEGRAM_BOT_TOKEN": "",
+            "LOCK_DIR": workdir,
+        }
+        # Временная база в рабочем каталоге процесса, если DATABASE_URL не задан явно
+        env.setdefault("DATABASE_URL", f"sqlite:///{workdir}/repday.db")
+        env.setdefault("SHARED_STATE_URL", f"sqlite:///{workdir}/repday.shared.db")
+        proc = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--app-dir", BACKEND_DIR,
+                "--host", "127.0.0.1",
+                "--port", str(port),
+                "--workers", str(workers),
+                "--log-level", "warning",
+                "--no-access-log",
+            ],
+            cwd=workdir,
+            env=env,
+        )
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30.0
+            ) as client:
+                await _wait_ready(client)
+                challenge_ids = await _seed(client, args.users, args.challenges, secret)
+                # Прогрев: соединения, кэши аутентификации
+                await _drive(client, challenge_ids, args.users, args.concurrency, 2.0, secret)
+                result = await _drive(
+                    client, challenge_ids, args.users, args.concurrency, args.duration, secret
+                )
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    return {"workers": workers, **result}
+
+
+async def main_async(args: argparse.Namespace) -> list[dict]:
+    results = []
+    for workers in args.workers:
+        result = await _run_for_workers(workers, args)
+        results.append(result)
+        base = results[0]["rps"] or 1.0
+        print(
+            f"workers={workers:<3} rps={result['rps']:8.1f}  speedup={result['rps'] / base:4.2f}x  "
+            f"p50={result['p50_ms']:6.1f}ms p95={result['p95_ms']:6.1f}ms p99={result['p99_ms']:6.1f}ms  "
+            f"errors={result['errors']}",
+            flush=True,
+        )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="RPS бэкенда при 1..N воркерах uvicorn")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--challenges", type=int, default=10)
+    parser.add_argument("--json", dest="json_path", default=None, help="Сохранить результаты в файл")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
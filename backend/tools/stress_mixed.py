@@ -0,0 +1,231 @@
+"""
+Хвостовые задержки под смешанной нагрузкой: параллельные чтения и записи в одни челленджи.
+
+Как вечерний пик: все отмечают прогресс одновременно, пока остальные открывают
+детали, статистику и список. Во временную SQLite-базу засеваются --users
+пользователей в --challenges челленджах с --days днями истории, затем --requests
+запросов с параллельностью --concurrency идут в приложение в процессе
+(httpx.ASGITransport): доля --writes — записи (POST progress за сегодня и сообщение
+в чат), остальное — чтения (детали, статистика, список). Кэш ответов выключен, чтобы
+каждое чтение шло в базу.
+
+Итог — p50/p99 отдельно для чтений и записей, RPS и число ответов 5xx, из них
+«database is locked». Настройки SQLite и пула берутся из окружения (SQLITE_*,
+DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_MODE); --profile legacy подставляет прежние
+значения по умолчанию (rollback journal, synchronous=FULL, без busy_timeout, пул
+SQLAlchemy 5+10) — для сравнения «до/после» на одной нагрузке:
+
+    python -m tools.stress_mixed --profile legacy
+    python -m tools.stress_mixed
+
+Из каталога backend.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from tools.bench_api import _percentile
+
+# Как было до настройки профиля SQLite: значения SQLite и SQLAlchemy по умолчанию
+LEGACY_PROFILE = {
+    "SQLITE_JOURNAL_MODE": "DELETE",
+    "SQLITE_SYNCHRONOUS": "FULL",
+    "SQLITE_MMAP_SIZE": "0",
+    "SQLITE_CACHE_SIZE": "-2000",
+    "SQLITE_TEMP_STORE": "DEFAULT",
+    "SQLITE_BUSY_TIMEOUT_MS": "0",
+    "DB_POOL_SIZE": "5",
+    "DB_MAX_OVERFLOW": "10",
+}
+
+
+def _seed(db, args: argparse.Namespace) -> dict[int, int]:
+    """Засевает базу; возвращает челлендж каждого пользователя."""
+    from sqlalchemy import insert
+
+    from app import aggregates, models
+
+    rnd = random.Random(args.seed)
+    today = date.today()
+    start = today - timedelta(days=args.days - 1)
+    now = datetime.utcnow()
+
+    membership = {u: 1 + (u - 1) % args.challenges for u in range(1, args.users + 1)}
+    db.execute(
+        insert(models.User),
+        [
+            {"id": u, "telegram_id": 10_000_000 + u, "display_name": f"Участник {u}", "created_at": now, "updated_at": now}
+            for u in membership
+        ],
+    )
+    db.execute(
+        insert(models.Challenge),
+        [
+            {
+                "id": c,
+                "title": f"Челлендж {c}",
+                "goal_type": "reps",
+                "daily_goal": 100,
+                "unit": "раз",
+                "duration_days": args.days + 30,
+                "start_date": start,
+                "end_date": start + timedelta(days=args.days + 29),
+                "is_public": True,
+                "invite_code": f"stress{c}",
+                "creator_id": c,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for c in range(1, args.challenges + 1)
+        ],
+    )
+    db.execute(
+        insert(models.ChallengeParticipant),
+        [
+            {"challenge_id": c, "user_id": u, "role": "owner" if u == c else "member", "joined_at": now}
+            for u, c in membership.items()
+        ],
+    )
+    # История до вчерашнего дня: сегодняшний день пишет нагрузка
+    progress = []
+    for u, c in membership.items():
+        for d in range(args.days - 1):
+            if rnd.random() < 0.8:
+                value = rnd.randint(0, 150)
+                progress.append(
+                    {
+                        "challenge_id": c,
+                        "user_id": u,
+                        "date": start + timedelta(days=d),
+                        "value": value,
+                        "completed": value >= 100,
+                        "updated_at": now,
+                    }
+                )
+    if progress:
+        db.execute(insert(models.DailyProgress), progress)
+    aggregates.recompute_all(db)
+    db.commit()
+    return membership
+
+
+async def run(args: argparse.Namespace, membership: dict[int, int]) -> None:
+    import httpx
+    from jose import jwt
+
+    from app.db import dispose_async_engine
+    from app.deps import ALGORITHM, SECRET_KEY
+    from app.main import app
+
+    headers = {
+        u: {"Authorization": "Bearer " + jwt.encode({"sub": str(u)}, SECRET_KEY, algorithm=ALGORITHM)}
+        for u in membership
+    }
+    rnd = random.Random(args.seed + 1)
+    today = str(date.today())
+    ops = []
+    for _ in range(args.requests):
+        user = rnd.randint(1, args.users)
+        challenge_id = membership[user]
+        if rnd.random() < args.writes:
+            if rnd.random() < 0.8:
+                ops.append(("write", "POST", f"/challenges/{challenge_id}/progress", user, {"date": today, "delta": rnd.randint(1, 10)}))
+            else:
+                ops.append(("write", "POST", f"/challenges/{challenge_id}/messages", user, {"text": "вечерний пик"}))
+        else:
+            path = rnd.choice((f"/challenges/{challenge_id}", f"/challenges/{challenge_id}/stats", "/challenges"))
+            ops.append(("read", "GET", path, user, None))
+
+    latencies: dict[str, list[float]] = {"read": [], "write": []}
+    statuses: Counter = Counter()
+    errors: Counter = Counter()
+    pending = iter(ops)
+
+    async def worker(client: httpx.AsyncClient) -> None:
+        for kind, method, path, user, payload in pending:
+            started = time.perf_counter()
+            response = await client.request(method, path, json=payload, headers=headers[user])
+            latencies[kind].append((time.perf_counter() - started) * 1000)
+            statuses[response.status_code] += 1
+            if response.status_code >= 500:
+                try:
+                    error = response.json().get("error") or response.text
+                except ValueError:
+                    error = response.text
+                errors["database is locked" if "database is locked" in error else error[:120]] += 1
+
+    # Ошибка приложения — это ответ 500 в статистике, а не исключение в клиенте
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://stress", timeout=120) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    # lifespan приложения здесь не запускается — закрываем пул сами
+    await dispose_async_engine()
+
+    failed = sum(count for status, count in statuses.items() if status >= 500)
+    print(
+        f"{args.requests} requests in {elapsed:.2f}s ({args.requests / elapsed:.0f} rps), "
+        f"statuses: {dict(sorted(statuses.items()))}"
+    )
+    for kind, values in latencies.items():
+        print(
+            f"{kind:5} {len(values):>6} p50={_percentile(values, 0.5):.1f}ms "
+            f"p99={_percentile(values, 0.99):.1f}ms max={max(values, default=0):.1f}ms"
+        )
+    print(f"5xx: {failed}, database is locked: {errors['database is locked']}")
+    for error, count in errors.most_common():
+        if error != "database is locked":
+            print(f"  {count} x {error}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Параллельные чтения и записи: p50/p99 и блокировки SQLite")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--challenges", type=int, default=20)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--writes", type=float, default=0.3, help="Доля записей")
+    parser.add_argument("--profile", choices=("current", "legacy"), default="current")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if args.challenges > args.users:
+        parser.error("--challenges must not exceed --users")
+
+    # Своя временная база: приложение создаёт её при импорте app.main
+    workdir = tempfile.mkdtemp(prefix="repday-stress-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/repday.db"
+    os.environ["SHARED_STATE_URL"] = f"sqlite:///{workdir}/repday.shared.db"
+    os.environ["LOCK_DIR"] = workdir
+    os.environ["TELEGRAM_BOT_TOKEN"] = ""
+    os.environ["RESPONSE_CACHE_MAX_BYTES"] = "0"
+    if args.profile == "legacy":
+        os.environ.update(LEGACY_PROFILE)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from app.db import SQLITE_PRAGMAS, SessionLocal, engine, init_db
+
+    # Под такой нагрузкой медленны почти все запросы, а 5xx считаются в итоге — не засоряем вывод
+    logging.getLogger("app").setLevel(logging.CRITICAL)
+    init_db()
+    db = SessionLocal()
+    membership = _seed(db, args)
+    db.close()
+    print(
+        f"profile {args.profile}: {SQLITE_PRAGMAS}, pool_size={engine.pool.size()}, "
+        f"max_overflow={engine.pool._max_overflow}, DB_MODE={os.getenv('DB_MODE', 'threadpool')}"
+    )
+
+    asyncio.run(run(args, membership))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Стресс-проверка атомарности POST /challenges/{id}/progress.
+
+Несколько пользователей одновременно шлют сотни дельт за один и тот же (новый) день —
+как двойные тапы и два устройства сразу. После прогона итоговое значение каждого
+пользователя обязано совпасть с суммой его подтверждённых (200) дельт — ни одна не
+потеряна и не применена дважды, — а 5xx (например, конфликт uix_progress_day на
+первой записи дня) — отсутствовать.
+
+Запуск (из каталога backend), приложение поднимается в процессе на временной базе:
+
+    python -m tools.stress_progress --requests 500 --users 5 --concurrency 50
+
+При очень большом --concurrency на SQLite часть запросов может не дождаться
+блокировки записи (SQLITE_BUSY_TIMEOUT_MS) — это 5xx, но не потерянные апдейты.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date
+
+
+async def run(args: argparse.Namespace) -> bool:
+    import httpx
+    from jose import jwt
+
+    from app.db import dispose_async_engine
+    from app.deps import ALGORITHM, SECRET_KEY
+    from app.main import app
+
+    headers = {
+        u: {"Authorization": f"Bearer {jwt.encode({'sub': str(u)}, SECRET_KEY, algorithm=ALGORITHM)}"}
+        for u in range(1, args.users + 1)
+    }
+    # Ошибка приложения — это ответ 500 в статистике, а не исключение в клиенте
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://stress", timeout=60) as client:
+        r = await client.post(
+            "/challenges",
+            json={
+                "title": "Stress",
+                "goal_type": "reps",
+                "daily_goal": args.requests,
+                "unit": "раз",
+                "duration_days": 30,
+                "start_date": str(date.today()),
+            },
+            headers=headers[1],
+        )
+        r.raise_for_status()
+        challenge_id = r.json()["id"]
+        for u in range(2, args.users + 1):
+            (await client.post(f"/challenges/{challenge_id}/join", headers=headers[u])).raise_for_status()
+
+        rnd = random.Random(args.seed)
+        day = str(date.today())
+        # Только положительные дельты: сумма не зависит от порядка (без обрезки нулём)
+        ops = [(rnd.randint(1, args.users), rnd.randint(1, 5)) for _ in range(args.requests)]
+        expected: Counter = Counter()
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        statuses: Counter = Counter()
+        errors: Counter = Counter()
+
+        async def tap(user: int, delta: int) -> None:
+            async with semaphore:
+                resp = await client.post(
+                    f"/challenges/{challenge_id}/progress",
+                    json={"date": day, "delta": delta},
+                    headers=headers[user],
+                )
+                statuses[resp.status_code] += 1
+                if resp.status_code == 200:
+                    expected[user] += delta
+                if resp.status_code >= 500:
+                    errors[resp.json().get("error", resp.text)[:200]] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(tap(user, delta) for user, delta in ops))
+        elapsed = time.perf_counter() - started
+
+        detail = (await client.get(f"/challenges/{challenge_id}", headers=headers[1])).json()
+        actual = {p["id"]: p["today_value"] for p in detail["participants"]}
+    # lifespan приложения здесь не запускается — закрываем пул сами
+    await dispose_async_engine()
+
+    ok = True
+    print(f"{args.requests} requests in {elapsed:.2f}s ({args.requests / elapsed:.0f} rps), statuses: {dict(statuses)}")
+    for error, count in errors.most_common():
+        print(f"  {count} x {error}")
+    for user in sorted(expected):
+        mark = "OK" if actual.get(user) == expected[user] else "MISMATCH"
+        ok &= mark == "OK"
+        print(f"user {user}: expected {expected[user]}, got {actual.get(user)} {mark}")
+    if set(statuses) != {200}:
+        ok = False
+    print("PASS" if ok else "FAIL")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Параллельные дельты прогресса: итог должен сойтись")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Своя временная база: приложение создаёт её при импорте app.main
+    workdir = tempfile.mkdtemp(prefix="repday-stress-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/repday.db")
+    os.environ["TELEGRAM_BOT_TOKEN"] = ""
+    os.environ["LOCK_DIR"] = workdir
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    sys.exit(0 if asyncio.run(run(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,7 @@ export const ChallengeHistoryPage: React.FC<Props> = ({
     const load = async () => {
       setLoading(true);
       try {
-        const data = await api.getStats(challengeId);
+        const data = await api.getStats(challengeId, { leaderboards: false });
         setStats(data);
       } catch (e) {
         console.error("Load stats error", e);
@@ -54,7 +54,7 @@ export const ChallengeHistoryPage: React.FC<Props> = ({
         set_value: value,
       });
       // Перезагружаем статистику
-      const fresh = await api.getStats(challengeId);
+      const fresh = await api.getStats(challengeId, { leaderboards: false });
       setStats(fresh);
       setEditingDate(null);
       setEditingValue("");
@@ -92,6 +92,33 @@ export const ChallengePage: React.FC<Props> = ({
     void load();
   }, [challengeId, currentUserId]);
 
+  // Живые обновления: вместо постоянных перезапросов ждём событий челленджа от сервера
+  const chatOpenRef = useRef(chatOpen);
+  chatOpenRef.current = chatOpen;
+  useEffect(() => {
+    const unsubscribe = api.subscribeChallengeEvents(challengeId, (type, data) => {
+      if (type === "challenge_deleted") {
+        onChallengeDeleted?.(challengeId);
+        return;
+      }
+      if (type === "message") {
+        const msg = data as unknown as ChallengeMessage;
+        if (chatOpenRef.current) {
+          setMessages((prev) => (prev.some((m) => m.id === msg.id) ? prev : [msg, ...prev]));
+        }
+        return;
+      }
+      api
+        .getChallengeDetail(challengeId)
+        .then((fresh) => {
+          setChallenge(fresh);
+          updateNudgeTimestamps(fresh);
+        })
+        .catch(() => undefined);
+    });
+    return unsubscribe;
+  }, [challengeId, currentUserId]);
+
   const me = useMemo(
     () => challenge?.participants.find((p) => p.id === currentUserId),
     [challenge, currentUserId]
@@ -110,18 +137,37 @@ export const ChallengePage: React.FC<Props> = ({
       .finally(() => setMessagesLoading(false));
   }, [chatOpen, challenge?.id]);
 
+  // Последняя отправленная пачка тапов: перезапрашиваем данные только после неё
+  const lastProgressFlush = useRef<Promise<unknown> | null>(null);
+
   const handleDelta = async (delta: number) => {
     if (!challenge) return;
-    setUpdating(true);
+    const today = new Date().toISOString().slice(0, 10);
+    // Сразу показываем новое значение, запрос уйдёт пачкой
+    setChallenge((prev) =>
+      prev
+        ? {
+            ...prev,
+            participants: prev.participants.map((p) =>
+              p.id === currentUserId
+                ? { ...p, today_value: Math.max(0, p.today_value + delta) }
+                : p
+            ),
+          }
+        : prev
+    );
+    const flush = api.queueProgressDelta(challenge.id, today, delta);
+    lastProgressFlush.current = flush;
     try {
-      const today = new Date().toISOString().slice(0, 10);
-      await api.updateProgress(challenge.id, { date: today, delta });
-      const fresh = await api.getChallengeDetail(challenge.id);
-      setChallenge(fresh);
-      updateNudgeTimestamps(fresh); // Обновляем кулдаун пинков
-      onProgressUpdated?.(); // Обновляем список челленджей
+      await flush;
     } finally {
-      setUpdating(false);
+      if (lastProgressFlush.current === flush) {
+        lastProgressFlush.current = null;
+        const fresh = await api.getChallengeDetail(challenge.id);
+        setChallenge(fresh);
+        updateNudgeTimestamps(fresh); // Обновляем кулдаун пинков
+        onProgressUpdated?.(); // Обновляем список челленджей
+      }
     }
   };
 
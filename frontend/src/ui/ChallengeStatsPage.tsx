@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from "react";
-import type { ChallengeStats } from "../utils/types";
+import type { ChallengeStats, Leaderboard, LeaderboardMetric } from "../utils/types";
 import { api } from "../utils/api";
 
 interface Props {
@@ -7,8 +7,93 @@ interface Props {
   onBack: () => void;
 }
 
+const LEADERBOARD_PAGE_SIZE = 50;
+
+interface LeaderboardSectionProps {
+  challengeId: number;
+  title: string;
+  metric: LeaderboardMetric;
+  initial: Leaderboard;
+  formatValue: (value: number) => string;
+}
+
+const LeaderboardSection: React.FC<LeaderboardSectionProps> = ({
+  challengeId,
+  title,
+  metric,
+  initial,
+  formatValue,
+}) => {
+  const [board, setBoard] = useState<Leaderboard>(initial);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  useEffect(() => {
+    setBoard(initial);
+  }, [initial]);
+
+  const loadMore = async () => {
+    if (!board.next_cursor) return;
+    setLoadingMore(true);
+    try {
+      const next = await api.getLeaderboard(challengeId, metric, {
+        limit: LEADERBOARD_PAGE_SIZE,
+        cursor: board.next_cursor,
+        around: 0,
+      });
+      setBoard((prev) => ({ ...prev, items: [...prev.items, ...next.items], next_cursor: next.next_cursor }));
+    } catch (e) {
+      console.error("Leaderboard load error:", e);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const me = board.me;
+  const meShown = !me || board.items.some((i) => i.user_id === me.user_id);
+
+  return (
+    <section className="section">
+      <div className="section-title">{title}</div>
+      <div className="list">
+        {board.items.map((i) => (
+          <div key={i.user_id} className="row">
+            <div className="row-text">
+              <div className="row-title">
+                {i.rank}. {i.display_name}
+              </div>
+              <div className="row-sub">{formatValue(i.value)}</div>
+            </div>
+          </div>
+        ))}
+      </div>
+      {board.next_cursor && (
+        <button className="topbar-button" onClick={() => void loadMore()} disabled={loadingMore}>
+          {loadingMore ? "Загрузка…" : "Показать ещё"}
+        </button>
+      )}
+      {!meShown && (
+        <div className="list">
+          {board.around_me.map((i) => (
+            <div key={i.user_id} className="row">
+              <div className="row-text">
+                <div className="row-title">
+                  {i.rank}. {i.display_name}
+                  {i.user_id === me?.user_id ? " (вы)" : ""}
+                </div>
+                <div className="row-sub">{formatValue(i.value)}</div>
+              </div>
+            </div>
+          ))}
+        </div>
+      )}
+    </section>
+  );
+};
+
 export const ChallengeStatsPage: React.FC<Props> = ({ challengeId, onBack }) => {
   const [stats, setStats] = useState<ChallengeStats | null>(null);
+  const [byValue, setByValue] = useState<Leaderboard | null>(null);
+  const [byDays, setByDays] = useState<Leaderboard | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
 
@@ -16,8 +101,15 @@ export const ChallengeStatsPage: React.FC<Props> = ({ challengeId, onBack }) =>
     const load = async () => {
       setLoading(true);
       try {
-        const data = await api.getStats(challengeId);
+        // Полные лидерборды в stats не нужны: верх и «моё место» — отдельным эндпоинтом
+        const [data, value, days] = await Promise.all([
+          api.getStats(challengeId, { leaderboards: false }),
+          api.getLeaderboard(challengeId, "total_value", { limit: LEADERBOARD_PAGE_SIZE }),
+          api.getLeaderboard(challengeId, "completed_days", { limit: LEADERBOARD_PAGE_SIZE }),
+        ]);
         setStats(data);
+        setByValue(value);
+        setByDays(days);
         setError(null);
       } catch (e) {
         console.error("Stats load error:", e);
@@ -101,33 +193,25 @@ export const ChallengeStatsPage: React.FC<Props> = ({ challengeId, onBack }) =>
           </p>
         </section>
 
-        <section className="section">
-          <div className="section-title">Лидерборд по объёму</div>
-          <div className="list">
-            {stats.leaderboard_by_value.map((i) => (
-              <div key={i.user_id} className="row">
-                <div className="row-text">
-                  <div className="row-title">{i.display_name}</div>
-                  <div className="row-sub">Всего: {i.total_value}</div>
-                </div>
-              </div>
-            ))}
-          </div>
-        </section>
+        {byValue && (
+          <LeaderboardSection
+            challengeId={challengeId}
+            title="Лидерборд по объёму"
+            metric="total_value"
+            initial={byValue}
+            formatValue={(v) => `Всего: ${v}`}
+          />
+        )}
 
-        <section className="section">
-          <div className="section-title">Лидерборд по выполненным дням</div>
-          <div className="list">
-            {stats.leaderboard_by_days.map((i) => (
-              <div key={i.user_id} className="row">
-                <div className="row-text">
-                  <div className="row-title">{i.display_name}</div>
-                  <div className="row-sub">Дней с выполнением: {i.completed_days}</div>
-                </div>
-              </div>
-            ))}
-          </div>
-        </section>
+        {byDays && (
+          <LeaderboardSection
+            challengeId={challengeId}
+            title="Лидерборд по выполненным дням"
+            metric="completed_days"
+            initial={byDays}
+            formatValue={(v) => `Дней с выполнением: ${v}`}
+          />
+        )}
       </main>
     </div>
   );
@@ -4,13 +4,51 @@ import type {
   ChallengeMessage,
   ChallengeShort,
   ChallengeStats,
+  Leaderboard,
+  LeaderboardMetric,
+  ProgressBatchOperation,
+  ProgressBatchResult,
   UserMe,
 } from "./types";
 
 const BASE_URL = import.meta.env.PROD ? "/api" : "http://localhost:8000";
 
+const CHALLENGE_EVENT_TYPES = [
+  "progress",
+  "participant_joined",
+  "participant_removed",
+  "nudge",
+  "message",
+  "challenge_deleted",
+] as const;
+export type ChallengeEventType = (typeof CHALLENGE_EVENT_TYPES)[number];
+
 let authState: AuthState | null = null;
 
+// Тапы +/− не шлём по одному: копим их и отправляем одним POST /challenges/progress:batch
+// (одна транзакция на сервере), когда пользователь на миг перестал нажимать
+const PROGRESS_FLUSH_DELAY_MS = 600;
+let pendingProgress: ProgressBatchOperation[] = [];
+let progressFlushTimer: ReturnType<typeof setTimeout> | null = null;
+let progressWaiters: { resolve: (r: ProgressBatchResult) => void; reject: (e: unknown) => void }[] = [];
+
+async function flushProgress(): Promise<void> {
+  progressFlushTimer = null;
+  const operations = pendingProgress;
+  const waiters = progressWaiters;
+  pendingProgress = [];
+  progressWaiters = [];
+  try {
+    const result = await request<ProgressBatchResult>("/challenges/progress:batch", {
+      method: "POST",
+      body: JSON.stringify({ operations }),
+    });
+    waiters.forEach((w) => w.resolve(result));
+  } catch (error) {
+    waiters.forEach((w) => w.reject(error));
+  }
+}
+
 function authHeader() {
   if (!authState) {
     console.warn("API: No auth state, request will fail");
@@ -114,8 +152,28 @@ export const api = {
       body: JSON.stringify(payload),
     });
   },
-  async getStats(id: number): Promise<ChallengeStats> {
-    return request<ChallengeStats>(`/challenges/${id}/stats`);
+  /** Дельта прогресса с накоплением: промис резолвится после отправки всей пачки */
+  queueProgressDelta(id: number, date: string, delta: number): Promise<ProgressBatchResult> {
+    // Операции идут по порядку: сервер применяет их последовательно с обрезкой снизу нулём
+    pendingProgress.push({ challenge_id: id, date, delta });
+    if (progressFlushTimer) clearTimeout(progressFlushTimer);
+    progressFlushTimer = setTimeout(() => void flushProgress(), PROGRESS_FLUSH_DELAY_MS);
+    return new Promise((resolve, reject) => progressWaiters.push({ resolve, reject }));
+  },
+  async getStats(id: number, options: { leaderboards?: boolean } = {}): Promise<ChallengeStats> {
+    const query = options.leaderboards === false ? "?leaderboards=false" : "";
+    return request<ChallengeStats>(`/challenges/${id}/stats${query}`);
+  },
+  async getLeaderboard(
+    id: number,
+    metric: LeaderboardMetric,
+    page: { limit?: number; cursor?: string; around?: number } = {}
+  ): Promise<Leaderboard> {
+    const params = new URLSearchParams({ metric });
+    for (const [key, value] of Object.entries(page)) {
+      if (value !== undefined) params.set(key, String(value));
+    }
+    return request<Leaderboard>(`/challenges/${id}/leaderboard?${params.toString()}`);
   },
   async sendNudge(id: number, to_user_id: number): Promise<{ ok: boolean; nudged_at?: string; next_nudge_available_at?: string }> {
     const params = new URLSearchParams({ to_user_id: String(to_user_id) });
@@ -133,8 +191,19 @@ export const api = {
       method: "DELETE",
     });
   },
-  async getChallengeMessages(challengeId: number): Promise<ChallengeMessage[]> {
-    return request<ChallengeMessage[]>(`/challenges/${challengeId}/messages`);
+  /** before_id — страница старше сообщения, after_id — только новые; порядок всегда от новых к старым */
+  async getChallengeMessages(
+    challengeId: number,
+    cursor: { before_id?: number; after_id?: number; limit?: number } = {}
+  ): Promise<ChallengeMessage[]> {
+    const params = new URLSearchParams();
+    for (const [key, value] of Object.entries(cursor)) {
+      if (value !== undefined) params.set(key, String(value));
+    }
+    const query = params.toString();
+    return request<ChallengeMessage[]>(
+      `/challenges/${challengeId}/messages${query ? `?${query}` : ""}`
+    );
   },
   async postChallengeMessage(challengeId: number, text: string): Promise<ChallengeMessage> {
     return request<ChallengeMessage>(`/challenges/${challengeId}/messages`, {
@@ -142,5 +211,59 @@ export const api = {
       body: JSON.stringify({ text }),
     });
   },
+  /** Подписка на события челленджа (SSE). Возвращает функцию отписки. */
+  subscribeChallengeEvents(
+    challengeId: number,
+    onEvent: (type: ChallengeEventType, data: Record<string, unknown>) => void
+  ): () => void {
+    let source: EventSource | null = null;
+    let retryTimer: ReturnType<typeof setTimeout> | null = null;
+    let closed = false;
+
+    // EventSource не шлёт заголовки, поэтому в URL идёт не JWT, а короткоживущий билет
+    // на этот челлендж. С ним EventSource переподключается сам; когда билет истёк и сервер
+    // отказал, соединение закрывается — берём новый билет и подключаемся заново
+    const connect = async () => {
+      retryTimer = null;
+      let ticket: string;
+      try {
+        ({ ticket } = await request<{ ticket: string; expires_in: number }>(
+          `/challenges/${challengeId}/events/ticket`,
+          { method: "POST" }
+        ));
+      } catch (error) {
+        // 4xx — доступа к челленджу больше нет (удалён, участника исключили)
+        if (!closed && !String(error).startsWith("Error: HTTP 4")) {
+          retryTimer = setTimeout(connect, 3000);
+        }
+        return;
+      }
+      if (closed) return;
+      const params = new URLSearchParams({ ticket });
+      const current = new EventSource(`${BASE_URL}/challenges/${challengeId}/events?${params.toString()}`);
+      source = current;
+      for (const type of CHALLENGE_EVENT_TYPES) {
+        current.addEventListener(type, (e) => {
+          try {
+            onEvent(type, JSON.parse((e as MessageEvent).data));
+          } catch (error) {
+            console.error("SSE parse error:", error);
+          }
+        });
+      }
+      current.onerror = () => {
+        if (closed || current.readyState !== EventSource.CLOSED) return;
+        source = null;
+        retryTimer = setTimeout(connect, 3000);
+      };
+    };
+
+    void connect();
+    return () => {
+      closed = true;
+      if (retryTimer) clearTimeout(retryTimer);
+      source?.close();
+    };
+  },
 };
 
@@ -55,6 +55,31 @@ export interface ChallengeDetail {
   is_owner: boolean;
   /** false — суперадмин смотрит челлендж без участия (только описание, команда, статистика) */
   is_participant?: boolean;
+  /** Версия данных челленджа; передаётся в ?since= для получения только изменившихся участников */
+  version?: number;
+  /** День, за который посчитаны today_* и серии; передаётся в ?since_day= вместе с since */
+  day?: string;
+  /** true — в participants только участники, изменившиеся после since */
+  is_delta?: boolean;
+}
+
+export interface ProgressBatchOperation {
+  challenge_id: number;
+  date: string;
+  delta?: number;
+  set_value?: number;
+  completed?: boolean;
+}
+
+export interface ProgressBatchResult {
+  results: {
+    index: number;
+    challenge_id: number;
+    ok: boolean;
+    value?: number | null;
+    completed?: boolean | null;
+    error?: string | null;
+  }[];
 }
 
 export interface ChallengeStats {
@@ -72,6 +97,24 @@ export interface LeaderboardItem {
   completed_days: number;
 }
 
+export type LeaderboardMetric = "total_value" | "completed_days" | "streak_best";
+
+export interface LeaderboardEntry {
+  rank: number;
+  user_id: number;
+  display_name: string;
+  value: number;
+}
+
+export interface Leaderboard {
+  metric: LeaderboardMetric;
+  total: number;
+  items: LeaderboardEntry[];
+  next_cursor?: string | null;
+  me?: LeaderboardEntry | null;
+  around_me: LeaderboardEntry[];
+}
+
 export interface ChallengeMessage {
   id: number;
   challenge_id: number;